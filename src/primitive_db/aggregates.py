@@ -0,0 +1,246 @@
+"""Агрегатные запросы: select count(*)|sum|min|max|avg(col) ... [group by col].
+
+Результат считается за один потоковый проход по записям: для каждой
+группы хранятся только счётчики агрегатов (сумма, число значений, текущие
+минимум и максимум), сами записи в памяти не собираются.
+
+Без условия where часть ответов берётся без просмотра таблицы:
+- count(*) — число живых записей;
+- min(ID) и max(ID) — первая и последняя живые записи (ID растут вместе
+  с позицией записи);
+- min и max по столбцу с упорядоченным индексом — края индекса;
+- count(*) с group by по столбцу с хеш-индексом — размеры списков индекса;
+- count, sum, min, max, avg по столбцу int без пропусков — встроенными
+  функциями по колоночному массиву (см. columns.py) или NumPy.
+"""
+
+import re
+from array import array
+
+from src.primitive_db.columns import get_column, load_numpy
+from src.primitive_db.indexes import get_index
+from src.primitive_db.rows import ID_POS
+from src.primitive_db.tombstones import dead_count, is_live, live_count
+
+AGGREGATE_FUNCTIONS = ("count", "sum", "min", "max", "avg")
+
+_AGGREGATE_RE = re.compile(
+    rf"^\s*({'|'.join(AGGREGATE_FUNCTIONS)})\s*\(\s*(\*|[^\s()]+)\s*\)\s*$",
+    re.IGNORECASE,
+)
+
+_MISSING = object()
+
+
+def parse_aggregates(text, schema, group_by=None):
+    """Разбирает список агрегатов "count(*), sum(age), ..." в список пар
+    (функция, столбец); столбец count(*) — "*".
+
+    В списке может стоять и сам столбец группировки — в результате он
+    всё равно выводится первым.
+    """
+    aggregates = []
+    for part in text.split(","):
+        if group_by is not None and part.strip() == group_by:
+            continue
+        m = _AGGREGATE_RE.match(part)
+        if m is None:
+            raise ValueError(f"Некорректное значение: {part.strip()}.")
+        func, column = m.group(1).lower(), m.group(2)
+        if column == "*":
+            if func != "count":
+                raise ValueError(f"Некорректное значение: {func}(*).")
+        elif column not in schema:
+            raise ValueError(f"Некорректное значение: {column}.")
+        elif func in ("sum", "avg") and schema[column] != "int":
+            raise ValueError(
+                f"Некорректное значение: {func}({column}). Только для столбцов int."
+            )
+        aggregates.append((func, column))
+    if not aggregates:
+        raise ValueError("Некорректное значение: select.")
+    return aggregates
+
+
+def aggregate_label(aggregate):
+    func, column = aggregate
+    return f"{func}({column})"
+
+
+class _Count:
+
+    def __init__(self, pos):
+        self.pos = pos
+        self.count = 0
+
+    def add(self, row):
+        if self.pos is None or row[self.pos] is not None:
+            self.count += 1
+
+    def result(self):
+        return self.count
+
+
+class _Sum:
+
+    def __init__(self, pos):
+        self.pos = pos
+        self.total = 0
+        self.count = 0
+
+    def add(self, row):
+        value = row[self.pos]
+        if value is not None:
+            self.total += value
+            self.count += 1
+
+    def result(self):
+        return self.total if self.count else None
+
+
+class _Avg(_Sum):
+
+    def result(self):
+        return self.total / self.count if self.count else None
+
+
+class _Min:
+
+    def __init__(self, pos):
+        self.pos = pos
+        self.value = None
+
+    def add(self, row):
+        value = row[self.pos]
+        if value is not None and (self.value is None or value < self.value):
+            self.value = value
+
+    def result(self):
+        return self.value
+
+
+class _Max(_Min):
+
+    def add(self, row):
+        value = row[self.pos]
+        if value is not None and (self.value is None or value > self.value):
+            self.value = value
+
+
+_ACCUMULATORS = {"count": _Count, "sum": _Sum, "avg": _Avg, "min": _Min, "max": _Max}
+
+
+def _group_order(key):
+    # пустые значения группируются вместе и выводятся первыми
+    return (key is not None, key)
+
+
+def _result_rows(groups, group_by):
+    """Записи результата — кортежи (значение группы, агрегаты...) по
+    порядку групп; без group by — только агрегаты."""
+    prefix = (lambda key: ()) if group_by is None else (lambda key: (key,))
+    return [
+        prefix(key) + tuple(groups[key]) for key in sorted(groups, key=_group_order)
+    ]
+
+
+def accumulate(rows, aggregates, layout, group_by=None):
+    """Считает агрегаты за один проход по rows (кортежи с порядком столбцов
+    layout); возвращает записи результата — по одной на группу (без
+    group by — ровно одну)."""
+    factories = [
+        (_ACCUMULATORS[func], None if column == "*" else layout[column])
+        for func, column in aggregates
+    ]
+    group_pos = None if group_by is None else layout[group_by]
+    groups = {}
+    if group_by is None:
+        # без группировки результат есть и у пустой таблицы
+        groups[None] = [factory(pos) for factory, pos in factories]
+    for row in rows:
+        key = None if group_pos is None else row[group_pos]
+        state = groups.get(key)
+        if state is None:
+            state = groups[key] = [factory(pos) for factory, pos in factories]
+        for accumulator in state:
+            accumulator.add(row)
+
+    results = {
+        key: [accumulator.result() for accumulator in state]
+        for key, state in groups.items()
+    }
+    return _result_rows(results, group_by)
+
+
+def _edge_id(table_data, last):
+    if not getattr(table_data, "ids_sorted", True):
+        return _MISSING
+    positions = range(len(table_data) - 1, -1, -1) if last else range(len(table_data))
+    for pos in positions:
+        if is_live(table_data, pos):
+            return table_data[pos][ID_POS]
+    return None
+
+
+def _column_value(table_data, func, column):
+    """Агрегат по колоночному массиву или _MISSING, если массива нет."""
+    if dead_count(table_data) or table_data.schema.get(column) != "int":
+        return _MISSING
+    values = get_column(table_data, column)
+    if not isinstance(values, array):
+        # нет массива или в столбце есть пропуски
+        return _MISSING
+    if func == "count":
+        return len(values)
+    if not values:
+        return None
+    numpy = load_numpy()
+    if numpy is not None:
+        values = numpy.frombuffer(values, dtype=values.typecode)
+        if func == "avg":
+            return float(values.mean())
+        return int(getattr(values, func)())
+    if func == "avg":
+        return sum(values) / len(values)
+    return {"sum": sum, "min": min, "max": max}[func](values)
+
+
+def _shortcut_value(table_data, aggregate):
+    func, column = aggregate
+    if func == "count" and column in ("*", "ID"):
+        return live_count(table_data)
+    if func in ("min", "max") and column == "ID":
+        return _edge_id(table_data, func == "max")
+    if func in ("min", "max") and getattr(table_data, "index_columns", {}).get(
+        column
+    ) == "sorted":
+        # упорядоченный индекс содержит только живые записи без пропусков
+        index = get_index(table_data, column)
+        if not index:
+            return None
+        return index[0][0] if func == "min" else index[-1][0]
+    if getattr(table_data, "schema", None):
+        return _column_value(table_data, func, column)
+    return _MISSING
+
+
+def shortcut_aggregate(table_data, aggregates, group_by=None):
+    """Результат без просмотра записей (только для запросов без where)
+    или None, если так посчитать нельзя."""
+    if group_by is None:
+        values = [_shortcut_value(table_data, a) for a in aggregates]
+        if _MISSING in values:
+            return None
+        return _result_rows({None: values}, None)
+
+    if any(a != ("count", "*") for a in aggregates):
+        return None
+    if getattr(table_data, "index_columns", {}).get(group_by) != "hash":
+        return None
+    index = get_index(table_data, group_by)
+    groups = {
+        key: [len(positions)] * len(aggregates)
+        for key, positions in index.items()
+        if positions
+    }
+    return _result_rows(groups, group_by)
@@ -0,0 +1,471 @@
+"""Python API: работа с базой из кода без разбора текста на каждый вызов.
+
+    from src.primitive_db.api import Database
+
+    with Database() as db:
+        db.create_table("users", [("name", "str"), ("age", "int")])
+        add = db.prepare("insert into users values (?, ?)")
+        for name, age in people:
+            add.execute(name, age)          # -> ID новой записи
+        adults = db.prepare("select from users where age >= ? limit 10")
+        rows = adults.execute(18)           # кортежи по порядку adults.columns
+
+prepare() разбирает запрос один раз: находит таблицу и типы столбцов,
+приводит литералы и компилирует условие where (см. Predicate.bind).
+execute() только проверяет типы параметров и выполняет операцию. Вместо ?
+передаются значения Python (str, int, bool) без кавычек. db.execute(текст,
+*параметры) кэширует подготовленные запросы по тексту.
+
+Поддерживаются select (в том числе агрегаты с group by и join), insert одной
+записи, update и delete — тот же язык, что в интерактивном режиме, без
+format. Схема меняется методами create_table, drop_table, create_index,
+drop_index. Ошибки поднимаются исключениями из errors.py, а не печатаются.
+
+Изменения записываются на диск так же, как в интерактивном режиме (см.
+TableManager и режим durability), и обязательно — при commit(), sync() и
+close(). Один объект Database можно использовать из нескольких потоков:
+запросы выполняются по одному.
+"""
+
+import re
+import threading
+from contextlib import contextmanager
+from itertools import islice
+
+from src.primitive_db.aggregates import aggregate_label, parse_aggregates
+from src.primitive_db.core import (
+    aggregate,
+    create_index,
+    create_table,
+    delete,
+    drop_index,
+    drop_table,
+    insert_many,
+    invalidate_table_cache,
+    iter_select,
+    list_tables,
+    select,
+    update,
+)
+from src.primitive_db.decorators import raise_db_errors
+from src.primitive_db.engine import (
+    META_FILE,
+    convert_literal,
+    match_aggregate_query,
+    parse_simple_condition,
+    split_select_options,
+    split_values_tuples,
+)
+from src.primitive_db.errors import (
+    ColumnNotFoundError,
+    DatabaseError,
+    QuerySyntaxError,
+    StorageError,
+    TableNotFoundError,
+    ValidationError,
+)
+from src.primitive_db.expressions import Param, parse_where
+from src.primitive_db.joins import hash_join, match_join_query, parse_join
+from src.primitive_db.rows import int_in_range
+from src.primitive_db.table_manager import TableManager
+
+# сколько подготовленных запросов Database.execute держит по тексту
+STATEMENT_CACHE_SIZE = 256
+
+_PYTHON_TYPES = {"int": int, "str": str, "bool": bool}
+
+_SELECT_RE = re.compile(
+    r"^\s*select\s+from\s+(\S+)(?:\s+where\s+(.+?))?\s*$", re.IGNORECASE | re.DOTALL
+)
+_INSERT_RE = re.compile(
+    r"^\s*insert\s+into\s+(\S+)\s+values\s*(.+?)\s*$", re.IGNORECASE | re.DOTALL
+)
+_UPDATE_RE = re.compile(
+    r"^\s*update\s+(\S+)\s+set\s+(.+?)\s+where\s+(.+?)\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_DELETE_RE = re.compile(
+    r"^\s*delete\s+from\s+(\S+)\s+where\s+(.+?)\s*$", re.IGNORECASE | re.DOTALL
+)
+
+
+@contextmanager
+def _translate_errors(value_error=ValidationError):
+    """Встроенные исключения core и разбора -> исключения errors.py."""
+    with raise_db_errors():
+        try:
+            yield
+        except DatabaseError:
+            raise
+        except KeyError as e:
+            raise ColumnNotFoundError(e.args[0]) from e
+        except ValueError as e:
+            raise value_error(str(e)) from e
+        except OSError as e:
+            raise StorageError(str(e)) from e
+
+
+class _Params:
+    """Собирает параметры ? при разборе запроса: их типы по порядку."""
+
+    def __init__(self):
+        self.types = []
+
+    def literal(self, raw, typ):
+        if raw == "?":
+            self.types.append(typ)
+            return Param(len(self.types) - 1)
+        return convert_literal(raw, typ)
+
+    def where(self, where_text, schema):
+        """Условие where: функция values -> Predicate (или None без where)."""
+        if where_text is None:
+            return lambda values: None
+        count = len(self.types)
+        predicate = parse_where(where_text, schema, self.literal)
+        if len(self.types) == count:
+            return lambda values: predicate
+        return predicate.bind
+
+
+def _param(value, values):
+    return values[value.index] if isinstance(value, Param) else value
+
+
+def _check_params(values, types):
+    if len(values) != len(types):
+        raise ValidationError(
+            f"Некорректное значение: передано параметров {len(values)}, "
+            f"нужно {len(types)}."
+        )
+    for value, typ in zip(values, types):
+        if type(value) is not _PYTHON_TYPES[typ]:
+            raise ValidationError(
+                f"Некорректное значение: {value!r}. Ожидается {typ}."
+            )
+        if typ == "int" and not int_in_range(value):
+            raise ValidationError(f"Некорректное значение: {value!r}.")
+
+
+def _table_columns(metadata, table_name):
+    columns = metadata.get(table_name)
+    if columns is None:
+        raise TableNotFoundError(table_name)
+    return columns
+
+
+def _prepare_select(text, metadata):
+    query, limit, offset, output_format = split_select_options(text)
+    if output_format != "table":
+        raise QuerySyntaxError(f"Некорректное значение: format {output_format}.")
+    if match_join_query(query) is not None:
+        return _prepare_join(query, limit, offset, metadata)
+    m = _SELECT_RE.match(query)
+    if m is None:
+        return _prepare_aggregate(query, limit, offset, metadata)
+
+    table_name, where_text = m.groups()
+    columns = _table_columns(metadata, table_name)
+    schema = {c["name"]: c["type"] for c in columns}
+    params = _Params()
+    where = params.where(where_text, schema)
+
+    def run(db, values):
+        table_data = db._table(table_name)
+        if limit is None and offset == 0:
+            return list(select(table_data, where(values)))
+        return list(iter_select(table_data, where(values), offset, limit))
+
+    return (table_name,), list(schema), params.types, run
+
+
+def _prepare_join(query, limit, offset, metadata):
+    params = _Params()
+    join = parse_join(query, metadata, params.literal)
+    stop = None if limit is None else offset + limit
+
+    def bind(predicate, values):
+        return None if predicate is None else predicate.bind(values)
+
+    def run(db, values):
+        bound = join
+        if values:
+            bound = join._replace(
+                filters=tuple(bind(f, values) for f in join.filters),
+                residual=bind(join.residual, values),
+            )
+        tables_data = [db._table(table_name) for table_name in join.tables]
+        return list(islice(hash_join(tables_data, bound), offset, stop))
+
+    return join.tables, join.columns, params.types, run
+
+
+def _prepare_aggregate(query, limit, offset, metadata):
+    parts = match_aggregate_query(query)
+    if parts is None:
+        raise QuerySyntaxError("Некорректное значение: select.")
+    select_list, table_name, where_text, group_by = parts
+    columns = _table_columns(metadata, table_name)
+    schema = {c["name"]: c["type"] for c in columns}
+    if group_by is not None and group_by not in schema:
+        raise ColumnNotFoundError(group_by)
+    aggregates = parse_aggregates(select_list, schema, group_by)
+    params = _Params()
+    where = params.where(where_text, schema)
+    result_columns = [] if group_by is None else [group_by]
+    result_columns += [aggregate_label(a) for a in aggregates]
+    stop = None if limit is None else offset + limit
+
+    def run(db, values):
+        table_data = db._table(table_name)
+        rows = aggregate(table_data, aggregates, where(values), group_by)
+        return rows[offset:stop]
+
+    return (table_name,), result_columns, params.types, run
+
+
+def _prepare_insert(text, metadata):
+    m = _INSERT_RE.match(text)
+    if m is None:
+        raise QuerySyntaxError("Некорректное значение: insert.")
+    table_name, values_text = m.groups()
+    columns = _table_columns(metadata, table_name)
+    user_columns = [c for c in columns if c["name"] != "ID"]
+    tuples = split_values_tuples(values_text)
+    if len(tuples) != 1 or len(tuples[0]) != len(user_columns):
+        raise QuerySyntaxError("Некорректное значение: values.")
+    params = _Params()
+    template = [
+        params.literal(raw, c["type"]) for raw, c in zip(tuples[0], user_columns)
+    ]
+
+    def run(db, values):
+        row = [_param(value, values) for value in template]
+        table_data, new_id, _ = insert_many(
+            db.metadata, table_name, db._table(table_name), [[row]]
+        )
+        db._tables.record(table_name, [{"op": "i", "row": table_data[-1]}], 1)
+        return new_id
+
+    return (table_name,), [], params.types, run
+
+
+def _prepare_update(text, metadata):
+    m = _UPDATE_RE.match(text)
+    if m is None:
+        raise QuerySyntaxError("Некорректное значение: update.")
+    table_name, set_text, where_text = m.groups()
+    columns = _table_columns(metadata, table_name)
+    schema = {c["name"]: c["type"] for c in columns}
+    set_col, set_raw = parse_simple_condition(set_text)
+    if set_col not in schema:
+        raise ColumnNotFoundError(set_col)
+    if set_col == "ID":
+        raise ValidationError("Некорректное значение: ID.")
+    params = _Params()
+    set_value = params.literal(set_raw, schema[set_col])
+    where = params.where(where_text, schema)
+
+    def run(db, values):
+        set_clause = {set_col: _param(set_value, values)}
+        _, updated_ids = update(db._table(table_name), set_clause, where(values))
+        if updated_ids:
+            db._tables.record(
+                table_name,
+                [{"op": "u", "ids": updated_ids, "set": set_clause}],
+                len(updated_ids),
+            )
+        return updated_ids
+
+    return (table_name,), [], params.types, run
+
+
+def _prepare_delete(text, metadata):
+    m = _DELETE_RE.match(text)
+    if m is None:
+        raise QuerySyntaxError("Некорректное значение: delete.")
+    table_name, where_text = m.groups()
+    columns = _table_columns(metadata, table_name)
+    params = _Params()
+    where = params.where(where_text, {c["name"]: c["type"] for c in columns})
+
+    def run(db, values):
+        _, deleted_ids = delete(db._table(table_name), where(values))
+        if deleted_ids:
+            db._tables.record(
+                table_name, [{"op": "d", "ids": deleted_ids}], len(deleted_ids)
+            )
+        return deleted_ids
+
+    return (table_name,), [], params.types, run
+
+
+_PREPARERS = {
+    "select": _prepare_select,
+    "insert": _prepare_insert,
+    "update": _prepare_update,
+    "delete": _prepare_delete,
+}
+
+
+class Statement:
+    """Подготовленный запрос (см. Database.prepare).
+
+    execute(*params) подставляет параметры ? по порядку их появления в
+    тексте и возвращает: select — список кортежей (по порядку columns),
+    insert — ID новой записи, update и delete — список ID затронутых записей.
+    """
+
+    def __init__(self, db, text):
+        self.db = db
+        self.text = text
+        self._prepare()
+
+    def _prepare(self):
+        words = self.text.split(None, 1)
+        preparer = _PREPARERS.get(words[0].lower()) if words else None
+        if preparer is None:
+            raise QuerySyntaxError(f"Некорректное значение: {self.text.strip()}.")
+        with _translate_errors(QuerySyntaxError):
+            (
+                self.tables,
+                self.columns,
+                self.param_types,
+                self._run,
+            ) = preparer(self.text, self.db.metadata)
+        # если описание таблиц сменится, запрос подготовится заново
+        self._schemas = [self.db.metadata[name] for name in self.tables]
+
+    def _stale(self, metadata):
+        for table_name, schema in zip(self.tables, self._schemas):
+            if metadata.get(table_name) is not schema:
+                return True
+        return False
+
+    def execute(self, *params):
+        return self.db._execute(self, params)
+
+    __call__ = execute
+
+
+class Database:
+    """База в текущем каталоге (db_meta.json и data/), как у интерактивного
+    режима; durability — режим записи на диск (см. TableManager)."""
+
+    def __init__(self, meta_file=META_FILE, durability="none"):
+        self._tables = TableManager(meta_file)
+        self.metadata = self._tables.load_metadata()
+        self._tables.set_durability(durability)
+        self._statements = {}
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextmanager
+    def _call(self):
+        # в режиме strict ожидание fsync — после снятия блокировки, чтобы
+        # запросы других потоков попали в ту же пачку
+        with self._tables.deferred_waits(), self._lock, _translate_errors():
+            self._tables.tick()
+            self._tables.refresh_metadata(self.metadata)
+            yield
+
+    def _table(self, table_name):
+        return self._tables.get(self.metadata, table_name)
+
+    def _execute(self, statement, params):
+        with self._call():
+            if statement._stale(self.metadata):
+                # таблицу пересоздали или её описание изменил другой процесс
+                statement._prepare()
+            _check_params(params, statement.param_types)
+            return statement._run(self, params)
+
+    def prepare(self, text):
+        with self._call():
+            return Statement(self, text)
+
+    def execute(self, text, *params):
+        """Выполняет запрос; подготовленный запрос запоминается по тексту."""
+        statement = self._statements.get(text)
+        if statement is None:
+            statement = self.prepare(text)
+            if len(self._statements) >= STATEMENT_CACHE_SIZE:
+                del self._statements[next(iter(self._statements))]
+            self._statements[text] = statement
+        return statement.execute(*params)
+
+    def create_table(self, table_name, columns):
+        """columns — пары (имя, тип) или строки "имя:тип"."""
+        pairs = []
+        for column in columns:
+            if isinstance(column, str):
+                if ":" not in column:
+                    raise ValidationError(f"Некорректное значение: {column}.")
+                column = column.split(":", 1)
+            pairs.append(tuple(column))
+        with self._call():
+            create_table(self.metadata, table_name, pairs)
+            self._tables.save_metadata(self.metadata)
+
+    def drop_table(self, table_name):
+        with self._call():
+            drop_table(self.metadata, table_name)
+            self._tables.save_metadata(self.metadata)
+            self._tables.drop(table_name)
+
+    def create_index(self, table_name, column, kind="hash"):
+        with self._call():
+            create_index(self.metadata, table_name, column, kind)
+            self._tables.save_metadata(self.metadata)
+            self._tables.refresh_schema(self.metadata, table_name)
+
+    def drop_index(self, table_name, column):
+        with self._call():
+            drop_index(self.metadata, table_name, column)
+            self._tables.save_metadata(self.metadata)
+            self._tables.refresh_schema(self.metadata, table_name)
+
+    def list_tables(self):
+        with self._call():
+            return list_tables(self.metadata)
+
+    def begin(self):
+        with self._call():
+            if self._tables.in_transaction:
+                raise ValidationError("Транзакция уже начата.")
+            self._tables.begin()
+
+    def commit(self):
+        with self._call():
+            self._tables.commit()
+
+    def rollback(self):
+        with self._call():
+            if not self._tables.in_transaction:
+                raise ValidationError("Нет активной транзакции.")
+            for table_name in self._tables.rollback():
+                invalidate_table_cache(table_name)
+            self.metadata.clear()
+            self.metadata.update(self._tables.load_metadata())
+
+    def sync(self):
+        """Записывает все изменения на диск и дожидается fsync."""
+        with self._call():
+            if self._tables.in_transaction:
+                raise ValidationError(
+                    "Транзакция не завершена: выполните commit или rollback."
+                )
+            self._tables.sync()
+
+    def close(self):
+        """Записывает изменения; незавершённая транзакция отменяется."""
+        with self._lock, _translate_errors():
+            if self._tables.in_transaction:
+                for table_name in self._tables.rollback():
+                    invalidate_table_cache(table_name)
+            self._tables.close()
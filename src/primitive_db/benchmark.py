@@ -0,0 +1,368 @@
+"""Нагрузочные замеры основных операций на синтетических таблицах.
+
+Для каждого размера из --sizes во временном каталоге создаётся таблица
+bench (name:str, age:int, active:bool) через core.create_table, заполняется
+детерминированными данными (--seed) и замеряются:
+- insert по одной записи и insert_many целиком;
+- select без условия, с условием без индекса и по индексу;
+- update и delete;
+- сохранение и загрузка через utils (JSON и двоичный формат);
+- выполнение команд через engine.run в пакетном режиме;
+- время ответа на insert через engine.execute в каждом режиме записи
+  (durability none, batch, strict);
+- select по ID и insert через подготовленные запросы Python API;
+- время запуска в отдельных процессах (раздел startup результатов):
+  интерпретатора, импорта main и первой команды database -c.
+
+Каждая операция повторяется --repeat раз, в результат идут лучшее и
+медианное время. Результаты пишутся в JSON (--output); если указан
+--baseline, они сравниваются с прошлым запуском, и при замедлении больше
+чем на --threshold программа завершается с кодом 1.
+
+Запуск: python -m src.primitive_db.benchmark --sizes 10000 100000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.primitive_db import core
+from src.primitive_db.api import Database
+from src.primitive_db.columns import attach_columns
+from src.primitive_db.decorators import set_confirmations
+from src.primitive_db.engine import execute, read_script, run
+from src.primitive_db.expressions import Predicate
+from src.primitive_db.indexes import Range, attach_indexes
+from src.primitive_db.table_manager import DURABILITY_LEVELS, TableManager
+from src.primitive_db.utils import (
+    TableData,
+    load_table_data,
+    save_metadata,
+    save_table_data,
+)
+
+BENCH_SIZES = (10_000, 100_000, 1_000_000)
+BENCH_REPEAT = 3
+# сколько записей добавляется по одной в замере insert_single
+SINGLE_INSERTS = 1000
+# допустимое замедление относительно базового запуска (0.2 — на 20%)
+REGRESSION_THRESHOLD = 0.2
+
+# сколько записей в таблице для замеров запуска
+STARTUP_ROWS = 1000
+# первая команда в замере запуска
+STARTUP_COMMAND = "select from bench where ID = 7"
+
+TABLE = "bench"
+COLUMNS = [("name", "str"), ("age", "int"), ("active", "bool")]
+
+
+def generate_rows(count, seed):
+    rnd = random.Random(seed)
+    return [
+        [f"user{rnd.randrange(count)}", rnd.randrange(100), rnd.random() < 0.5]
+        for _ in range(count)
+    ]
+
+
+def _new_table(metadata):
+    table_data = TableData(name=TABLE)
+    attach_columns(metadata, TABLE, table_data)
+    attach_indexes(metadata, TABLE, table_data)
+    return table_data
+
+
+def _measure(results, name, func, repeat, setup=None, ops=1):
+    """Замеряет func() repeat раз; setup() вызывается перед каждым разом
+    и не входит в замер."""
+    times = []
+    for i in range(repeat):
+        state = setup(i) if setup is not None else None
+        start = time.perf_counter()
+        func(state)
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    results[name] = {
+        "best": best,
+        "median": statistics.median(times),
+        "ops": ops,
+        "per_op": best / ops,
+    }
+
+
+def bench_size(size, repeat, seed):
+    results = {}
+    rows = generate_rows(size, seed)
+    metadata = {}
+    core.create_table(metadata, TABLE, COLUMNS)
+
+    def fresh_table(_):
+        table_data = _new_table(metadata)
+        core.insert_many(metadata, TABLE, table_data, [rows])
+        return table_data
+
+    single_values = [['"single"', "42", "true"]] * SINGLE_INSERTS
+
+    def insert_single(table_data):
+        for values in single_values:
+            core.insert(metadata, TABLE, table_data, values)
+
+    def empty_table(_):
+        return _new_table(metadata)
+
+    def insert_bulk(table_data):
+        core.insert_many(metadata, TABLE, table_data, [rows])
+
+    _measure(
+        results, "insert_single", insert_single, repeat, empty_table, SINGLE_INSERTS
+    )
+    _measure(results, "insert_bulk", insert_bulk, repeat, empty_table, size)
+
+    table_data = fresh_table(None)
+    queries = {
+        "select_all": None,
+        "select_eq": Predicate.from_terms({"age": 42}),
+        "select_range": Predicate.from_terms({"age": Range(10, 19)}),
+        "select_id": Predicate.from_terms({"ID": size // 2}),
+    }
+
+    def uncached(where_clause):
+        def select(_):
+            # кэш select сбрасывается, чтобы мерить сам просмотр
+            core.invalidate_table_cache(TABLE)
+            result = core.select(table_data, where_clause)
+            return len(result)
+        return select
+
+    for name, where_clause in queries.items():
+        _measure(results, name, uncached(where_clause), repeat)
+
+    core.create_index(metadata, TABLE, "age", "sorted")
+    attach_indexes(metadata, TABLE, table_data)
+    core.select(table_data, queries["select_eq"])  # строим индекс заранее
+    _measure(results, "select_eq_indexed", uncached(queries["select_eq"]), repeat)
+    _measure(
+        results, "select_range_indexed", uncached(queries["select_range"]), repeat
+    )
+    core.drop_index(metadata, TABLE, "age")
+    attach_indexes(metadata, TABLE, table_data)
+
+    def update(attempt):
+        core.update(table_data, {"active": attempt % 2 == 0}, {"age": 42})
+
+    def delete(fresh):
+        core.delete(fresh, {"age": 42})
+
+    _measure(results, "update", update, repeat, lambda attempt: attempt)
+    _measure(results, "delete", delete, repeat, fresh_table)
+
+    for binary, suffix in ((False, "json"), (True, "binary")):
+        def save(_, binary=binary):
+            save_table_data(TABLE, table_data, binary)
+
+        def load(_):
+            load_table_data(TABLE, table_data.names)
+
+        _measure(results, f"save_{suffix}", save, repeat)
+        _measure(results, f"load_{suffix}", load, repeat)
+
+    save_table_data(TABLE, table_data, False)
+    save_metadata("db_meta.json", metadata)
+    commands = [
+        "select from bench where age = 42 limit 10",
+        "select from bench where ID = 7",
+        "info bench",
+        "update bench set active = false where age = 43",
+        f"select from bench where age between 10 and 20 limit 5 offset {size // 10}",
+    ]
+
+    def engine_round_trip(_):
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(read_script(commands))
+
+    _measure(results, "engine_run", engine_round_trip, repeat, ops=len(commands))
+
+    insert_commands = ['insert into bench values ("durable", 42, true)']
+    insert_commands *= SINGLE_INSERTS
+    for level in DURABILITY_LEVELS:
+        managers = []
+
+        def open_tables(_, level=level):
+            tables = TableManager("db_meta.json")
+            bench_metadata = tables.load_metadata()
+            tables.get(bench_metadata, TABLE)  # загрузка таблицы не входит в замер
+            tables.set_durability(level)
+            managers.append(tables)
+            return tables, bench_metadata
+
+        def acknowledged_inserts(state):
+            tables, bench_metadata = state
+            with contextlib.redirect_stdout(io.StringIO()):
+                for command in insert_commands:
+                    execute(tables, bench_metadata, command)
+
+        _measure(
+            results,
+            f"insert_{level}",
+            acknowledged_inserts,
+            repeat,
+            open_tables,
+            SINGLE_INSERTS,
+        )
+        for tables in managers:
+            tables.close()
+
+    with Database("db_meta.json") as db:
+        get = db.prepare("select from bench where ID = ?")
+        add = db.prepare("insert into bench values (?, ?, ?)")
+        ids = [1 + i * size // SINGLE_INSERTS for i in range(SINGLE_INSERTS)]
+
+        def prepared_select(_):
+            for row_id in ids:
+                get.execute(row_id)
+
+        def prepared_insert(_):
+            for _ in range(SINGLE_INSERTS):
+                add.execute("prepared", 42, True)
+
+        _measure(
+            results, "prepared_select", prepared_select, repeat, ops=SINGLE_INSERTS
+        )
+        _measure(
+            results, "prepared_insert", prepared_insert, repeat, ops=SINGLE_INSERTS
+        )
+    return results
+
+
+def bench_startup(repeat, seed):
+    """Время запуска отдельного процесса: python без программы (для
+    сравнения), импорт main и команда database -c STARTUP_COMMAND по базе
+    из STARTUP_ROWS записей. Запускается в текущем каталоге."""
+    metadata = {}
+    core.create_table(metadata, TABLE, COLUMNS)
+    table_data = _new_table(metadata)
+    core.insert_many(metadata, TABLE, table_data, [generate_rows(STARTUP_ROWS, seed)])
+    save_table_data(TABLE, table_data, False)
+    save_metadata("db_meta.json", metadata)
+
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(root))
+    commands = {
+        "python": ["-c", "pass"],
+        "import": ["-c", "import src.primitive_db.main"],
+        "first_command": ["-m", "src.primitive_db.main", "-c", STARTUP_COMMAND],
+    }
+    results = {}
+    for name, args in commands.items():
+
+        def start(_, args=args):
+            subprocess.run(
+                [sys.executable, *args],
+                env=env,
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+
+        _measure(results, name, start, repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Список замедлений больше threshold: (размер, операция, было, стало)."""
+    regressions = []
+    for size, operations in results.items():
+        old_operations = baseline.get(size, {})
+        for name, measured in operations.items():
+            old = old_operations.get(name)
+            if old is None:
+                continue
+            if measured["best"] > old["best"] * (1 + threshold):
+                regressions.append((size, name, old["best"], measured["best"]))
+    return regressions
+
+
+def _print_results(section, operations):
+    for name, measured in operations.items():
+        print(
+            f"{section:>9} {name:<22} {measured['best'] * 1000:10.2f} мс"
+            f"  ({measured['per_op'] * 1e6:.2f} мкс/оп)"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="benchmark", description="Замеры основных операций базы."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(BENCH_SIZES))
+    parser.add_argument("--repeat", type=int, default=BENCH_REPEAT)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", metavar="FILE", help="куда записать JSON")
+    parser.add_argument(
+        "--baseline", metavar="FILE", help="JSON прошлого запуска для сравнения"
+    )
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    set_confirmations(False)
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # utils и engine работают с data/ и db_meta.json в текущем каталоге
+        os.chdir(workdir)
+        try:
+            for size in args.sizes:
+                results[str(size)] = bench_size(size, args.repeat, args.seed)
+                _print_results(size, results[str(size)])
+            # запуск замеряется на своей маленькой базе
+            os.mkdir("startup")
+            os.chdir("startup")
+            results["startup"] = bench_startup(args.repeat, args.seed)
+            _print_results("startup", results["startup"])
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for size, name, old, new in regressions:
+            print(
+                f"Замедление: {name} на {size} записях — "
+                f"{old * 1000:.2f} мс -> {new * 1000:.2f} мс"
+            )
+        if regressions:
+            return 1
+        print("Замедлений нет.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""Двоичный формат файла таблицы с доступом через mmap.
+
+Устройство файла data/<table>.tbl:
+
+    MAGIC (4 байта) | длина заголовка (uint32) | заголовок (JSON)
+    строки: count слотов фиксированной ширины row_size, начиная с rows_offset
+    куча: байты строковых значений (UTF-8), начиная с heap_offset
+
+В заголовке хранятся столбцы, счётчик ID, число строк и смещения полей
+внутри слота. Поля int занимают 8 байт, bool — 1 байт, str — пара
+(смещение в куче, длина) из 8 + 4 байт.
+
+Файл открывается через mmap, поэтому чтение одной записи (по позиции или по
+ID — записи лежат по возрастанию ID) затрагивает только нужные страницы.
+Поля int и bool можно менять на месте, без перезаписи файла.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+from src.primitive_db.rows import row_layout
+
+MAGIC = b"PDBT"
+_PREFIX = struct.Struct("<4sI")
+_FIELDS = {"int": struct.Struct("<q"), "bool": struct.Struct("<?")}
+_STR_FIELD = struct.Struct("<QI")
+_ALIGN = 8
+
+
+def _layout(columns):
+    offsets = {}
+    size = 0
+    for col in columns:
+        field = _FIELDS.get(col["type"], _STR_FIELD)
+        offsets[col["name"]] = size
+        size += field.size
+    return offsets, size
+
+
+def write_table(path, columns, rows, sequence, fsync=False):
+    """Записывает записи rows (кортежи по порядку columns) в файл path атомарно.
+
+    fsync — дождаться записи файла на диск до переименования.
+    """
+    offsets, row_size = _layout(columns)
+    fields = [
+        (i, col["name"], offsets[col["name"]], _FIELDS.get(col["type"]))
+        for i, col in enumerate(columns)
+    ]
+
+    body = bytearray(row_size * len(rows))
+    heap = bytearray()
+    for pos, row in enumerate(rows):
+        base = pos * row_size
+        for i, name, offset, field in fields:
+            value = row[i]
+            if value is None:
+                raise ValueError(f"Некорректное значение: {name} = None.")
+            if field is not None:
+                try:
+                    field.pack_into(body, base + offset, value)
+                except struct.error:
+                    raise ValueError(f"Некорректное значение: {name} = {value}.")
+            else:
+                data = value.encode("utf-8")
+                _STR_FIELD.pack_into(body, base + offset, len(heap), len(data))
+                heap += data
+
+    id_pos = [col["name"] for col in columns].index("ID")
+    ids = [row[id_pos] for row in rows]
+    header = {
+        "columns": [{"name": c["name"], "type": c["type"]} for c in columns],
+        "sequence": sequence,
+        "count": len(rows),
+        "row_size": row_size,
+        # find_id ищет двоичным поиском, только если ID идут по возрастанию
+        "sorted_ids": all(a < b for a, b in zip(ids, ids[1:])),
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    rows_offset = _PREFIX.size + len(header_bytes)
+    padding = -rows_offset % _ALIGN
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * padding)
+        f.write(body)
+        f.write(heap)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class MappedTable:
+    """Таблица в двоичном формате, отображённая в память.
+
+    Ведёт себя как последовательность записей: len(), индексация по
+    позиции и итерация возвращают кортежи по порядку столбцов (names,
+    layout — как у TableData, см. rows.py), декодируемые по требованию.
+    """
+
+    def __init__(self, path, writable=False, lock=None):
+        # lock — контекстный менеджер блокировки файла (см. locks.py):
+        # берётся здесь и отпускается в close()
+        self._lock = lock
+        if lock is not None:
+            lock.__enter__()
+        try:
+            self._open(path, writable)
+        except BaseException:
+            self._release()
+            raise
+
+    def _open(self, path, writable):
+        self._path = path
+        self._writable = writable
+        self._file = open(path, "r+b" if writable else "rb")
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        self._map = mmap.mmap(self._file.fileno(), 0, access=access)
+
+        magic, header_len = _PREFIX.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Некорректное значение: {path}.")
+        header = json.loads(self._map[_PREFIX.size:_PREFIX.size + header_len])
+
+        self.columns = header["columns"]
+        self.sequence = header["sequence"]
+        self._sorted_ids = header["sorted_ids"]
+        self._count = header["count"]
+        self._row_size = header["row_size"]
+        rows_offset = _PREFIX.size + header_len
+        self._rows_offset = rows_offset + (-rows_offset % _ALIGN)
+        self._heap_offset = self._rows_offset + self._count * self._row_size
+
+        offsets, _ = _layout(self.columns)
+        self._types = {c["name"]: c["type"] for c in self.columns}
+        self._offsets = offsets
+        self.names = [c["name"] for c in self.columns]
+        self.layout = row_layout(self.names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            if self._writable:
+                self._map.flush()
+            self._map.close()
+            self._map = None
+            if self._writable:
+                # изменения через mmap не всегда сразу меняют время файла,
+                # а по нему другие процессы замечают изменения
+                os.utime(self._path)
+        self._file.close()
+        self._release()
+
+    def _release(self):
+        if self._lock is not None:
+            lock, self._lock = self._lock, None
+            lock.__exit__(None, None, None)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def ids_sorted(self):
+        """Записи в файле идут по возрастанию ID."""
+        return self._sorted_ids
+
+    def value(self, pos, name):
+        offset = self._rows_offset + pos * self._row_size + self._offsets[name]
+        field = _FIELDS.get(self._types[name])
+        if field is not None:
+            return field.unpack_from(self._map, offset)[0]
+        start, length = _STR_FIELD.unpack_from(self._map, offset)
+        start += self._heap_offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def __getitem__(self, pos):
+        if pos < 0:
+            pos += self._count
+        if not 0 <= pos < self._count:
+            raise IndexError(pos)
+        return tuple(self.value(pos, name) for name in self.names)
+
+    def __iter__(self):
+        for pos in range(self._count):
+            yield self[pos]
+
+    def find_id(self, row_id):
+        """Позиция записи с данным ID (двоичный поиск) или None."""
+        if not self._sorted_ids:
+            for pos in range(self._count):
+                if self.value(pos, "ID") == row_id:
+                    return pos
+            return None
+
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.value(mid, "ID") < row_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self.value(lo, "ID") == row_id:
+            return lo
+        return None
+
+    def set_value(self, pos, name, value):
+        """Меняет поле int или bool записи прямо в файле."""
+        field = _FIELDS.get(self._types[name])
+        if field is None or name == "ID":
+            raise ValueError(f"Некорректное значение: {name}. Только int и bool.")
+        offset = self._rows_offset + pos * self._row_size + self._offsets[name]
+        # значение упаковывается целиком до записи: при ошибке поле не меняется
+        data = field.pack(value)
+        self._map[offset : offset + len(data)] = data
+
+    def flush(self):
+        self._map.flush()
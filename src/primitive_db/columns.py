@@ -0,0 +1,169 @@
+"""Колоночное представление таблицы для быстрых просмотров без индекса.
+
+Для каждого столбца, по которому идёт фильтрация, лениво строится
+массив значений: array.array для int и bool, список интернированных строк
+для str. Условие where вычисляется по такому массиву целиком и даёт маску
+(или сразу список позиций) подходящих записей, вместо того чтобы для
+каждой записи доставать значение из кортежа записи.
+
+Если установлен NumPy, маски считаются векторно поверх тех же массивов
+(без копирования); без NumPy используется цикл на чистом Python. NumPy
+импортируется при первом колоночном просмотре (см. load_numpy), а не при
+запуске программы.
+"""
+
+import sys
+from array import array
+from itertools import compress, repeat
+from operator import eq
+
+from src.primitive_db.indexes import Range
+from src.primitive_db.rows import set_names
+
+# Колонки строятся только для таблиц от этого размера: на маленьких таблицах
+# обычный просмотр записей дешевле, чем построение массивов.
+COLUMNAR_MIN_ROWS = 1000
+
+_ARRAY_TYPECODES = {"int": "q", "bool": "b"}
+
+_numpy = False  # False — ещё не импортирован
+
+
+def load_numpy():
+    """Модуль numpy или None, если он не установлен."""
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+def attach_columns(metadata, table_name, table_data):
+    table_data.schema = {c["name"]: c["type"] for c in metadata.get(table_name, [])}
+    table_data.columns = {}
+    if table_data.schema:
+        # записи хранятся по порядку столбцов из метаданных (см. rows.py)
+        set_names(table_data, table_data.schema)
+    return table_data
+
+
+def build_column(table_data, name, typ):
+    pos = table_data.layout[name]
+    values = [row[pos] for row in table_data]
+    typecode = _ARRAY_TYPECODES.get(typ)
+    if typecode is not None:
+        try:
+            return array(typecode, values)
+        except (TypeError, OverflowError):
+            # пропуски или слишком большие числа — храним обычным списком
+            return values
+    if typ == "str":
+        return [sys.intern(v) if isinstance(v, str) else v for v in values]
+    return values
+
+
+def get_column(table_data, name):
+    columns = getattr(table_data, "columns", None)
+    if columns is None or len(table_data) < COLUMNAR_MIN_ROWS:
+        return None
+    column = columns.get(name)
+    if column is None:
+        typ = table_data.schema.get(name)
+        if typ is None:
+            return None
+        column = build_column(table_data, name, typ)
+        columns[name] = column
+    return column
+
+
+def _numpy_mask(numpy, column, condition):
+    if isinstance(column, array):
+        values = numpy.frombuffer(column, dtype=column.typecode)
+    else:
+        values = numpy.asarray(column, dtype=object)
+
+    if not isinstance(condition, Range):
+        return values == condition
+    mask = numpy.ones(len(values), dtype=bool)
+    if condition.low is not None:
+        if condition.low_inclusive:
+            mask &= values >= condition.low
+        else:
+            mask &= values > condition.low
+    if condition.high is not None:
+        if condition.high_inclusive:
+            mask &= values <= condition.high
+        else:
+            mask &= values < condition.high
+    return mask
+
+
+def _python_mask(column, condition):
+    if isinstance(condition, Range):
+        return map(condition.contains, column)
+    return map(eq, column, repeat(condition))
+
+
+def scan_positions(table_data, where_clause):
+    """Позиции записей, подходящих под where_clause, по колонкам таблицы.
+
+    Возвращает None, если колоночное представление недоступно (маленькая
+    таблица, обычный список или столбец неизвестного типа).
+    """
+    columns = []
+    for name, condition in where_clause.items():
+        column = get_column(table_data, name)
+        if column is None:
+            return None
+        columns.append((column, condition))
+
+    numpy = load_numpy()
+    if numpy is not None:
+        mask = None
+        for column, condition in columns:
+            part = _numpy_mask(numpy, column, condition)
+            mask = part if mask is None else mask & part
+        return numpy.flatnonzero(mask).tolist()
+
+    column, condition = columns[0]
+    positions = list(compress(range(len(column)), _python_mask(column, condition)))
+    for column, condition in columns[1:]:
+        if isinstance(condition, Range):
+            positions = [p for p in positions if condition.contains(column[p])]
+        else:
+            positions = [p for p in positions if column[p] == condition]
+    return positions
+
+
+def column_append(table_data, row):
+    columns = getattr(table_data, "columns", {})
+    broken = []
+    for name, column in columns.items():
+        try:
+            column.append(row[table_data.layout[name]])
+        except (TypeError, OverflowError):
+            # значение не помещается в массив — перестроим столбец при запросе
+            broken.append(name)
+    for name in broken:
+        del columns[name]
+
+
+def column_set(table_data, pos, set_clause):
+    columns = getattr(table_data, "columns", {})
+    for name, value in set_clause.items():
+        column = columns.get(name)
+        if column is None:
+            continue
+        try:
+            column[pos] = value
+        except (TypeError, OverflowError):
+            del columns[name]
+
+
+def reset_columns(table_data):
+    columns = getattr(table_data, "columns", None)
+    if columns is not None:
+        columns.clear()
@@ -1,47 +1,101 @@
+import itertools
+from itertools import islice
+
+from src.primitive_db.aggregates import accumulate, shortcut_aggregate
+from src.primitive_db.columns import (
+    column_append,
+    column_set,
+    reset_columns,
+    scan_positions,
+)
 from src.primitive_db.decorators import (
     confirm_action,
     create_cacher,
     handle_db_errors,
     log_time,
 )
+from src.primitive_db.errors import (
+    ColumnNotFoundError,
+    TableExistsError,
+    TableNotFoundError,
+    ValidationError,
+)
+from src.primitive_db.expressions import as_predicate
+from src.primitive_db.indexes import (
+    INDEX_KINDS,
+    index_add,
+    index_extend,
+    index_insert,
+    index_remove,
+    indexed_columns,
+    reset_indexes,
+)
+from src.primitive_db.metrics import increment, register_source
+from src.primitive_db.parallel import parallel_positions
+from src.primitive_db.rows import ID_POS, int_in_range, replace_values
+from src.primitive_db.tombstones import (
+    compact_rows,
+    dead_count,
+    live_count,
+    live_positions,
+    live_rows,
+    mark_dead,
+    remove_positions,
+)
 
 _select_cache = create_cacher()
+register_source("select_cache", _select_cache.stats)
+
+# номер версии каждой таблицы: растёт при любом изменении, входит в ключ кэша
+_table_versions = {}
+
+def _table_changed(table_name):
+    _table_versions[table_name] = _table_versions.get(table_name, 0) + 1
+    _select_cache.invalidate(table_name)
+
+
+def invalidate_table_cache(table_name):
+    """Сбрасывает кэш таблицы, изменённой в обход core (например, rollback)."""
+    _table_changed(table_name)
 
-def _reset_select_cache():
-    global _select_cache
-    _select_cache = create_cacher()
+
+def select_cache_stats():
+    return _select_cache.stats()
 
 ALLOWED_TYPES = {"int", "str", "bool"}
 
 def _parse_value(value: str, typ: str):
     if typ == "int":
         try:
-            return int(value)
+            number = int(value)
         except ValueError:
-            raise ValueError(f"Некорректное значение: {value}.")
+            raise ValidationError(f"Некорректное значение: {value}.")
+        if not int_in_range(number):
+            raise ValidationError(f"Некорректное значение: {value}.")
+        return number
     if typ == "bool":
         v = value.lower()
         if v == "true":
             return True
         if v == "false":
             return False
-        raise ValueError(f"Некорректное значение: {value}.")
+        raise ValidationError(f"Некорректное значение: {value}.")
     if typ == "str":
         if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
             return value[1:-1]
-        raise ValueError(f"Некорректное значение: {value}.")
-    raise ValueError(f"Некорректное значение: {typ}.")
+        raise ValidationError(f"Некорректное значение: {value}.")
+    raise ValidationError(f"Некорректное значение: {typ}.")
 
 @handle_db_errors
 def create_table(metadata, table_name, columns):
     if table_name in metadata:
-        raise ValueError(f'Таблица "{table_name}" уже существует.')
+        raise TableExistsError(table_name)
 
     for name, typ in columns:
         if typ not in ALLOWED_TYPES:
-            raise ValueError(f"Некорректное значение: {typ}.")
+            raise ValidationError(f"Некорректное значение: {typ}.")
         if name == "ID" and typ != "int":
-            raise ValueError("Некорректное значение: ID.")
+            raise ValidationError("Некорректное значение: ID.")
     
     columns_wo_id = []
     for n, t in columns:
@@ -50,7 +104,7 @@ def create_table(metadata, table_name, columns):
 
     columns = [("ID", "int")] + columns_wo_id
     metadata[table_name] = [{"name": n, "type": t} for n, t in columns]
-    _reset_select_cache()
+    _table_changed(table_name)
     return metadata
 
 
@@ -58,110 +112,360 @@ def create_table(metadata, table_name, columns):
 @confirm_action("удаление таблицы")
 def drop_table(metadata, table_name):
     if table_name not in metadata:
-        raise ValueError(f'Таблица "{table_name}" не существует.')
+        raise TableNotFoundError(table_name)
     del metadata[table_name]
-    _reset_select_cache()
+    _table_changed(table_name)
     return metadata
 
 
 def list_tables(metadata):
     return list(metadata.keys())
 
+
+@handle_db_errors
+def create_index(metadata, table_name, column, kind="hash"):
+    if table_name not in metadata:
+        raise TableNotFoundError(table_name)
+    if kind not in INDEX_KINDS:
+        raise ValidationError(f"Некорректное значение: {kind}.")
+    if column == "ID" and kind == "hash":
+        raise ValidationError("Столбец ID индексируется автоматически.")
+
+    for col in metadata[table_name]:
+        if col["name"] == column:
+            if col.get("index"):
+                raise ValidationError(f'Индекс по столбцу "{column}" уже существует.')
+            if kind == "sorted" and col["type"] != "int":
+                raise ValidationError(
+                    "Упорядоченный индекс можно создать только по столбцу int."
+                )
+            col["index"] = kind
+            return metadata
+    raise ColumnNotFoundError(column)
+
+
+@handle_db_errors
+def drop_index(metadata, table_name, column):
+    if table_name not in metadata:
+        raise TableNotFoundError(table_name)
+
+    for col in metadata[table_name]:
+        if col["name"] == column and col.get("index"):
+            del col["index"]
+            return metadata
+    raise ValidationError(f'Индекса по столбцу "{column}" нет.')
+
+
+def _matching_positions(table_data, where_clause):
+    """Позиции записей, подходящих под where_clause (словарь или Predicate).
+
+    Если по одному из условий есть индекс, проверяются только найденные
+    через самый избирательный индекс записи, иначе таблица просматривается
+    целиком — по колонкам (см. columns.py), если условие это позволяет,
+    в пуле процессов (см. parallel.py), если включён параллельный режим,
+    или по записям скомпилированным предикатом.
+    """
+    predicate = as_predicate(where_clause)
+    candidates = predicate.candidate_positions(table_data)
+    if candidates is not None:
+        increment("index_lookups")
+        scanned = len(candidates)
+        positions = predicate.filter_positions(table_data, candidates)
+    else:
+        scanned = len(table_data)
+        positions = None
+        scan_kind = "columnar_scans"
+        if predicate.terms is not None:
+            positions = scan_positions(table_data, predicate.terms)
+        if positions is None:
+            scan_kind = "parallel_scans"
+            positions = parallel_positions(table_data, predicate)
+        if positions is None:
+            scan_kind = "full_scans"
+            positions = predicate.filter_positions(table_data)
+        increment(scan_kind)
+
+    positions = live_positions(table_data, positions)
+    increment("rows_scanned", scanned)
+    increment("rows_matched", len(positions))
+    return positions
+
+
+def _last_id(table_data):
+    # счётчик ID хранится вместе с таблицей (см. utils.TableData);
+    # для обычного списка записей вычисляем его по старинке
+    max_id = getattr(table_data, "sequence", None)
+    if max_id is None:
+        max_id = 0
+        for row in table_data:
+            if isinstance(row[ID_POS], int) and row[ID_POS] > max_id:
+                max_id = row[ID_POS]
+    return max_id
+
+
 @handle_db_errors
 @log_time
 def insert(metadata, table_name, table_data, values):
     if table_name not in metadata:
-        raise ValueError(f'Таблица "{table_name}" не существует.')
+        raise TableNotFoundError(table_name)
 
     columns = metadata[table_name]  # список словарей {"name":..., "type":...}
     user_columns = [c for c in columns if c["name"] != "ID"]
 
     if len(values) != len(user_columns):
-        raise ValueError("Некорректное значение: values. Попробуйте снова.")
-
-    max_id = 0
-    for row in table_data:
-        if "ID" in row and isinstance(row["ID"], int) and row["ID"] > max_id:
-            max_id = row["ID"]
-    new_id = max_id + 1
-
-    row = {"ID": new_id}
-    for i in range(len(user_columns)):
-        col = user_columns[i]
-        row[col["name"]] = _parse_value(values[i], col["type"])
+        raise ValidationError("Некорректное значение: values. Попробуйте снова.")
+
+    new_id = _last_id(table_data) + 1
+
+    # запись — кортеж по порядку столбцов metadata[table_name] (см. rows.py)
+    row = (new_id,) + tuple(
+        _parse_value(value, col["type"]) for value, col in zip(values, user_columns)
+    )
     table_data.append(row)
-    _reset_select_cache()
+    if hasattr(table_data, "sequence"):
+        table_data.sequence = new_id
+    index_insert(table_data, len(table_data) - 1)
+    column_append(table_data, row)
+    _table_changed(table_name)
     return table_data, new_id
 
 
+@handle_db_errors
+@log_time
+def insert_many(metadata, table_name, table_data, chunks):
+    """Добавляет записи порциями: chunks — списки списков уже приведённых
+    к типам значений (без ID), например из importer.iter_import_chunks.
+
+    Если очередная порция не прошла проверку, все добавленные записи
+    откатываются. Возвращает (table_data, первый ID, число записей).
+    """
+    if table_name not in metadata:
+        raise TableNotFoundError(table_name)
+
+    width = len(metadata[table_name]) - 1
+
+    start = len(table_data)
+    first_id = last_id = _last_id(table_data)
+    try:
+        for chunk in chunks:
+            for values in chunk:
+                if len(values) != width:
+                    raise ValidationError(
+                        "Некорректное значение: values. Попробуйте снова."
+                    )
+                last_id += 1
+                table_data.append((last_id, *values))
+    except BaseException:
+        del table_data[start:]
+        raise
+
+    count = len(table_data) - start
+    if hasattr(table_data, "sequence"):
+        table_data.sequence = last_id
+    index_extend(table_data, start)
+    for pos in range(start, len(table_data)):
+        column_append(table_data, table_data[pos])
+    if count:
+        _table_changed(table_name)
+    return table_data, first_id + 1, count
+
+
 @handle_db_errors
 @log_time
 def select(table_data, where_clause=None):
     if where_clause is None:
+        if dead_count(table_data):
+            return list(live_rows(table_data))
         return table_data
 
-    key = (id(table_data), tuple(sorted(where_clause.items())))
+    def value_func():
+        positions = _matching_positions(table_data, where_clause)
+        return [table_data[pos] for pos in positions]
+
+    return _cached(table_data, as_predicate(where_clause).key, value_func)
+
+
+@handle_db_errors
+@log_time
+def aggregate(table_data, aggregates, where_clause=None, group_by=None):
+    """Агрегатный запрос (см. aggregates.py); aggregates — пары
+    (функция, столбец) из parse_aggregates. Возвращает записи результата.
+
+    Записи просматриваются потоком через iter_select, без where ответ
+    по возможности берётся из индексов и колонок без просмотра.
+    """
 
     def value_func():
-        result = []
-        for row in table_data:
-            ok = True
-            for k, v in where_clause.items():
-                if row.get(k) != v:
-                    ok = False
-                    break
-            if ok:
-                result.append(row)
-        return result
+        if where_clause is None:
+            result = shortcut_aggregate(table_data, aggregates, group_by)
+            if result is not None:
+                increment("aggregate_shortcuts")
+                return result
+        rows = iter_select(table_data, where_clause)
+        return accumulate(rows, aggregates, table_data.layout, group_by)
+
+    predicate = as_predicate(where_clause)
+    key = ("aggregate", tuple(aggregates), group_by, predicate and predicate.key)
+    return _cached(table_data, key, value_func)
+
+
+def _cached(table_data, key, value_func):
+    """Результат запроса из кэша select: ключ дополняется именем таблицы
+    и её версией, так что любое изменение таблицы сбрасывает его."""
+    table_name = getattr(table_data, "name", None)
+    if table_name is None:
+        return value_func()
+
+    version = _table_versions.get(table_name, 0)
+    return _select_cache((table_name, version, key), value_func)
 
-    return _select_cache(key, value_func)
+
+def iter_select(table_data, where_clause=None, offset=0, limit=None):
+    """Лениво выдаёт подходящие записи, пропустив первые offset.
+
+    В отличие от select результат не кэшируется и не собирается в список:
+    просмотр таблицы останавливается, как только выдано limit записей.
+    Без limit (агрегаты, join) таблица просматривается целиком, и полный
+    просмотр может идти в пуле процессов (см. parallel.py).
+
+    Метрики просмотра (вид просмотра, rows_scanned, rows_matched) те же,
+    что у select; число записей добавляется, когда просмотр закончен или
+    прерван.
+    """
+    scan_kind = "full_scans"
+    if not where_clause:
+        rows = live_rows(table_data)
+        scanned = None
+    else:
+        predicate = as_predicate(where_clause)
+        test = predicate.tester(table_data)
+        candidates = predicate.candidate_positions(table_data)
+        scanned = len(table_data)
+        if candidates is not None:
+            scan_kind = "index_lookups"
+            scanned = len(candidates)
+        elif predicate.terms is not None:
+            candidates = scan_positions(table_data, predicate.terms)
+            if candidates is not None:
+                # колоночный просмотр уже проверил все условия
+                scan_kind = "columnar_scans"
+                test = None
+        if candidates is None and limit is None:
+            candidates = parallel_positions(table_data, predicate)
+            if candidates is not None:
+                scan_kind = "parallel_scans"
+                test = None
+        if candidates is None:
+            # записи считаются по ходу: с limit просмотр может закончиться раньше
+            scanned = itertools.count()
+            rows = (row for row, _ in zip(live_rows(table_data), scanned) if test(row))
+        elif test is None:
+            rows = (table_data[pos] for pos in live_positions(table_data, candidates))
+        else:
+            rows = (
+                table_data[pos]
+                for pos in live_positions(table_data, candidates)
+                if test(table_data[pos])
+            )
+    increment(scan_kind)
+
+    stop = None if limit is None else offset + limit
+    return islice(_counted(rows, scanned), offset, stop)
+
+
+def _counted(rows, scanned):
+    """Выдаёт rows и в конце добавляет в метрики, сколько записей подошло и
+    сколько просмотрено. scanned — число, itertools.count, отсчитавший
+    записи по ходу просмотра, или None — столько же, сколько подошло."""
+    matched = 0
+    try:
+        for row in rows:
+            matched += 1
+            yield row
+    finally:
+        if scanned is None:
+            scanned = matched
+        elif not isinstance(scanned, int):
+            scanned = next(scanned)
+        increment("rows_scanned", scanned)
+        increment("rows_matched", matched)
 
 
 @handle_db_errors
+@log_time
 def update(table_data, set_clause, where_clause):
-    updated = 0
-    for row in table_data:
-        ok = True
-        for k, v in where_clause.items():
-            if row.get(k) != v:
-                ok = False
-                break
-        if ok:
-            for k, v in set_clause.items():
-                row[k] = v
-            updated += 1
-
-    if updated > 0:
-        _reset_select_cache()
-    return table_data, updated
+    """Изменяет подходящие записи за один проход.
+
+    Возвращает (table_data, список ID изменённых записей). ID изменять
+    нельзя: новые ID выдаются только счётчиком table_data.sequence.
+    """
+    if "ID" in set_clause:
+        raise ValidationError("Некорректное значение: ID.")
+    updated_ids = []
+    layout = table_data.layout
+    for pos in _matching_positions(table_data, where_clause):
+        index_remove(table_data, pos, set_clause)
+        row = table_data[pos]
+        updated_ids.append(row[ID_POS])
+        table_data[pos] = replace_values(row, layout, set_clause)
+        index_add(table_data, pos, set_clause)
+        column_set(table_data, pos, set_clause)
+
+    if updated_ids:
+        _table_changed(getattr(table_data, "name", None))
+    return table_data, updated_ids
 
 
 @handle_db_errors
 @confirm_action("удаление записи")
+@log_time
 def delete(table_data, where_clause):
-    new_data = []
-    deleted = 0
-    for row in table_data:
-        ok = True
-        for k, v in where_clause.items():
-            if row.get(k) != v:
-                ok = False
-                break
-        if ok:
-            deleted += 1
+    """Удаляет подходящие записи за один проход.
+
+    Записи не сдвигаются, а помечаются удалёнными (см. tombstones.py);
+    место освобождает vacuum. Возвращает (table_data, список ID удалённых
+    записей).
+    """
+    positions = _matching_positions(table_data, where_clause)
+    deleted_ids = [table_data[pos][ID_POS] for pos in positions]
+    if not deleted_ids:
+        return table_data, deleted_ids
+
+    if not hasattr(table_data, "dead"):
+        # обычный список записей без карты удалённых — сдвигаем на месте
+        remove_positions(table_data, positions)
+        reset_indexes(table_data)
+        reset_columns(table_data)
+    else:
+        indexes = getattr(table_data, "indexes", {})
+        if len(positions) * 8 > len(table_data):
+            # удалена заметная часть таблицы — дешевле построить индексы заново
+            reset_indexes(table_data)
         else:
-            new_data.append(row)
-    
-    if deleted > 0:
-        _reset_select_cache()
-    return new_data, deleted
+            for pos in positions:
+                index_remove(table_data, pos, list(indexes))
+        mark_dead(table_data, positions)
+    _table_changed(getattr(table_data, "name", None))
+    return table_data, deleted_ids
+
+
+def vacuum(table_data):
+    """Убирает помеченные удалёнными записи; возвращает их число."""
+    reclaimed = compact_rows(table_data)
+    if reclaimed:
+        reset_indexes(table_data)
+        reset_columns(table_data)
+    return reclaimed
 
 
 def table_info(metadata, table_name, table_data):
     if table_name not in metadata:
-        raise ValueError(f'Таблица "{table_name}" не существует.')
+        raise TableNotFoundError(table_name)
 
     cols = metadata[table_name]
     columns_str = ", ".join([f'{c["name"]}:{c["type"]}' for c in cols])
-    count = len(table_data)
-    return columns_str, count
\ No newline at end of file
+    count = live_count(table_data)
+    dead = dead_count(table_data)
+    indexes = indexed_columns(metadata, table_name)
+    indexes_str = ", ".join([f"{name} ({kind})" for name, kind in indexes.items()])
+    return columns_str, count, dead, indexes_str
\ No newline at end of file
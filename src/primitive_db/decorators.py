@@ -1,11 +1,33 @@
+import sys
+import threading
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
 
+from src.primitive_db.metrics import record_latency
+
+# Python API (api.py): внутри raise_db_errors() ошибки не печатаются, а
+# поднимаются дальше, и подтверждения не запрашиваются
+_api_calls = threading.local()
+
+
+@contextmanager
+def raise_db_errors():
+    previous = getattr(_api_calls, "active", False)
+    _api_calls.active = True
+    try:
+        yield
+    finally:
+        _api_calls.active = previous
+
 
 def handle_db_errors(func):
 
     @wraps(func)
     def wrapper(*args, **kwargs):
+        if getattr(_api_calls, "active", False):
+            return func(*args, **kwargs)
         try:
             return func(*args, **kwargs)
         except FileNotFoundError:
@@ -26,11 +48,22 @@ def handle_db_errors(func):
     return wrapper
 
 
+# В пакетном режиме (database --script ...) подтверждения не запрашиваются
+_confirmations_enabled = True
+
+
+def set_confirmations(enabled):
+    global _confirmations_enabled
+    _confirmations_enabled = enabled
+
+
 def confirm_action(action_name):
 
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
+            if not _confirmations_enabled or getattr(_api_calls, "active", False):
+                return func(*args, **kwargs)
             prompt_text = f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: '
             answer = input(prompt_text).strip().lower()
             if answer != "y":
@@ -43,28 +76,94 @@ def confirm_action(action_name):
     return decorator
 
 
+# Вывод времени выполнения на экран (database --timing или команда timing on);
+# замеры в metrics.py собираются всегда
+_timing_output = False
+
+
+def set_timing_output(enabled):
+    global _timing_output
+    _timing_output = enabled
+
+
 def log_time(func):
 
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start = time.monotonic()
-        result = func(*args, **kwargs)
-        elapsed = time.monotonic() - start
-        print(f"Функция {func.__name__} выполнилась за {elapsed:.3f} секунд")
-        return result
-    
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            record_latency(func.__name__, elapsed)
+            if _timing_output:
+                print(f"Функция {func.__name__} выполнилась за {elapsed:.3f} секунд")
+
     return wrapper
 
 
-def create_cacher():
+def _approx_size(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, list) and value:
+        # записи в результате разделяются с таблицей, но если таблицу
+        # перечитают, кэш будет удерживать их сам — считаем и их
+        size += len(value) * sys.getsizeof(value[0])
+    return size
+
+
+def create_cacher(max_entries=256, max_bytes=64 * 1024 * 1024):
+    """Кэш результатов с вытеснением давно не использованных записей (LRU).
 
-    cache = {}
+    Размер ограничен числом записей и примерным объёмом в байтах. Ключ —
+    кортеж, первый элемент которого (например, имя таблицы) используется
+    для точечного сброса через cache_result.invalidate(...).
+
+    Кэшем можно пользоваться из нескольких потоков (режим сервера): учёт
+    защищён блокировкой, а value_func вычисляется без неё.
+    """
+
+    lock = threading.Lock()
+    cache = OrderedDict()
+    sizes = {}
+    stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "bytes": 0}
 
     def cache_result(key, value_func):
-        if key in cache:
-            return cache[key]
+        with lock:
+            if key in cache:
+                cache.move_to_end(key)
+                stats["hits"] += 1
+                return cache[key]
+            stats["misses"] += 1
+
         value = value_func()
-        cache[key] = value
+        size = _approx_size(value)
+        if size > max_bytes:
+            return value
+
+        with lock:
+            if key in cache:
+                # пока считали, тот же результат положил другой поток
+                stats["bytes"] -= sizes[key]
+            cache[key] = value
+            sizes[key] = size
+            stats["bytes"] += size
+            while len(cache) > max_entries or stats["bytes"] > max_bytes:
+                old_key, _ = cache.popitem(last=False)
+                stats["bytes"] -= sizes.pop(old_key)
+                stats["evictions"] += 1
         return value
 
+    def invalidate(prefix):
+        with lock:
+            for key in [k for k in cache if k[0] == prefix]:
+                del cache[key]
+                stats["bytes"] -= sizes.pop(key)
+                stats["invalidations"] += 1
+
+    def cache_stats():
+        with lock:
+            return {**stats, "entries": len(cache)}
+
+    cache_result.invalidate = invalidate
+    cache_result.stats = cache_stats
     return cache_result
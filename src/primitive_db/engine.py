@@ -1,28 +1,83 @@
+import csv
+import json
+import re
 import shlex
+import sys
+from itertools import islice
 from pathlib import Path
 
-import prompt
-from prettytable import PrettyTable
-
+from src.primitive_db.aggregates import aggregate_label, parse_aggregates
 from src.primitive_db.core import (
     _parse_value,
+    aggregate,
+    create_index,
     create_table,
     delete,
+    drop_index,
     drop_table,
     insert,
+    insert_many,
+    invalidate_table_cache,
+    iter_select,
     list_tables,
     select,
+    select_cache_stats,
     table_info,
     update,
 )
-from src.primitive_db.utils import (
-    load_metadata,
-    load_table_data,
-    save_metadata,
-    save_table_data,
+from src.primitive_db.decorators import (
+    handle_db_errors,
+    set_confirmations,
+    set_timing_output,
+)
+from src.primitive_db.errors import StorageError, TableNotFoundError
+from src.primitive_db.expressions import parse_where
+from src.primitive_db.importer import IMPORT_CHUNK_ROWS, iter_import_chunks
+from src.primitive_db.indexes import Range
+from src.primitive_db.joins import hash_join, parse_join
+from src.primitive_db.metrics import export_json
+from src.primitive_db.metrics import reset as reset_metrics
+from src.primitive_db.metrics import snapshot as metrics_snapshot
+from src.primitive_db.parallel import (
+    parallel_min_rows,
+    parallel_workers,
+    set_parallel,
 )
+from src.primitive_db.table_manager import DURABILITY_LEVELS, TableManager
+from src.primitive_db.tombstones import live_count
+from src.primitive_db.utils import needs_migration, table_file_size
 
 META_FILE = "db_meta.json"
+# команды, перед которыми не нужно читать db_meta.json (см. run)
+METADATA_FREE_COMMANDS = frozenset(
+    {
+        "exit",
+        "help",
+        "timing",
+        "stats",
+        "cache_stats",
+        "parallel",
+        "durability",
+        "sync",
+        "commit",
+        "flush",
+    }
+)
+
+_SELECT_OPTIONS_RE = re.compile(
+    r"^(.*?)(?:\s+limit\s+(\d+)(?:\s+offset\s+(\d+))?)?"
+    r"(?:\s+format\s+(table|csv|jsonl))?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+_AGGREGATE_QUERY_RE = re.compile(
+    r"^\s*select\s+(.+?)\s+from\s+(\S+)(?:\s+where\s+(.+?))?"
+    r"(?:\s+group\s+by\s+(\S+))?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# сколько строк выводить одной таблицей в select
+SELECT_PAGE_ROWS = 100
 
 
 def print_help():
@@ -33,12 +88,81 @@ def print_help():
         "- создать таблицу"
     )
     print("<command> list_tables - показать список всех таблиц")
+    print("<command> cache_stats - статистика кэша запросов select")
+    print(
+        "<command> stats [json [файл]|reset] - задержки операций и счётчики "
+        "(вывести, выгрузить в JSON, сбросить)"
+    )
+    print(
+        "<command> select count(*)|sum|min|max|avg(<столбец>), ... from "
+        "<имя_таблицы> [where ...] [group by <столбец>] - агрегаты по таблице"
+    )
+    print(
+        "<command> select from <таблица1> join <таблица2> on <таблица1.столбец> = "
+        "<таблица2.столбец> [where ...] - соединение двух таблиц"
+    )
+    print("<command> timing on|off - выводить время выполнения операций")
+    print(
+        "<command> parallel on [число_процессов] [порог_записей]|off - "
+        "параллельный просмотр больших таблиц"
+    )
     print("<command> drop_table <имя_таблицы> - удалить таблицу")
+    print(
+        "<command> create_index <имя_таблицы> <столбец> [hash|sorted] "
+        "- создать индекс по столбцу"
+    )
+    print("<command> drop_index <имя_таблицы> <столбец> - удалить индекс")
+    print(
+        "<command> compact <имя_таблицы> - свернуть журнал изменений "
+        "таблицы в новый снимок"
+    )
+    print(
+        "<command> vacuum <имя_таблицы> - убрать удалённые записи и сжать "
+        "файл таблицы"
+    )
+    print(
+        "<command> migrate [<имя_таблицы> ...] - переписать файлы таблиц "
+        "старого формата (записи-словари) в компактном формате"
+    )
+    print(
+        "<command> convert <имя_таблицы> binary|json - сменить формат файла таблицы"
+    )
+    print(
+        "<command> import <имя_таблицы> <файл.csv|файл.jsonl> "
+        "- загрузить записи из файла"
+    )
+    print("<command> begin - начать транзакцию")
+    print("<command> commit - записать накопленные изменения на диск")
+    print("<command> sync - записать изменения на диск и дождаться fsync")
+    print(
+        "<command> durability [none|batch|strict] - режим записи на диск "
+        "(без аргумента — текущий)"
+    )
+    print("<command> rollback - отменить изменения транзакции")
     print("\nОбщие команды:")
     print("<command> exit - выход из программы")
     print("<command> help - справочная информация\n")
 
 
+def print_stats():
+    from prettytable import PrettyTable
+
+    stats = metrics_snapshot()
+    latency = PrettyTable()
+    latency.field_names = ["операция", "вызовов", "p50", "p95", "p99", "max"]
+    for operation, summary in stats.pop("latency").items():
+        latency.add_row(
+            [operation, summary["count"]]
+            + [f"{summary[k] * 1000:.3f} мс" for k in ("p50", "p95", "p99", "max")]
+        )
+    print(latency)
+    for name, value in stats.pop("counters").items():
+        print(f"{name}: {value}")
+    # остальное — статистика подключённых источников (кэш select и т.п.)
+    for source, values in stats.items():
+        print(f"{source}: " + ", ".join(f"{k}={v}" for k, v in values.items()))
+
+
 def get_col_type(metadata, table_name, col_name):
     cols = metadata.get(table_name)
     if not cols:
@@ -65,339 +189,932 @@ def parse_simple_condition(text):
     return left.strip(), right.strip()
 
 
-def safe_load_table_data(table_name):
-    try:
-        return load_table_data(table_name)
-    except FileNotFoundError:
-        print(
-            "Ошибка: файл данных не найден. Возможно, база данных не инициализирована."
-        )
-        return None
+def split_values_tuples(text):
+    """Разбирает '(v1, v2), (v3, v4)' в [['v1', 'v2'], ['v3', 'v4']].
+
+    Запятые и скобки внутри строк в кавычках не считаются разделителями,
+    кавычки у значений сохраняются.
+    """
+    tuples = []
+    current = None
+    token = []
+    in_quotes = False
+    for ch in text:
+        if in_quotes:
+            token.append(ch)
+            if ch == '"':
+                in_quotes = False
+        elif ch == '"':
+            if current is None:
+                raise ValueError(f"Некорректное значение: {text}.")
+            in_quotes = True
+            token.append(ch)
+        elif ch == "(":
+            if current is not None:
+                raise ValueError(f"Некорректное значение: {text}.")
+            current = []
+            token = []
+        elif ch == ")":
+            if current is None:
+                raise ValueError(f"Некорректное значение: {text}.")
+            value = "".join(token).strip()
+            if value or current:
+                current.append(value)
+            tuples.append(current)
+            current = None
+        elif current is not None:
+            if ch == ",":
+                current.append("".join(token).strip())
+                token = []
+            else:
+                token.append(ch)
+        elif ch != "," and not ch.isspace():
+            raise ValueError(f"Некорректное значение: {text}.")
 
+    if in_quotes or current is not None:
+        raise ValueError(f"Некорректное значение: {text}.")
+    return tuples
 
-def run():
-    print("***База данных***")
-    print_help()
 
-    metadata = load_metadata(META_FILE)
+def literal_converter(typ):
+    """Конвертер значения из команды в тип столбца (строится один раз)."""
 
-    while True:
+    def convert(raw_value):
+        return convert_literal(raw_value, typ)
 
-        user_input = prompt.string(">>>Введите команду: ")
-        if not user_input.strip():
-            continue
-        
-        try:
-            args = shlex.split(user_input)
-        except ValueError:
-            print("Некорректное значение: введенная строка. Попробуйте снова.")
-            continue
+    return convert
 
-        command = args[0]
 
-        if command == "exit":
-            break
+def record_inserted(tables, table_name, table_data, count):
+    """Передаёт в журнал последние count добавленных записей порциями."""
+    rows = table_data[len(table_data) - count:]
+    records = [
+        {"op": "b", "rows": rows[i:i + IMPORT_CHUNK_ROWS]}
+        for i in range(0, count, IMPORT_CHUNK_ROWS)
+    ]
+    tables.record(table_name, records, count)
 
-        if command == "help":
-            print_help()
-            continue
 
-        if command == "list_tables":
-            tables = list_tables(metadata)
-            for t in tables:
-                print(f"- {t}")
-            continue
+def split_select_options(text):
+    """Отделяет от select хвост "limit N [offset M] [format table|csv|jsonl]".
 
-        if command == "drop_table":
-            if len(args) != 2:
-                print("Некорректное значение: drop_table. Попробуйте снова.")
-                continue
-            
-            table_name = args[1]
-            res = drop_table(metadata, table_name)
-            if res is None:
-                continue
+    Возвращает (запрос без хвоста, limit или None, offset, формат вывода).
+    """
+    m = _SELECT_OPTIONS_RE.match(text)
+    limit = int(m.group(2)) if m.group(2) is not None else None
+    offset = int(m.group(3)) if m.group(3) is not None else 0
+    output_format = (m.group(4) or "table").lower()
+    return m.group(1), limit, offset, output_format
 
-            metadata = res
-            save_metadata(META_FILE, metadata)
 
-            data_path = Path("data") / f"{table_name}.json"
-            if data_path.exists():
-                data_path.unlink()
-            
-            print(f'Таблица "{table_name}" успешно удалена.')
-            continue
+def match_aggregate_query(query):
+    """Части агрегатного запроса (без хвоста limit/offset): (список
+    агрегатов, таблица, текст where или None, столбец group by или None)
+    или None, если запрос не агрегатный."""
+    m = _AGGREGATE_QUERY_RE.match(query)
+    return None if m is None else m.groups()
 
-        if command == "create_table":
-            if len(args) < 3:
-                print("Некорректное значение: create_table. Попробуйте снова.")
-                continue
 
-            table_name = args[1]
-            columns = []
+def print_rows(cols, rows, output_format="table"):
+    """Выводит записи по мере получения, не собирая весь результат в памяти.
 
-            for token in args[2:]:
-                if ":" not in token:
-                    print(f"Некорректное значение: {token}. Попробуйте снова.")
-                    columns = None
-                    break
-                name, typ = token.split(":", 1)
-                columns.append((name, typ))
-            
-            if columns is None:
-                continue
+    rows — кортежи значений в порядке cols (см. rows.py).
 
-            metadata2 = create_table(metadata, table_name, columns)
-            if metadata2 is None:
-                continue
+    table — таблицами PrettyTable по SELECT_PAGE_ROWS строк,
+    csv и jsonl — построчно в stdout (удобно перенаправлять в файл).
+    """
+    rows = iter(rows)
+    if output_format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(cols)
+        for row in rows:
+            writer.writerow(row)
+        return
+    if output_format == "jsonl":
+        for row in rows:
+            print(json.dumps(dict(zip(cols, row)), ensure_ascii=False))
+        return
 
-            metadata = metadata2
-            save_metadata(META_FILE, metadata)
+    # PrettyTable нужен только табличному выводу: не замедляем запуск
+    from prettytable import PrettyTable
 
-            print(f'Таблица "{table_name}" успешно создана.')
-            continue
+    first = True
+    while True:
+        page = list(islice(rows, SELECT_PAGE_ROWS))
+        if not page and not first:
+            break
+        t = PrettyTable()
+        t.field_names = cols
+        for row in page:
+            t.add_row(list(row))
+        print(t)
+        first = False
+        if len(page) < SELECT_PAGE_ROWS:
+            break
 
-        if command == "info":
-            if len(args) != 2:
-                print("Некорректное значение: info. Попробуйте снова.")
-                continue
 
-            table_name = args[1]
+def select_aggregates(tables, metadata, user_input):
+    """select count(*)|sum|min|max|avg(col), ... from t [where ...] [group by col]."""
+    query, limit, offset, output_format = split_select_options(user_input)
+    parts = match_aggregate_query(query)
+    if parts is None:
+        print("Некорректное значение: select. Попробуйте снова.")
+        return
+    select_list, table_name, where_text, group_by = parts
+    if table_name not in metadata:
+        print(f'Ошибка: Таблица "{table_name}" не существует.')
+        return
 
-            table_data = safe_load_table_data(table_name)
-            if table_data is None:
-                continue
+    schema = {c["name"]: c["type"] for c in metadata[table_name]}
+    try:
+        if group_by is not None and group_by not in schema:
+            raise ValueError(f"Некорректное значение: {group_by}.")
+        aggregates = parse_aggregates(select_list, schema, group_by)
+        where_clause = None
+        if where_text is not None:
+            where_clause = build_where_clause(metadata, table_name, where_text)
+    except ValueError as e:
+        print(f"{e} Попробуйте снова.")
+        return
+
+    cols = [] if group_by is None else [group_by]
+    cols += [aggregate_label(a) for a in aggregates]
+    stop = None if limit is None else offset + limit
+
+    # двоичная таблица, ещё не загруженная в память, считается прямо по файлу
+    mapped = tables.peek(table_name) if where_clause is None else None
+    if mapped is not None:
+        with mapped:
+            rows = aggregate(mapped, aggregates, None, group_by)
+            print_rows(cols, islice(rows, offset, stop), output_format)
+        return
+
+    table_data = safe_load_table_data(tables, metadata, table_name)
+    if table_data is None:
+        return
+    rows = aggregate(table_data, aggregates, where_clause, group_by)
+    if rows is not None:
+        print_rows(cols, islice(rows, offset, stop), output_format)
+
+
+def select_join(tables, metadata, user_input):
+    """select from a join b on a.col = b.col [where ...] (см. joins.py)."""
+    query, limit, offset, output_format = split_select_options(user_input)
+    try:
+        join = parse_join(query, metadata, convert_literal)
+    except TableNotFoundError as e:
+        print(f"Ошибка: {e}")
+        return
+    except ValueError as e:
+        print(f"{e} Попробуйте снова.")
+        return
 
-            res = table_info(metadata, table_name, table_data)
-            if res is None:
-                continue
+    tables_data = []
+    for table_name in join.tables:
+        table_data = safe_load_table_data(tables, metadata, table_name)
+        if table_data is None:
+            return
+        tables_data.append(table_data)
 
-            cols_str, count = res
-            print(f'Таблица "{table_name}"')
-            print(f"Столбцы: {cols_str}")
-            print(f"Количество записей: {count}")
-            continue
+    stop = None if limit is None else offset + limit
+    rows = islice(hash_join(tables_data, join), offset, stop)
+    print_rows(join.columns, rows, output_format)
 
-        if command == "insert":
 
-            if len(args) < 5 or args[1] != "into":
-                print("Некорректное значение: insert. Попробуйте снова.")
-                continue
+def build_where_clause(metadata, table_name, where_text):
+    """Условие where в виде скомпилированного предиката (см. expressions.py)."""
+    schema = {c["name"]: c["type"] for c in metadata.get(table_name, [])}
+    return parse_where(where_text, schema, convert_literal)
 
-            table_name = args[2]
-            
-            # восстанавливаем "values (...)" из исходной строки,
-            # чтобы вытащить то, что в скобках
-            lower = user_input.lower()
-            pos = lower.find("values")
-            if pos == -1:
-                print("Некорректное значение: values. Попробуйте снова.")
-                continue
 
-            values_part = user_input[pos + len("values"):].strip()
-            if not (values_part.startswith("(") and values_part.endswith(")")):
-                print("Некорректное значение: values. Попробуйте снова.")
-                continue
+def convert_literal(raw_value, typ):
+    return _parse_value(normalize_value_for_core(raw_value, typ), typ)
 
-            inside = values_part[1:-1].strip()
 
-            raw_values = [v.strip() for v in inside.split(",")] if inside else []
+def id_lookup_value(where_clause):
+    """Значение ID, если условие — ровно "ID = <число>", иначе None."""
+    if where_clause is None or where_clause.terms is None:
+        return None
+    if list(where_clause.terms) != ["ID"]:
+        return None
+    value = where_clause.terms["ID"]
+    return None if isinstance(value, Range) else value
 
-            table_data = safe_load_table_data(table_name)
-            if table_data is None:
-                continue
 
-            # подгоняем строки под core.py (для str добавим кавычки,
-            # если shlex их убрал)
-            try:
-                user_columns = [
-                c for c in metadata[table_name]
-                if c["name"] != "ID"
-            ]
-            except KeyError:
-                print(f'Ошибка: Таблица "{table_name}" не существует.')
-                continue
+@handle_db_errors
+def convert_table(tables, metadata, table_name, binary):
+    return tables.convert(metadata, table_name, binary)
 
-            if len(raw_values) != len(user_columns):
-                print("Некорректное значение: values. Попробуйте снова.")
-                continue
 
-            normalized_values = []
-            for i, col in enumerate(user_columns):
-                normalized_values.append(
-                    normalize_value_for_core(raw_values[i], col["type"])
-                )
+def safe_load_table_data(tables, metadata, table_name):
+    try:
+        return tables.get(metadata, table_name)
+    except FileNotFoundError:
+        print(
+            "Ошибка: файл данных не найден. Возможно, база данных не инициализирована."
+        )
+        return None
 
-            res = insert(metadata, table_name, table_data, normalized_values)
-            if res is None:
-                continue
 
-            table_data, new_id = res
-            save_table_data(table_name, table_data)
-            print(f'Запись с ID={new_id} успешно добавлена в таблицу "{table_name}".')
+def write_tables(write):
+    """Выполняет flush, commit или sync пула таблиц; ошибку записи на диск
+    печатает. Возвращает, удалась ли запись."""
+    try:
+        write()
+    except StorageError as e:
+        print(f"Ошибка: {e}")
+        return False
+    return True
+
+
+def read_script(lines):
+    """Команды из файла сценария: пустые строки и комментарии (# или --)
+    пропускаются, завершающая ";" отбрасывается."""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or line.startswith("--"):
             continue
+        yield line.rstrip(";").strip()
 
-        if command == "select":
-            if len(args) < 3 or args[1] != "from":
-                print("Некорректное значение: select. Попробуйте снова.")
-                continue
 
-            table_name = args[2]
+def execute(tables, metadata, user_input):
+    """Выполняет одну команду. Возвращает False, если это exit.
 
-            table_data = safe_load_table_data(table_name)
-            if table_data is None:
-                continue
+    tables — пул таблиц (TableManager), metadata изменяется на месте.
+    """
+    if not user_input.strip():
+        return True
 
-            where_clause = None
-            lower = user_input.lower()
-            idx = lower.find(" where ")
-            if idx != -1:
-                where_text = user_input[idx + len(" where "):].strip()            
-            
+    try:
+        args = shlex.split(user_input)
+    except ValueError:
+        print("Некорректное значение: введенная строка. Попробуйте снова.")
+        return True
+
+    command = args[0]
+
+    if command == "exit":
+        return False
+
+    if command == "begin":
+        if tables.in_transaction:
+            print("Транзакция уже начата.")
+            return True
+        if write_tables(tables.begin):
+            print("Транзакция начата.")
+        return True
+
+    if command in ("commit", "flush"):
+        if write_tables(tables.commit):
+            print("Изменения записаны на диск.")
+        return True
+
+    if command == "sync":
+        if tables.in_transaction:
+            print("Транзакция не завершена: выполните commit или rollback.")
+            return True
+        if write_tables(tables.sync):
+            print("Изменения записаны на диск (fsync).")
+        return True
+
+    if command == "durability":
+        if len(args) == 1:
+            print(f"Режим записи: {tables.durability}.")
+            return True
+        if len(args) != 2 or args[1] not in DURABILITY_LEVELS:
+            print("Некорректное значение: durability. Попробуйте снова.")
+            return True
+        if tables.in_transaction:
+            print("Транзакция не завершена: выполните commit или rollback.")
+            return True
+        if write_tables(lambda: tables.set_durability(args[1])):
+            print(f"Режим записи: {args[1]}.")
+        return True
+
+    if command == "rollback":
+        if not tables.in_transaction:
+            print("Нет активной транзакции.")
+            return True
+        for table_name in tables.rollback():
+            invalidate_table_cache(table_name)
+        metadata.clear()
+        metadata.update(tables.load_metadata())
+        print("Изменения транзакции отменены.")
+        return True
+
+    if command == "help":
+        print_help()
+        return True
+
+    if command == "cache_stats":
+        stats = select_cache_stats()
+        print(f"Записей в кэше: {stats['entries']}")
+        print(f"Примерный объём: {stats['bytes']} байт")
+        print(f"Попадания: {stats['hits']}")
+        print(f"Промахи: {stats['misses']}")
+        print(f"Вытеснено: {stats['evictions']}")
+        print(f"Сброшено после изменений: {stats['invalidations']}")
+        return True
+
+    if command == "stats":
+        if len(args) == 1:
+            print_stats()
+        elif args[1] == "json" and len(args) <= 3:
+            text = export_json(args[2] if len(args) == 3 else None)
+            if len(args) == 3:
+                print(f"Метрики сохранены в {args[2]}.")
+            else:
+                print(text)
+        elif args[1] == "reset" and len(args) == 2:
+            reset_metrics()
+            print("Метрики сброшены.")
+        else:
+            print("Некорректное значение: stats. Попробуйте снова.")
+        return True
+
+    if command == "timing":
+        if len(args) != 2 or args[1] not in ("on", "off"):
+            print("Некорректное значение: timing. Попробуйте снова.")
+            return True
+        set_timing_output(args[1] == "on")
+        return True
+
+    if command == "parallel":
+        if len(args) == 2 and args[1] == "off":
+            set_parallel(0)
+            print("Параллельный просмотр выключен.")
+        elif args[1:2] == ["on"] and len(args) <= 4:
+            # parallel on [число_процессов] [порог_записей]
+            # процессов нужно хотя бы два, порог — от одной записи
+            values = []
+            for raw, minimum in zip(args[2:], (2, 1)):
                 try:
-                    col, raw_val = parse_simple_condition(where_text)
-                except ValueError as e:
-                    print(f"{e} Попробуйте снова.")
-                    continue
-
-                typ = get_col_type(metadata, table_name, col)
-                if typ is None:
-                    print(f"Некорректное значение: {col}. Попробуйте снова.")
-                    continue
-
-                raw_val = normalize_value_for_core(raw_val, typ)
-                where_clause = {col: _parse_value(raw_val, typ)}
-
-            rows = select(table_data, where_clause)
-            if rows is None:
-                continue
-            
-            try:
-                cols = [c["name"] for c in metadata[table_name]]
-            except KeyError:
+                    value = int(raw)
+                except ValueError:
+                    value = 0
+                if value < minimum:
+                    print(f"Некорректное значение: {raw}. Попробуйте снова.")
+                    return True
+                values.append(value)
+            values += [None] * (2 - len(values))
+            set_parallel(*values)
+            if not parallel_workers():
+                print("Параллельный просмотр недоступен: на машине одно ядро.")
+                return True
+            print(
+                f"Параллельный просмотр включён (процессов: {parallel_workers()}, "
+                f"таблицы от {parallel_min_rows()} записей)."
+            )
+        else:
+            print("Некорректное значение: parallel. Попробуйте снова.")
+        return True
+
+    if command == "migrate":
+        if tables.in_transaction:
+            print("Ошибка: migrate нельзя выполнить внутри транзакции.")
+            return True
+        names = args[1:] or list(metadata)
+        migrated = 0
+        for table_name in names:
+            if table_name not in metadata:
                 print(f'Ошибка: Таблица "{table_name}" не существует.')
                 continue
+            if needs_migration(table_name):
+                tables.compact(metadata, table_name)
+                print(f'Таблица "{table_name}" переписана в новом формате.')
+                migrated += 1
+        if not migrated:
+            print("Таблиц в старом формате нет.")
+        return True
+
+    if command == "list_tables":
+        for t in list_tables(metadata):
+            print(f"- {t}")
+        return True
+
+    if command == "drop_table":
+        if len(args) != 2:
+            print("Некорректное значение: drop_table. Попробуйте снова.")
+            return True
+
+        table_name = args[1]
+        res = drop_table(metadata, table_name)
+        if res is None:
+            return True
+
+        metadata = res
+        tables.save_metadata(metadata)
+
+        tables.drop(table_name)
+
+        print(f'Таблица "{table_name}" успешно удалена.')
+        return True
+
+    if command == "create_table":
+        if len(args) < 3:
+            print("Некорректное значение: create_table. Попробуйте снова.")
+            return True
+
+        table_name = args[1]
+        columns = []
+
+        for token in args[2:]:
+            if ":" not in token:
+                print(f"Некорректное значение: {token}. Попробуйте снова.")
+                columns = None
+                break
+            name, typ = token.split(":", 1)
+            columns.append((name, typ))
+
+        if columns is None:
+            return True
+
+        metadata2 = create_table(metadata, table_name, columns)
+        if metadata2 is None:
+            return True
+
+        metadata = metadata2
+        tables.save_metadata(metadata)
+
+        print(f'Таблица "{table_name}" успешно создана.')
+        return True
+
+    if command in ("create_index", "drop_index"):
+        if len(args) != 3 and not (command == "create_index" and len(args) == 4):
+            print(f"Некорректное значение: {command}. Попробуйте снова.")
+            return True
+
+        table_name, column = args[1], args[2]
+        if command == "create_index":
+            kind = args[3] if len(args) == 4 else "hash"
+            res = create_index(metadata, table_name, column, kind)
+        else:
+            res = drop_index(metadata, table_name, column)
+        if res is None:
+            return True
+
+        metadata = res
+        tables.save_metadata(metadata)
+        tables.refresh_schema(metadata, table_name)
+
+        if command == "create_index":
+            print(f'Индекс по столбцу "{column}" таблицы "{table_name}" создан.')
+        else:
+            print(f'Индекс по столбцу "{column}" таблицы "{table_name}" удалён.')
+        return True
+
+    if command == "convert":
+        if len(args) != 3 or args[2] not in ("binary", "json"):
+            print("Некорректное значение: convert. Попробуйте снова.")
+            return True
+
+        table_name = args[1]
+        if table_name not in metadata:
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+        if tables.in_transaction:
+            print("Ошибка: convert нельзя выполнить внутри транзакции.")
+            return True
+
+        res = convert_table(tables, metadata, table_name, args[2] == "binary")
+        if res is None:
+            return True
+        print(f'Таблица "{table_name}" сохранена в формате {args[2]}.')
+        return True
+
+    if command == "compact":
+        if len(args) != 2:
+            print("Некорректное значение: compact. Попробуйте снова.")
+            return True
+
+        table_name = args[1]
+        if table_name not in metadata:
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+
+        if tables.in_transaction:
+            print("Ошибка: compact нельзя выполнить внутри транзакции.")
+            return True
+
+        table_data = tables.compact(metadata, table_name)
+        print(f'Журнал таблицы "{table_name}" свёрнут в снимок.')
+        print(f"Количество записей: {live_count(table_data)}")
+        return True
+
+    if command == "vacuum":
+        if len(args) != 2:
+            print("Некорректное значение: vacuum. Попробуйте снова.")
+            return True
+
+        table_name = args[1]
+        if table_name not in metadata:
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+
+        if tables.in_transaction:
+            print("Ошибка: vacuum нельзя выполнить внутри транзакции.")
+            return True
+
+        table_data, reclaimed = tables.vacuum(metadata, table_name)
+        print(f'Таблица "{table_name}" сжата.')
+        print(f"Убрано удалённых записей: {reclaimed}")
+        print(f"Размер на диске: {table_file_size(table_name)} байт")
+        return True
+
+    if command == "info":
+        if len(args) != 2:
+            print("Некорректное значение: info. Попробуйте снова.")
+            return True
+
+        table_name = args[1]
+
+        mapped = tables.peek(table_name)
+        if mapped is not None:
+            # число записей известно из заголовка двоичного файла
+            with mapped:
+                res = table_info(metadata, table_name, mapped)
+        else:
+            table_data = safe_load_table_data(tables, metadata, table_name)
+            if table_data is None:
+                return True
+            res = table_info(metadata, table_name, table_data)
+        if res is None:
+            return True
+
+        cols_str, count, dead, indexes_str = res
+        print(f'Таблица "{table_name}"')
+        print(f"Столбцы: {cols_str}")
+        print(f"Количество записей: {count}")
+        print(f"Удалённых записей (до vacuum): {dead}")
+        print(f"Размер на диске: {table_file_size(table_name)} байт")
+        print(f"Индексы: {indexes_str}")
+        return True
+
+    if command == "insert":
+
+        if len(args) < 5 or args[1] != "into":
+            print("Некорректное значение: insert. Попробуйте снова.")
+            return True
+
+        table_name = args[2]
+
+        # восстанавливаем "values (...)" из исходной строки,
+        # чтобы вытащить то, что в скобках
+        lower = user_input.lower()
+        pos = lower.find("values")
+        if pos == -1:
+            print("Некорректное значение: values. Попробуйте снова.")
+            return True
+
+        values_part = user_input[pos + len("values"):].strip()
+        try:
+            tuples = split_values_tuples(values_part)
+        except ValueError:
+            tuples = []
+        if not tuples:
+            print("Некорректное значение: values. Попробуйте снова.")
+            return True
 
-            t = PrettyTable()
-            t.field_names = cols
-            for row in rows:
-                t.add_row([row.get(c) for c in cols])
-            print(t)
-            continue
-
-        if command == "update":
-            if len(args) < 6 or args[2] != "set":
-                print("Некорректное значение: update. Попробуйте снова.")
-                continue
-
-            table_name = args[1]
-
-            lower = user_input.lower()
-            set_idx = lower.find(" set ")
-            where_idx = lower.find(" where ")
-            if set_idx == -1 or where_idx == -1 or where_idx < set_idx:
-                print("Некорректное значение: update. Попробуйте снова.")
-                continue        
-
-            set_text = user_input[set_idx + len(" set "):where_idx].strip()
-            where_text = user_input[where_idx + len(" where "):].strip()
+        table_data = safe_load_table_data(tables, metadata, table_name)
+        if table_data is None:
+            return True
 
+        # подгоняем строки под core.py (для str добавим кавычки,
+        # если shlex их убрал)
+        try:
+            user_columns = [
+            c for c in metadata[table_name]
+            if c["name"] != "ID"
+        ]
+        except KeyError:
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+
+        if any(len(raw_values) != len(user_columns) for raw_values in tuples):
+            print("Некорректное значение: values. Попробуйте снова.")
+            return True
+
+        if len(tuples) > 1:
+            converters = [literal_converter(c["type"]) for c in user_columns]
             try:
-                set_col, set_raw = parse_simple_condition(set_text)
-                where_col, where_raw = parse_simple_condition(where_text)
+                rows = [
+                    [convert(raw) for convert, raw in zip(converters, raw_values)]
+                    for raw_values in tuples
+                ]
             except ValueError as e:
                 print(f"{e} Попробуйте снова.")
-                continue
-
-            set_typ = get_col_type(metadata, table_name, set_col)
-            where_typ = get_col_type(metadata, table_name, where_col)
-            if set_typ is None or where_typ is None:
-                print("Некорректное значение: column. Попробуйте снова.")
-                continue
-
-            set_raw = normalize_value_for_core(set_raw, set_typ)
-            where_raw = normalize_value_for_core(where_raw, where_typ)
-
-            set_clause = {set_col: _parse_value(set_raw, set_typ)}
-            where_clause = {where_col: _parse_value(where_raw, where_typ)}
+                return True
 
-            table_data = safe_load_table_data(table_name)
-            if table_data is None:
-                continue
-
-            matched_rows = select(table_data, where_clause)
-            if matched_rows is None:
-                continue
-            matched_ids = [r.get("ID") for r in matched_rows if "ID" in r]
-
-            res = update(table_data, set_clause, where_clause)
+            res = insert_many(metadata, table_name, table_data, [rows])
             if res is None:
-                continue
-
-            table_data, updated = res
-            save_table_data(table_name, table_data)
+                return True
+
+            table_data, first_id, count = res
+            record_inserted(tables, table_name, table_data, count)
+            last_id = first_id + count - 1
+            print(
+                f"Добавлено записей: {count} (ID={first_id}..{last_id}) "
+                f'в таблицу "{table_name}".'
+            )
+            return True
+
+        raw_values = tuples[0]
+        normalized_values = []
+        for i, col in enumerate(user_columns):
+            normalized_values.append(
+                normalize_value_for_core(raw_values[i], col["type"])
+            )
+
+        res = insert(metadata, table_name, table_data, normalized_values)
+        if res is None:
+            return True
+
+        table_data, new_id = res
+        tables.record(table_name, [{"op": "i", "row": table_data[-1]}], 1)
+        print(f'Запись с ID={new_id} успешно добавлена в таблицу "{table_name}".')
+        return True
+
+    if command == "import":
+        if len(args) != 3:
+            print("Некорректное значение: import. Попробуйте снова.")
+            return True
+
+        table_name, path = args[1], args[2]
+        if table_name not in metadata:
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
+        if not Path(path).is_file():
+            print(f"Ошибка: файл {path} не найден.")
+            return True
+
+        table_data = safe_load_table_data(tables, metadata, table_name)
+        if table_data is None:
+            return True
+
+        user_columns = [c for c in metadata[table_name] if c["name"] != "ID"]
+        chunks = iter_import_chunks(path, user_columns)
+        res = insert_many(metadata, table_name, table_data, chunks)
+        if res is None:
+            return True
+
+        table_data, first_id, count = res
+        record_inserted(tables, table_name, table_data, count)
+        print(f'Импортировано записей: {count} в таблицу "{table_name}".')
+        return True
+
+    if command == "select":
+        if len(args) > 3 and args[1] != "from" and "from" in args[2:]:
+            select_aggregates(tables, metadata, user_input)
+            return True
+        if len(args) > 4 and args[3].lower() == "join":
+            select_join(tables, metadata, user_input)
+            return True
+        if len(args) < 3 or args[1] != "from":
+            print("Некорректное значение: select. Попробуйте снова.")
+            return True
+
+        table_name = args[2]
 
-            if updated == 1 and len(matched_ids) == 1:
-                print(
-                    f'Запись с ID={matched_ids[0]} в таблице "{table_name}" '
-                    "успешно обновлена."
-                )
-            else:
-                print(f"Обновлено записей: {updated}")
-            continue
+        try:
+            cols = [c["name"] for c in metadata[table_name]]
+        except KeyError:
+            print(f'Ошибка: Таблица "{table_name}" не существует.')
+            return True
 
-        if command == "delete":
-            if len(args) < 5 or args[1] != "from":
-                print("Некорректное значение: delete. Попробуйте снова.")
-                continue
+        query, limit, offset, output_format = split_select_options(user_input)
 
-            table_name = args[2]
+        where_clause = None
+        lower = query.lower()
+        idx = lower.find(" where ")
+        if idx != -1:
+            where_text = query[idx + len(" where "):].strip()
 
-            lower = user_input.lower()
-            idx = lower.find(" where ")
-            if idx == -1:
-                print("Некорректное значение: where. Попробуйте снова.")
-                continue
-            
-            where_text = user_input[idx + len(" where "):].strip()
             try:
-                where_col, where_raw = parse_simple_condition(where_text)
+                where_clause = build_where_clause(
+                    metadata, table_name, where_text
+                )
             except ValueError as e:
                 print(f"{e} Попробуйте снова.")
-                continue
+                return True
+
+        # таблица в двоичном формате ещё не загружена: читаем нужные
+        # записи прямо из файла через mmap
+        row_id = id_lookup_value(where_clause)
+        if where_clause is None or row_id is not None:
+            mapped = tables.peek(table_name)
+            if mapped is not None:
+                with mapped:
+                    if row_id is None:
+                        rows = iter_select(mapped, None, offset, limit)
+                    else:
+                        pos = mapped.find_id(row_id)
+                        rows = [] if pos is None else [mapped[pos]]
+                    print_rows(cols, rows, output_format)
+                return True
+
+        table_data = safe_load_table_data(tables, metadata, table_name)
+        if table_data is None:
+            return True
+
+        if limit is None and offset == 0:
+            rows = select(table_data, where_clause)
+        else:
+            rows = iter_select(table_data, where_clause, offset, limit)
+        if rows is None:
+            return True
 
-            where_typ = get_col_type(metadata, table_name, where_col)
-            if where_typ is None:
-                print(f"Некорректное значение: {where_col}. Попробуйте снова.")
-                continue
+        print_rows(cols, rows, output_format)
+        return True
 
-            where_raw = normalize_value_for_core(where_raw, where_typ)
-            where_clause = {where_col: _parse_value(where_raw, where_typ)}
+    if command == "update":
+        if len(args) < 6 or args[2] != "set":
+            print("Некорректное значение: update. Попробуйте снова.")
+            return True
 
-            table_data = safe_load_table_data(table_name)
-            if table_data is None:
-                continue
-
-            matched_rows = select(table_data, where_clause)
-            if matched_rows is None:
-                continue
-            matched_ids = [r.get("ID") for r in matched_rows if "ID" in r]
+        table_name = args[1]
 
-            res = delete(table_data, where_clause)
-            if res is None:
-                continue
+        lower = user_input.lower()
+        set_idx = lower.find(" set ")
+        where_idx = lower.find(" where ")
+        if set_idx == -1 or where_idx == -1 or where_idx < set_idx:
+            print("Некорректное значение: update. Попробуйте снова.")
+            return True        
 
-            new_data, deleted = res
-            save_table_data(table_name, new_data)
+        set_text = user_input[set_idx + len(" set "):where_idx].strip()
+        where_text = user_input[where_idx + len(" where "):].strip()
 
-            if deleted == 1 and len(matched_ids) == 1:
+        try:
+            set_col, set_raw = parse_simple_condition(set_text)
+            where_clause = build_where_clause(metadata, table_name, where_text)
+        except ValueError as e:
+            print(f"{e} Попробуйте снова.")
+            return True
+
+        set_typ = get_col_type(metadata, table_name, set_col)
+        if set_typ is None:
+            print("Некорректное значение: column. Попробуйте снова.")
+            return True
+        if set_col == "ID":
+            # ID — ключ записи: по нему журнал находит записи при загрузке
+            print("Некорректное значение: ID. Попробуйте снова.")
+            return True
+
+        set_raw = normalize_value_for_core(set_raw, set_typ)
+        try:
+            set_clause = {set_col: _parse_value(set_raw, set_typ)}
+        except ValueError as e:
+            print(f"{e} Попробуйте снова.")
+            return True
+
+        # точечное изменение поля int/bool таблицы в двоичном формате —
+        # прямо в файле, без загрузки таблицы
+        row_id = id_lookup_value(where_clause)
+        if row_id is not None and set_typ in ("int", "bool"):
+            mapped = tables.peek(table_name, writable=True)
+            if mapped is not None:
+                with mapped:
+                    pos = mapped.find_id(row_id)
+                    if pos is not None:
+                        mapped.set_value(pos, set_col, set_clause[set_col])
+                        mapped.flush()
+                if pos is None:
+                    print("Обновлено записей: 0")
+                    return True
+                invalidate_table_cache(table_name)
                 print(
-                    f"Запись с ID={matched_ids[0]} успешно удалена "
-                    f'из таблицы "{table_name}".'
+                    f'Запись с ID={row_id} в таблице "{table_name}" '
+                    "успешно обновлена."
                 )
+                return True
+
+        table_data = safe_load_table_data(tables, metadata, table_name)
+        if table_data is None:
+            return True
+
+        res = update(table_data, set_clause, where_clause)
+        if res is None:
+            return True
+
+        table_data, updated_ids = res
+        if updated_ids:
+            tables.record(
+                table_name,
+                [{"op": "u", "ids": updated_ids, "set": set_clause}],
+                len(updated_ids),
+            )
+
+        if len(updated_ids) == 1:
+            print(
+                f'Запись с ID={updated_ids[0]} в таблице "{table_name}" '
+                "успешно обновлена."
+            )
+        else:
+            print(f"Обновлено записей: {len(updated_ids)}")
+        return True
+
+    if command == "delete":
+        if len(args) < 5 or args[1] != "from":
+            print("Некорректное значение: delete. Попробуйте снова.")
+            return True
+
+        table_name = args[2]
+
+        lower = user_input.lower()
+        idx = lower.find(" where ")
+        if idx == -1:
+            print("Некорректное значение: where. Попробуйте снова.")
+            return True
+
+        where_text = user_input[idx + len(" where "):].strip()
+        try:
+            where_clause = build_where_clause(metadata, table_name, where_text)
+        except ValueError as e:
+            print(f"{e} Попробуйте снова.")
+            return True
+
+        table_data = safe_load_table_data(tables, metadata, table_name)
+        if table_data is None:
+            return True
+
+        res = delete(table_data, where_clause)
+        if res is None:
+            return True
+
+        table_data, deleted_ids = res
+        if deleted_ids:
+            tables.record(
+                table_name, [{"op": "d", "ids": deleted_ids}], len(deleted_ids)
+            )
+
+        if len(deleted_ids) == 1:
+            print(
+                f"Запись с ID={deleted_ids[0]} успешно удалена "
+                f'из таблицы "{table_name}".'
+            )
+
+        else:
+            print(f"Удалено записей: {len(deleted_ids)}")
+        return True
+
+    print(f"Функции {command} нет. Попробуйте снова.")
+    return True
+
+
+def needs_metadata(user_input):
+    words = user_input.split(None, 1)
+    return bool(words) and words[0] not in METADATA_FREE_COMMANDS
+
+
+def run(commands=None, durability="none"):
+    """Основной цикл. Без commands — интерактивный режим с prompt,
+    иначе команды берутся из commands (пакетный режим, см. main.py).
+    durability — режим записи на диск (см. TableManager.set_durability).
+
+    db_meta.json читается перед первой командой, которой нужны метаданные,
+    а файлы таблиц — при первом обращении к таблице (см. TableManager.get).
+    """
+    interactive = commands is None
+    if interactive:
+        import prompt
+
+        print("***База данных***")
+        print_help()
+        tables = TableManager(META_FILE)
+    else:
+        # в пакетном режиме всё пишется на диск один раз в конце
+        set_confirmations(False)
+        commands = iter(commands)
+        tables = TableManager(
+            META_FILE, flush_interval=float("inf"), flush_dirty_rows=float("inf")
+        )
 
-            else:
-                print(f"Удалено записей: {deleted}")
-            continue
+    # заполняется refresh_metadata, пока db_meta.json не прочитан — пустой
+    metadata = {}
+    tables.set_durability(durability)
+
+    try:
+        while True:
+            tables.tick()
+            error = tables.take_error()
+            if error is not None:
+                print(f"Ошибка: {error}")
 
-        print(f"Функции {command} нет. Попробуйте снова.")
\ No newline at end of file
+            if interactive:
+                try:
+                    user_input = prompt.string(">>>Введите команду: ")
+                except (EOFError, KeyboardInterrupt):
+                    break
+            else:
+                user_input = next(commands, None)
+                if user_input is None:
+                    break
+            if needs_metadata(user_input):
+                tables.refresh_metadata(metadata)
+            if not execute(tables, metadata, user_input):
+                break
+    finally:
+        # и при ошибке в команде подтверждённые изменения записываются
+        if tables.in_transaction:
+            print("Незавершённая транзакция отменена.")
+            tables.rollback()
+        write_tables(tables.close)
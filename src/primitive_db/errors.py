@@ -0,0 +1,62 @@
+"""Исключения базы данных.
+
+Функции core поднимают их, handle_db_errors превращает их в сообщения
+интерактивного режима, а Python API (см. api.py) отдаёт вызывающему коду.
+Каждое исключение наследует и от встроенного (ValueError, KeyError,
+OSError), поэтому код, ловящий встроенные исключения, работает как раньше.
+"""
+
+
+class DatabaseError(Exception):
+    """Базовый класс ошибок базы данных."""
+
+
+class ValidationError(DatabaseError, ValueError):
+    """Некорректное значение, тип или параметр запроса."""
+
+
+class QuerySyntaxError(ValidationError):
+    """Текст запроса не удалось разобрать."""
+
+
+class TableNotFoundError(DatabaseError, ValueError):
+
+    def __init__(self, table_name):
+        super().__init__(f'Таблица "{table_name}" не существует.')
+        self.table_name = table_name
+
+
+class TableExistsError(DatabaseError, ValueError):
+
+    def __init__(self, table_name):
+        super().__init__(f'Таблица "{table_name}" уже существует.')
+        self.table_name = table_name
+
+
+class ColumnNotFoundError(DatabaseError, KeyError):
+
+    def __init__(self, column):
+        super().__init__(column)
+        self.column = column
+
+
+class StorageError(DatabaseError, OSError):
+    """Ошибка чтения или записи файлов базы."""
+
+
+class WriteConflictError(StorageError):
+    """Таблицу изменил другой процесс, пока у нас копились изменения.
+
+    Изменения всё равно записаны поверх его версии, но вставленные записи,
+    чьи ID он успел занять, получили новые ID: renumbered — словарь
+    {выданный ID: записанный ID}.
+    """
+
+    def __init__(self, table_name, renumbered):
+        moved = ", ".join(f"{old} -> {new}" for old, new in renumbered.items())
+        super().__init__(
+            f'Таблицу "{table_name}" изменил другой процесс, '
+            f"ID новых записей изменены: {moved}."
+        )
+        self.table_name = table_name
+        self.renumbered = renumbered
@@ -0,0 +1,390 @@
+"""Условия where: разбор, компиляция в функцию-предикат и выбор индекса.
+
+Поддерживаются сравнения col = v, col != v, col < v, col <= v, col > v,
+col >= v, col between v1 and v2, а также AND, OR, NOT и скобки.
+
+Условие разбирается в дерево из кортежей:
+    ("eq", col, value), ("ne", col, value), ("range", col, Range),
+    ("and", (...)), ("or", (...)), ("not", node)
+Дерево одновременно служит ключом кэша select. Для проверки записей по
+дереву один раз генерируется и компилируется функция на Python, в которой
+условия AND упорядочены от самых избирательных к наименее избирательным.
+
+В подготовленных запросах (см. api.py) вместо значений в дереве стоят
+параметры Param; Predicate.bind подставляет значения, не компилируя
+функции заново.
+"""
+
+import re
+
+from src.primitive_db.indexes import Range, lookup_positions
+
+_TOKEN_RE = re.compile(
+    r'\s*(?:(?P<str>"[^"]*")|(?P<op><=|>=|!=|<>|=|<|>)|(?P<paren>[()])'
+    r'|(?P<word>[^\s()=<>!"]+))'
+)
+
+# примерная доля подходящих записей — чем меньше, тем раньше проверяется
+_SELECTIVITY = {"eq": 0.05, "range": 0.3, "ne": 0.95}
+
+
+class Param:
+    """Параметр ? подготовленного запроса; index — его номер в запросе."""
+
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return f"Param({self.index})"
+
+
+class Predicate:
+    """Скомпилированное условие where.
+
+    terms — словарь {столбец: значение или Range}, если условие — просто
+    конъюнкция равенств и диапазонов (его понимают индексы и колоночный
+    просмотр), иначе None. tester(table_data) — скомпилированная проверка
+    записи, filter_positions — скомпилированный просмотр таблицы. Записи —
+    кортежи (см. rows.py), поэтому функции компилируются под порядок столбцов
+    таблицы и запоминаются для каждого порядка.
+
+    params — значения параметров Param, если предикат получен через bind.
+    """
+
+    def __init__(self, tree, params=()):
+        self.tree = tree
+        self.key = tree
+        self.params = params
+        conjuncts = tree[1] if tree[0] == "and" else (tree,)
+        self.index_terms = [
+            (node[1], node[2]) for node in conjuncts if node[0] in ("eq", "range")
+        ]
+        self.terms = dict(self.index_terms)
+        if len(self.terms) != len(conjuncts):
+            self.terms = None
+        # функции компилируются по дереву с параметрами (_template) один раз
+        # на порядок столбцов (_makers) и общие у всех bind этого предиката
+        self._template = tree
+        self._makers = {}
+        self._compiled = {}
+
+    @classmethod
+    def from_terms(cls, where_clause):
+        """Предикат из словаря {столбец: значение или Range}."""
+        nodes = tuple(_term_node(col, value) for col, value in where_clause.items())
+        return cls(nodes[0] if len(nodes) == 1 else ("and", nodes))
+
+    def bind(self, params):
+        """Предикат с подставленными значениями параметров Param."""
+        bound = Predicate(_substitute(self.tree, params), params)
+        bound._template = self._template
+        bound._makers = self._makers
+        return bound
+
+    def _functions(self, layout):
+        key = tuple(layout)
+        functions = self._compiled.get(key)
+        if functions is None:
+            maker = self._makers.get(key)
+            if maker is None:
+                maker = self._makers[key] = _compile(self._template, layout)
+            make, values = maker
+            functions = self._compiled[key] = make(
+                *(_param_value(value, self.params) for value in values)
+            )
+        return functions
+
+    def tester(self, table_data):
+        """Проверка одной записи таблицы: test(row) -> bool."""
+        return self._functions(table_data.layout)[0]
+
+    def filter_positions(self, table_data, candidates=None):
+        """Позиции записей (из candidates или всей таблицы), подходящих под условие."""
+        _, scan, scan_positions = self._functions(table_data.layout)
+        if candidates is None:
+            return scan(table_data)
+        return scan_positions(table_data, candidates)
+
+    def candidate_positions(self, table_data):
+        """Позиции-кандидаты по самому избирательному индексу или None."""
+        best = None
+        for col, condition in self.index_terms:
+            positions = lookup_positions(table_data, {col: condition})
+            if positions is not None and (best is None or len(positions) < len(best)):
+                best = positions
+        return best
+
+
+def as_predicate(where_clause):
+    if where_clause is None or isinstance(where_clause, Predicate):
+        return where_clause
+    return Predicate.from_terms(where_clause)
+
+
+def _param_value(value, params):
+    return params[value.index] if isinstance(value, Param) else value
+
+
+def _substitute(node, params):
+    kind = node[0]
+    if kind in ("eq", "ne"):
+        return (kind, node[1], _param_value(node[2], params))
+    if kind == "range":
+        cond = node[2]
+        return (
+            "range",
+            node[1],
+            cond._replace(
+                low=_param_value(cond.low, params),
+                high=_param_value(cond.high, params),
+            ),
+        )
+    if kind == "not":
+        return ("not", _substitute(node[1], params))
+    return (kind, tuple(_substitute(child, params) for child in node[1]))
+
+
+def _term_node(col, value):
+    if isinstance(value, Range):
+        return ("range", col, value)
+    return ("eq", col, value)
+
+
+def _selectivity(node):
+    kind = node[0]
+    if kind in _SELECTIVITY:
+        return _SELECTIVITY[kind]
+    if kind == "not":
+        return 1 - _selectivity(node[1])
+    if kind == "and":
+        result = 1.0
+        for child in node[1]:
+            result *= _selectivity(child)
+        return result
+    result = 0.0
+    for child in node[1]:
+        result += _selectivity(child)
+    return min(result, 1.0)
+
+
+def _generate(tree, ref):
+    """Текст выражения Python для дерева условия и значения для подстановки.
+
+    ref(col) — выражение, дающее значение столбца col.
+    """
+    values = {}
+
+    def bind(value):
+        name = f"_v{len(values)}"
+        values[name] = value
+        return name
+
+    def gen(node):
+        kind = node[0]
+        if kind == "eq":
+            return f"{ref(node[1])} == {bind(node[2])}"
+        if kind == "ne":
+            return f"{ref(node[1])} != {bind(node[2])}"
+        if kind == "range":
+            col, cond = node[1], node[2]
+            parts = []
+            if cond.low is not None:
+                op = "<=" if cond.low_inclusive else "<"
+                parts.append(f"{bind(cond.low)} {op} {ref(col)}")
+            if cond.high is not None:
+                op = "<=" if cond.high_inclusive else "<"
+                parts.append(f"{ref(col)} {op} {bind(cond.high)}")
+            return " and ".join(parts) or "True"
+        if kind == "not":
+            return f"not ({gen(node[1])})"
+        children = node[1]
+        if kind == "and":
+            children = sorted(children, key=_selectivity)
+        return f" {kind} ".join(f"({gen(child)})" for child in children)
+
+    return gen(tree), values
+
+
+def _compile(tree, layout):
+    """Компилирует проверки дерева под порядок столбцов layout.
+
+    Возвращает (make, values): make(*значения) строит функции (predicate,
+    scan, scan_positions), values — подставляемые значения дерева по
+    порядку (на месте параметров — Param).
+    """
+    expr, values = _generate(tree, lambda col: f"row[{layout[col]}]")
+    # значения приходят аргументами make, чтобы в цикле они были
+    # переменными замыкания, а не глобальными именами, и чтобы одни и те же
+    # функции можно было построить для разных значений параметров
+    args = ", ".join(values)
+    # кроме проверки одной записи компилируем и сами циклы просмотра:
+    # так на каждую запись не тратится вызов функции
+    source = (
+        f"def make({args}):\n"
+        f"    def predicate(row):\n"
+        f"        return {expr}\n"
+        f"    def scan(rows):\n"
+        f"        return [pos for pos, row in enumerate(rows) if {expr}]\n"
+        f"    def scan_positions(rows, positions):\n"
+        f"        return [\n"
+        f"            pos for pos in positions for row in (rows[pos],) if {expr}\n"
+        f"        ]\n"
+        f"    return predicate, scan, scan_positions\n"
+    )
+    namespace = {}
+    exec(compile(source, "<where>", "exec"), namespace)
+    return namespace["make"], list(values.values())
+
+
+def tree_columns(tree):
+    """Столбцы, упомянутые в дереве условия, в порядке появления."""
+    if tree[0] == "not":
+        return tree_columns(tree[1])
+    if tree[0] in ("and", "or"):
+        columns = {}
+        for child in tree[1]:
+            columns.update(dict.fromkeys(tree_columns(child)))
+        return list(columns)
+    return [tree[1]]
+
+
+def compile_column_scan(tree):
+    """Просмотр по колонкам: scan(columns) — позиции, подходящие под условие.
+
+    columns — последовательности значений столбцов tree_columns(tree) в том
+    же порядке; записи-словари при этом не нужны (см. parallel.py).
+    """
+    names = {col: f"_c{i}" for i, col in enumerate(tree_columns(tree))}
+    expr, values = _generate(tree, names.__getitem__)
+    args = "".join(f", {name}={name}" for name in values)
+    unpack = "".join(f"{name}, " for name in names.values())
+    source = (
+        f"def scan(columns{args}):\n"
+        f"    return [pos for pos, ({unpack}) in enumerate(zip(*columns))"
+        f" if {expr}]\n"
+    )
+    namespace = dict(values)
+    exec(compile(source, "<where>", "exec"), namespace)
+    return namespace["scan"]
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if m is None or m.end() == pos:
+            raise ValueError(f"Некорректное значение: {text[pos:].strip()}.")
+        pos = m.end()
+        kind = m.lastgroup
+        tokens.append((kind, m.group(kind)))
+    return tokens
+
+
+class _Parser:
+
+    def __init__(self, tokens, schema, convert):
+        self.tokens = tokens
+        self.pos = 0
+        self.schema = schema
+        self.convert = convert
+
+    def peek_word(self):
+        if self.pos < len(self.tokens) and self.tokens[self.pos][0] == "word":
+            return self.tokens[self.pos][1].lower()
+        return None
+
+    def peek(self, kind, value):
+        return self.pos < len(self.tokens) and self.tokens[self.pos] == (kind, value)
+
+    def take(self):
+        if self.pos >= len(self.tokens):
+            raise ValueError("Некорректное значение: where.")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Некорректное значение: {self.tokens[self.pos][1]}.")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek_word() == "or":
+            self.pos += 1
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", tuple(nodes))
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek_word() == "and":
+            self.pos += 1
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", tuple(nodes))
+
+    def parse_not(self):
+        if self.peek_word() == "not":
+            self.pos += 1
+            return ("not", self.parse_not())
+        if self.peek("paren", "("):
+            self.pos += 1
+            node = self.parse_or()
+            if not self.peek("paren", ")"):
+                raise ValueError("Некорректное значение: ).")
+            self.pos += 1
+            return node
+        return self.parse_comparison()
+
+    def literal(self, typ):
+        kind, raw = self.take()
+        if kind not in ("str", "word"):
+            raise ValueError(f"Некорректное значение: {raw}.")
+        return self.convert(raw, typ)
+
+    def parse_comparison(self):
+        kind, col = self.take()
+        typ = self.schema.get(col) if kind == "word" else None
+        if typ is None:
+            raise ValueError(f"Некорректное значение: {col}.")
+
+        if self.peek_word() == "between":
+            self.pos += 1
+            low = self.literal(typ)
+            if self.peek_word() != "and":
+                raise ValueError("Некорректное значение: between.")
+            self.pos += 1
+            high = self.literal(typ)
+            op = "between"
+        else:
+            kind, op = self.take()
+            if kind != "op":
+                raise ValueError(f"Некорректное значение: {op}.")
+            value = self.literal(typ)
+
+        if op == "=":
+            return ("eq", col, value)
+        if op in ("!=", "<>"):
+            return ("ne", col, value)
+        if typ != "int":
+            raise ValueError(f"Некорректное значение: {op}. Сравнение только для int.")
+        if op == "between":
+            return ("range", col, Range(low, high))
+        if op in ("<", "<="):
+            return ("range", col, Range(high=value, high_inclusive=op == "<="))
+        return ("range", col, Range(low=value, low_inclusive=op == ">="))
+
+
+def parse_where(text, schema, convert):
+    """Разбирает текст условия в Predicate.
+
+    schema — {столбец: тип}, convert(raw, typ) приводит литерал к типу столбца.
+    """
+    tokens = _tokenize(text)
+    if not tokens:
+        raise ValueError("Некорректное значение: where.")
+    return Predicate(_Parser(tokens, schema, convert).parse())
@@ -0,0 +1,113 @@
+"""Потоковое чтение записей из CSV и JSONL для команды import.
+
+Файл читается порциями по IMPORT_CHUNK_ROWS записей, значения приводятся
+к типам столбцов конвертерами, которые строятся по схеме таблицы один раз.
+Столбец ID в файле игнорируется: идентификаторы выдаёт таблица.
+"""
+
+import csv
+import json
+
+from src.primitive_db.rows import int_in_range
+
+IMPORT_CHUNK_ROWS = 10_000
+
+
+def _csv_bool(value):
+    v = value.strip().lower()
+    if v in ("true", "1"):
+        return True
+    if v in ("false", "0"):
+        return False
+    raise ValueError(f"Некорректное значение: {value}.")
+
+
+def _csv_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Некорректное значение: {value}.")
+    if not int_in_range(number):
+        raise ValueError(f"Некорректное значение: {value}.")
+    return number
+
+
+_CSV_CONVERTERS = {"int": _csv_int, "bool": _csv_bool, "str": str}
+
+_JSON_TYPES = {"int": int, "bool": bool, "str": str}
+
+
+def _json_converter(typ):
+    expected = _JSON_TYPES[typ]
+
+    def convert(value):
+        # bool — подкласс int, поэтому сравниваем тип точно
+        if type(value) is not expected or (
+            expected is int and not int_in_range(value)
+        ):
+            raise ValueError(f"Некорректное значение: {value!r}.")
+        return value
+
+    return convert
+
+
+def _chunked(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_csv(f, user_columns):
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [h.strip() for h in header]
+
+    plan = []
+    for col in user_columns:
+        if col["name"] not in header:
+            raise ValueError(f"В файле нет столбца {col['name']}.")
+        plan.append((header.index(col["name"]), _CSV_CONVERTERS[col["type"]]))
+
+    for line_no, fields in enumerate(reader, start=2):
+        if not fields:
+            continue
+        try:
+            yield [convert(fields[i]) for i, convert in plan]
+        except (ValueError, IndexError) as e:
+            raise ValueError(f"Строка {line_no}: {e}")
+
+
+def _iter_jsonl(f, user_columns):
+    plan = [(col["name"], _json_converter(col["type"])) for col in user_columns]
+
+    for line_no, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+            yield [convert(obj[name]) for name, convert in plan]
+        except KeyError as e:
+            raise ValueError(f"Строка {line_no}: нет столбца {e}.")
+        except ValueError as e:
+            raise ValueError(f"Строка {line_no}: {e}")
+
+
+def iter_import_chunks(path, user_columns, chunk_size=IMPORT_CHUNK_ROWS):
+    """Порции записей файла path: списки значений в порядке user_columns."""
+    suffix = str(path).lower().rsplit(".", 1)[-1]
+    if suffix == "csv":
+        read = _iter_csv
+    elif suffix in ("jsonl", "ndjson"):
+        read = _iter_jsonl
+    else:
+        raise ValueError(f"Некорректное значение: {path}. Ожидается .csv или .jsonl.")
+
+    with open(path, newline="") as f:
+        yield from _chunked(read(f, user_columns), chunk_size)
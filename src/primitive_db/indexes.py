@@ -0,0 +1,193 @@
+"""Индексы по столбцам таблицы.
+
+Поддерживаются два вида индексов:
+- "hash" — словарь «значение -> множество позиций записей в table_data»
+  (множество, чтобы update убирал позицию за O(1), а не за размер группы);
+- "sorted" — отсортированный список пар (значение, позиция), по которому
+  диапазон значений находится двоичным поиском.
+
+Индекс по ID есть у каждой таблицы неявно (hash, если в метаданных не указан
+другой вид), остальные создаются командой create_index и отмечаются в
+метаданных ключом "index" у столбца. Сами индексы строятся лениво при первом
+обращении и хранятся в table_data.indexes, пока таблица находится в памяти.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, NamedTuple
+
+from src.primitive_db.tombstones import live_items
+
+INDEX_KINDS = ("hash", "sorted")
+
+
+class Range(NamedTuple):
+    """Условие вида low < value < high; None означает отсутствие границы."""
+
+    low: Any = None
+    high: Any = None
+    low_inclusive: bool = True
+    high_inclusive: bool = True
+
+    def contains(self, value):
+        if value is None:
+            return False
+        if self.low is not None:
+            if value < self.low or (value == self.low and not self.low_inclusive):
+                return False
+        if self.high is not None:
+            if value > self.high or (value == self.high and not self.high_inclusive):
+                return False
+        return True
+
+
+def indexed_columns(metadata, table_name):
+    columns = {"ID": "hash"}
+    for col in metadata.get(table_name, []):
+        if col.get("index"):
+            columns[col["name"]] = col["index"]
+    return columns
+
+
+def attach_indexes(metadata, table_name, table_data):
+    table_data.index_columns = indexed_columns(metadata, table_name)
+    table_data.indexes = {}
+    return table_data
+
+
+def build_index(table_data, column, kind="hash"):
+    i = table_data.layout[column]
+    if kind == "sorted":
+        return sorted(
+            (row[i], pos) for pos, row in live_items(table_data) if row[i] is not None
+        )
+
+    index = {}
+    for pos, row in live_items(table_data):
+        positions = index.get(row[i])
+        if positions is None:
+            index[row[i]] = {pos}
+        else:
+            positions.add(pos)
+    return index
+
+
+def get_index(table_data, column):
+    kind = getattr(table_data, "index_columns", {}).get(column)
+    if kind is None:
+        return None
+    index = table_data.indexes.get(column)
+    if index is None:
+        index = build_index(table_data, column, kind)
+        table_data.indexes[column] = index
+    return index
+
+
+def _sorted_range(index, condition):
+    if condition.low is None:
+        start = 0
+    elif condition.low_inclusive:
+        start = bisect_left(index, (condition.low,))
+    else:
+        start = bisect_right(index, (condition.low, float("inf")))
+
+    if condition.high is None:
+        stop = len(index)
+    elif condition.high_inclusive:
+        stop = bisect_right(index, (condition.high, float("inf")))
+    else:
+        stop = bisect_left(index, (condition.high,))
+    return [pos for _, pos in index[start:stop]]
+
+
+def lookup_positions(table_data, where_clause):
+    """Позиции-кандидаты для условия или None, если подходящего индекса нет.
+
+    Кандидаты возвращаются в порядке записей таблицы, их ещё нужно
+    проверить на остальные условия where_clause.
+    """
+    for col, value in where_clause.items():
+        index = get_index(table_data, col)
+        if index is None:
+            continue
+        if isinstance(index, dict):
+            if isinstance(value, Range):
+                # хеш-индекс не умеет отвечать на диапазоны
+                continue
+            return sorted(index.get(value, ()))
+        if not isinstance(value, Range):
+            value = Range(value, value)
+        return sorted(_sorted_range(index, value))
+    return None
+
+
+def _index_put(index, value, pos):
+    if isinstance(index, dict):
+        index.setdefault(value, set()).add(pos)
+    elif value is not None:
+        insort(index, (value, pos))
+
+
+def _index_pop(index, value, pos):
+    if isinstance(index, dict):
+        positions = index.get(value)
+        if positions is None:
+            return
+        positions.discard(pos)
+        if not positions:
+            del index[value]
+    elif value is not None:
+        i = bisect_left(index, (value, pos))
+        if i < len(index) and index[i] == (value, pos):
+            del index[i]
+
+
+def index_insert(table_data, pos):
+    row = table_data[pos]
+    layout = table_data.layout
+    for col, index in getattr(table_data, "indexes", {}).items():
+        _index_put(index, row[layout[col]], pos)
+
+
+def index_extend(table_data, start):
+    """Добавляет в построенные индексы записи с позиций start и дальше —
+    один раз на пакет, а не по записи (insort на каждую запись — O(n²))."""
+    layout = table_data.layout
+    for col, index in getattr(table_data, "indexes", {}).items():
+        i = layout[col]
+        if isinstance(index, dict):
+            for pos in range(start, len(table_data)):
+                index.setdefault(table_data[pos][i], set()).add(pos)
+        else:
+            index.extend(
+                (row[i], pos)
+                for pos, row in enumerate(table_data[start:], start)
+                if row[i] is not None
+            )
+            # прежняя часть уже упорядочена: sort сортирует только новые
+            # элементы и сливает их с ней
+            index.sort()
+
+
+def index_remove(table_data, pos, columns):
+    indexes = getattr(table_data, "indexes", {})
+    row = table_data[pos]
+    for col in columns:
+        index = indexes.get(col)
+        if index is not None:
+            _index_pop(index, row[table_data.layout[col]], pos)
+
+
+def index_add(table_data, pos, columns):
+    indexes = getattr(table_data, "indexes", {})
+    row = table_data[pos]
+    for col in columns:
+        index = indexes.get(col)
+        if index is not None:
+            _index_put(index, row[table_data.layout[col]], pos)
+
+
+def reset_indexes(table_data):
+    """Сбрасывает построенные индексы (например, после сдвига позиций)."""
+    indexes = getattr(table_data, "indexes", None)
+    if indexes is not None:
+        indexes.clear()
@@ -0,0 +1,332 @@
+"""Соединение двух таблиц: select from a join b on a.col = b.col [where ...].
+
+Соединение выполняется как hash join. Меньшая по числу записей таблица
+(сторона построения, число записей — то же, что показывает info)
+раскладывается в хеш-таблицу «значение столбца -> записи», а записи другой
+(стороны просмотра) идут потоком и ищутся в ней; результат выдаётся по мере
+нахождения, без сборки в памяти. Если по столбцу соединения одной из таблиц
+есть хеш-индекс (у ID он есть всегда), строить ничего не нужно: индекс и
+есть готовая хеш-таблица, а потоком идёт другая таблица.
+
+Части условия where (члены конъюнкции AND), относящиеся к одной таблице,
+проверяются ещё до соединения, при просмотре этой таблицы — с индексами и
+колоночным просмотром, как в обычном select; остальные — на соединённых
+записях. Значения None не соединяются ни с чем.
+
+Хеш-таблица держит не больше JOIN_BUILD_ROWS записей. Если стороне
+построения нужно больше, обе стороны раскладываются по хешу значения
+столбца на разделы во временных файлах (grace hash join), и разделы
+соединяются по одному, так что в памяти всегда одна хеш-таблица раздела.
+Порядок результата тогда — по разделам, а не по записям таблицы.
+
+Столбцы результата — все столбцы первой таблицы, затем второй, с именами
+вида таблица.столбец. В on и where столбец можно писать без имени таблицы,
+если он есть только в одной из них.
+"""
+
+import os
+import pickle
+import re
+import tempfile
+from typing import Any, NamedTuple
+
+from src.primitive_db.core import iter_select
+from src.primitive_db.errors import TableNotFoundError
+from src.primitive_db.expressions import Predicate, parse_where, tree_columns
+from src.primitive_db.indexes import get_index
+from src.primitive_db.metrics import increment
+from src.primitive_db.tombstones import live_count
+
+# сколько записей стороны построения хеш-таблица держит в памяти
+JOIN_BUILD_ROWS = 500_000
+# по сколько записей раздел дописывается во временный файл
+JOIN_SPILL_CHUNK = 10_000
+
+_JOIN_QUERY_RE = re.compile(
+    r"^\s*select\s+from\s+(\S+)\s+join\s+(\S+)\s+on\s+([^\s=]+)\s*=\s*([^\s=]+)"
+    r"(?:\s+where\s+(.+?))?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+class JoinQuery(NamedTuple):
+    """Разобранный запрос соединения.
+
+    tables и keys — таблицы и их столбцы соединения; filters — условия
+    where по каждой таблице (Predicate или None); residual — условие на
+    соединённых записях; columns и layout — столбцы результата и их позиции.
+    """
+
+    tables: tuple
+    keys: tuple
+    filters: tuple
+    residual: Any
+    columns: list
+    layout: dict
+
+
+def match_join_query(query):
+    """Части запроса join или None, если это не соединение."""
+    m = _JOIN_QUERY_RE.match(query)
+    return None if m is None else m.groups()
+
+
+def _rename(node, names):
+    kind = node[0]
+    if kind == "not":
+        return ("not", _rename(node[1], names))
+    if kind in ("and", "or"):
+        return (kind, tuple(_rename(child, names) for child in node[1]))
+    return (kind, names[node[1]], node[2])
+
+
+def _predicate(nodes):
+    if not nodes:
+        return None
+    return Predicate(nodes[0] if len(nodes) == 1 else ("and", tuple(nodes)))
+
+
+def parse_join(query, metadata, convert):
+    """Разбирает select from a join b on ... [where ...] в JoinQuery.
+
+    convert(raw, typ) приводит литералы where к типу столбца.
+    """
+    parts = match_join_query(query)
+    if parts is None:
+        raise ValueError("Некорректное значение: join.")
+    left, right, on_left, on_right, where_text = parts
+    tables = (left, right)
+    if left == right:
+        raise ValueError(f"Некорректное значение: {right}.")
+    for table_name in tables:
+        if table_name not in metadata:
+            raise TableNotFoundError(table_name)
+
+    # столбец результата -> (номер таблицы, столбец); короткие имена —
+    # только если столбец есть в одной из таблиц
+    owners = {}
+    short = {}
+    for side, table_name in enumerate(tables):
+        for col in metadata[table_name]:
+            owners[f"{table_name}.{col['name']}"] = (side, col["name"])
+            short.setdefault(col["name"], []).append(f"{table_name}.{col['name']}")
+    names = {name: name for name in owners}
+    names.update({col: full[0] for col, full in short.items() if len(full) == 1})
+    types = [{c["name"]: c["type"] for c in metadata[t]} for t in tables]
+
+    on = [owners.get(names.get(name)) for name in (on_left, on_right)]
+    if None in on or on[0][0] == on[1][0]:
+        raise ValueError(f"Некорректное значение: {on_left} = {on_right}.")
+    on.sort()
+    keys = (on[0][1], on[1][1])
+    if types[0][keys[0]] != types[1][keys[1]]:
+        raise ValueError(
+            f"Некорректное значение: {on_left} = {on_right}. Типы столбцов различаются."
+        )
+
+    filters = ([], [])
+    residual = []
+    if where_text is not None:
+        schema = {}
+        for name, full in names.items():
+            side, col = owners[full]
+            schema[name] = types[side][col]
+        tree = _rename(parse_where(where_text, schema, convert).tree, names)
+        for node in tree[1] if tree[0] == "and" else (tree,):
+            sides = {owners[col][0] for col in tree_columns(node)}
+            if len(sides) == 1:
+                side = sides.pop()
+                local = {name: owners[name][1] for name in tree_columns(node)}
+                filters[side].append(_rename(node, local))
+            else:
+                residual.append(node)
+
+    columns = list(owners)
+    return JoinQuery(
+        tables,
+        keys,
+        (_predicate(filters[0]), _predicate(filters[1])),
+        _predicate(residual),
+        columns,
+        {name: pos for pos, name in enumerate(columns)},
+    )
+
+
+def hash_join(tables_data, query):
+    """Лениво выдаёт соединённые записи — кортежи по порядку query.columns.
+
+    tables_data — данные таблиц query.tables в том же порядке.
+    """
+    rows = _join(tables_data, query)
+    if query.residual is not None:
+        # tester берёт порядок столбцов соединённой записи из query.layout
+        rows = filter(query.residual.tester(query), rows)
+    return rows
+
+
+def _hash_index(table_data, column):
+    index = get_index(table_data, column)
+    return index if isinstance(index, dict) else None
+
+
+def _join(tables_data, query):
+    sizes = [live_count(table_data) for table_data in tables_data]
+    indexes = [
+        _hash_index(table_data, key) for table_data, key in zip(tables_data, query.keys)
+    ]
+    if indexes[0] is not None and indexes[1] is not None:
+        # потоком идёт меньшая таблица: меньше поисков по индексу
+        build = 0 if sizes[0] >= sizes[1] else 1
+    elif indexes[0] is not None or indexes[1] is not None:
+        build = 0 if indexes[0] is not None else 1
+    else:
+        build = 0 if sizes[0] <= sizes[1] else 1
+    probe = 1 - build
+
+    build_data, probe_data = tables_data[build], tables_data[probe]
+    build_key = build_data.layout[query.keys[build]]
+    probe_key = probe_data.layout[query.keys[probe]]
+    probe_rows = iter_select(probe_data, query.filters[probe])
+    if build == 0:
+
+        def combine(build_row, probe_row):
+            return build_row + probe_row
+
+    else:
+
+        def combine(build_row, probe_row):
+            return probe_row + build_row
+
+    index = indexes[build]
+    if index is not None:
+        increment("join_index_lookups")
+        build_filter = query.filters[build]
+        test = None if build_filter is None else build_filter.tester(build_data)
+        return _probe_index(index, build_data, test, probe_rows, probe_key, combine)
+
+    build_rows = iter_select(build_data, query.filters[build])
+    table, rest = _build_table(build_rows, build_key, JOIN_BUILD_ROWS)
+    if rest is None:
+        return _probe(table, probe_rows, probe_key, combine)
+
+    increment("join_spills")
+    # каждый раздел стороны построения — примерно вдвое меньше предела
+    count = max(2, -(-sizes[build] // JOIN_BUILD_ROWS) * 2)
+    return _grace_join(table, rest, build_key, probe_rows, probe_key, combine, count)
+
+
+def _probe_index(index, build_data, test, probe_rows, probe_key, combine):
+    for probe_row in probe_rows:
+        value = probe_row[probe_key]
+        if value is None:
+            continue
+        positions = index.get(value)
+        if not positions:
+            continue
+        if len(positions) > 1:
+            # позиции в хеш-индексе хранятся множеством
+            positions = sorted(positions)
+        for pos in positions:
+            build_row = build_data[pos]
+            if test is None or test(build_row):
+                yield combine(build_row, probe_row)
+
+
+def _build_table(rows, key, limit=None):
+    """Хеш-таблица {значение: [записи]} по rows.
+
+    Возвращает (таблица, None) или, если записей больше limit, (таблица из
+    первых limit записей, итератор по остальным).
+    """
+    table = {}
+    count = 0
+    rows = iter(rows)
+    for row in rows:
+        value = row[key]
+        if value is None:
+            continue
+        bucket = table.get(value)
+        if bucket is None:
+            table[value] = [row]
+        else:
+            bucket.append(row)
+        count += 1
+        if count == limit:
+            return table, rows
+    return table, None
+
+
+def _probe(table, probe_rows, probe_key, combine):
+    for probe_row in probe_rows:
+        bucket = table.get(probe_row[probe_key])
+        if bucket is not None:
+            for build_row in bucket:
+                yield combine(build_row, probe_row)
+
+
+class _SpillFiles:
+    """Разделы записей во временных файлах: запись попадает в раздел
+    hash(значение) % count и дописывается порциями по JOIN_SPILL_CHUNK."""
+
+    def __init__(self, workdir, prefix, count):
+        self._paths = [os.path.join(workdir, f"{prefix}{i}") for i in range(count)]
+        self._files = [open(path, "wb") for path in self._paths]
+        self._buffers = [[] for _ in range(count)]
+
+    def add(self, value, row):
+        i = hash(value) % len(self._buffers)
+        buffer = self._buffers[i]
+        buffer.append(row)
+        if len(buffer) >= JOIN_SPILL_CHUNK:
+            self._dump(i)
+
+    def _dump(self, i):
+        pickle.dump(self._buffers[i], self._files[i], pickle.HIGHEST_PROTOCOL)
+        increment("join_spilled_rows", len(self._buffers[i]))
+        self._buffers[i] = []
+
+    def close(self):
+        for i, f in enumerate(self._files):
+            if self._buffers[i]:
+                self._dump(i)
+            f.close()
+
+    def read(self, i):
+        with open(self._paths[i], "rb") as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    return
+                yield from chunk
+
+
+def _spill(parts, rows, key):
+    try:
+        for row in rows:
+            value = row[key]
+            if value is not None:
+                parts.add(value, row)
+    finally:
+        parts.close()
+
+
+def _grace_join(table, rest, build_key, probe_rows, probe_key, combine, count):
+    """Соединение по разделам: table — уже построенная часть хеш-таблицы,
+    rest — остальные записи стороны построения."""
+    with tempfile.TemporaryDirectory(prefix="join-") as workdir:
+        build_parts = _SpillFiles(workdir, "build", count)
+        built = (row for bucket in table.values() for row in bucket)
+        _spill(build_parts, _chain_clear(built, table, rest), build_key)
+        probe_parts = _SpillFiles(workdir, "probe", count)
+        _spill(probe_parts, probe_rows, probe_key)
+        for i in range(count):
+            part, _ = _build_table(build_parts.read(i), build_key)
+            yield from _probe(part, probe_parts.read(i), probe_key, combine)
+
+
+def _chain_clear(built, table, rest):
+    # хеш-таблица первой части освобождается, как только записана в разделы
+    yield from built
+    table.clear()
+    yield from rest
@@ -0,0 +1,63 @@
+"""Блокировки файлов для работы нескольких процессов с одними данными.
+
+У каждой таблицы и у файла метаданных есть свой файл блокировки
+(data/<table>.lock, db_meta.json.lock). Читатели берут разделяемую
+блокировку (их может быть сколько угодно одновременно), писатель —
+исключительную, и только на свою таблицу.
+
+Блокировки реентерабельны в пределах потока: вложенный file_lock на тот же
+файл не открывает его заново (иначе flock заблокировал бы сам себя), а
+разделяемая блокировка при необходимости повышается до исключительной.
+Разные потоки открывают файл блокировки отдельно и поэтому исключают друг
+друга так же, как разные процессы.
+
+Без fcntl (например, в Windows) блокировки ничего не делают.
+"""
+
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# (путь, поток) -> [открытый файл, исключительная ли, глубина вложенности]
+_held = {}
+
+
+@contextmanager
+def file_lock(path, exclusive=False):
+    if fcntl is None:
+        yield
+        return
+
+    key = (str(path), threading.get_ident())
+    held = _held.get(key)
+    if held is not None:
+        f, was_exclusive, _ = held
+        upgrade = exclusive and not was_exclusive
+        if upgrade:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            held[1] = True
+        held[2] += 1
+        try:
+            yield
+        finally:
+            held[2] -= 1
+            if upgrade:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                held[1] = False
+        return
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        _held[key] = [f, exclusive, 1]
+        yield
+    finally:
+        _held.pop(key, None)
+        # закрытие файла снимает блокировку
+        f.close()
@@ -1,10 +1,115 @@
 #!/usr/bin/env python3
 
-from src.primitive_db.engine import run
+import argparse
+import sys
+
+from src.primitive_db.decorators import set_timing_output
+from src.primitive_db.engine import read_script, run
+from src.primitive_db.metrics import profile_call
+from src.primitive_db.parallel import set_parallel
+from src.primitive_db.table_manager import DURABILITY_LEVELS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="database", description="Примитивная база данных."
+    )
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        choices=["serve"],
+        help="serve — запустить сервер (см. --port, --unix)",
+    )
+    parser.add_argument(
+        "-c",
+        dest="commands",
+        metavar="COMMAND",
+        action="append",
+        help="выполнить команду без приветствия и справки и выйти (можно "
+        "указать несколько раз)",
+    )
+    parser.add_argument(
+        "--script",
+        metavar="FILE",
+        help="выполнить команды из файла без подтверждений ('-' — из stdin)",
+    )
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        help="выводить время выполнения операций",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="выполнить под cProfile и вывести самые затратные функции в stderr",
+    )
+    parser.add_argument(
+        "--parallel",
+        metavar="N",
+        type=int,
+        nargs="?",
+        const=0,
+        help="просматривать большие таблицы в N процессах (по умолчанию — по "
+        "числу ядер)",
+    )
+    parser.add_argument(
+        "--parallel-min-rows",
+        metavar="M",
+        type=int,
+        help="просматривать параллельно таблицы от M записей (по умолчанию — "
+        "PARALLEL_MIN_ROWS)",
+    )
+    parser.add_argument(
+        "--durability",
+        choices=DURABILITY_LEVELS,
+        default="none",
+        help="режим записи на диск: none — без fsync, batch — фоновая запись "
+        "пачками с fsync, strict — команда ждёт fsync",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="адрес сервера")
+    parser.add_argument("--port", type=int, help="TCP-порт сервера")
+    parser.add_argument("--unix", metavar="PATH", help="Unix-сокет сервера")
+    args = parser.parse_args(argv)
+    if args.mode == "serve" and args.port is None and args.unix is None:
+        parser.error("для serve нужен --port или --unix")
+    if args.commands and (args.mode == "serve" or args.script is not None):
+        parser.error("-c нельзя сочетать с serve и --script")
+    if args.parallel and args.parallel < 2:
+        parser.error("для --parallel нужно не меньше 2 процессов")
+    if args.parallel_min_rows is not None and args.parallel_min_rows < 1:
+        parser.error("--parallel-min-rows должен быть не меньше 1")
+    return args
+
+
+def start(args):
+    if args.mode == "serve":
+        # asyncio нужен только серверу: не замедляем запуск остальных режимов
+        from src.primitive_db.server import serve
+
+        serve(args.port, args.host, args.unix, args.durability)
+    elif args.commands:
+        run(args.commands, args.durability)
+    elif args.script is None:
+        run(durability=args.durability)
+    elif args.script == "-":
+        run(read_script(sys.stdin), args.durability)
+    else:
+        with open(args.script) as f:
+            run(read_script(f), args.durability)
 
 
 def main():
-    run()
+    args = parse_args()
+    set_timing_output(args.timing)
+    if args.parallel is not None:
+        set_parallel(args.parallel or None, args.parallel_min_rows)
+    elif args.parallel_min_rows is not None:
+        set_parallel(0, args.parallel_min_rows)
+    if not args.profile:
+        start(args)
+        return
+    _, report = profile_call(start, args)
+    print(report, file=sys.stderr)
 
 
 if __name__ == "__main__":
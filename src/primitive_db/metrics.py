@@ -0,0 +1,121 @@
+"""Метрики работы базы: задержки операций, счётчики и профилирование.
+
+Задержки собирает декоратор decorators.log_time: для каждой операции
+хранится число вызовов, суммарное время и последние METRICS_SAMPLES
+замеров, по которым считаются перцентили p50/p95/p99. Счётчики (просмотренные
+и подходящие записи, использование индексов, прочитанные и записанные байты)
+увеличиваются через increment. Внешние источники статистики (например, кэш
+select) подключаются через register_source.
+
+Всё хранится в памяти процесса; snapshot() возвращает словарь, пригодный
+для вывода командой stats или выгрузки в JSON.
+"""
+
+import json
+import threading
+from collections import deque
+
+# сколько последних замеров каждой операции хранится для перцентилей
+METRICS_SAMPLES = 10_000
+# сколько самых «горячих» функций выводит профилировщик
+PROFILE_TOP = 20
+
+_latencies = {}
+_counters = {}
+_sources = {}
+# метрики обновляются и из потоков сервера (см. server.py)
+_lock = threading.Lock()
+
+
+def record_latency(operation, seconds):
+    with _lock:
+        entry = _latencies.get(operation)
+        if entry is None:
+            entry = _latencies[operation] = {
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "samples": deque(maxlen=METRICS_SAMPLES),
+            }
+        entry["count"] += 1
+        entry["total"] += seconds
+        if seconds > entry["max"]:
+            entry["max"] = seconds
+        entry["samples"].append(seconds)
+
+
+def increment(counter, amount=1):
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + amount
+
+
+def register_source(name, stats_func):
+    """Подключает функцию, возвращающую словарь статистики, к snapshot()."""
+    _sources[name] = stats_func
+
+
+def _percentile(ordered, fraction):
+    pos = round(fraction * (len(ordered) - 1))
+    return ordered[pos]
+
+
+def latency_summary(operation):
+    with _lock:
+        entry = _latencies[operation]
+        ordered = sorted(entry["samples"])
+    return {
+        "count": entry["count"],
+        "total": entry["total"],
+        "mean": entry["total"] / entry["count"],
+        "p50": _percentile(ordered, 0.50),
+        "p95": _percentile(ordered, 0.95),
+        "p99": _percentile(ordered, 0.99),
+        "max": entry["max"],
+    }
+
+
+def snapshot():
+    with _lock:
+        operations = sorted(_latencies)
+        counters = dict(sorted(_counters.items()))
+    return {
+        "latency": {op: latency_summary(op) for op in operations},
+        "counters": counters,
+        **{name: stats_func() for name, stats_func in _sources.items()},
+    }
+
+
+def export_json(path=None):
+    """Метрики в JSON: строкой или, если указан path, в файл."""
+    text = json.dumps(snapshot(), ensure_ascii=False, indent=2)
+    if path is None:
+        return text
+    with open(path, "w") as f:
+        f.write(text)
+        f.write("\n")
+    return text
+
+
+def reset():
+    with _lock:
+        _latencies.clear()
+        _counters.clear()
+
+
+def profile_call(func, *args, limit=PROFILE_TOP, **kwargs):
+    """Выполняет func под cProfile и возвращает (результат, отчёт).
+
+    Отчёт — текст с limit функциями, дольше всего выполнявшимися вместе
+    с вызванными из них.
+    """
+    # профилировщик нужен только с флагом --profile: не замедляем запуск
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return result, out.getvalue()
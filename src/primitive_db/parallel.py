@@ -0,0 +1,173 @@
+"""Параллельный просмотр больших таблиц в пуле процессов.
+
+Полный просмотр таблицы (условие, для которого нет ни индекса, ни
+колоночного просмотра, например с OR, NOT или !=) идёт циклом на Python и
+занимает одно ядро. В параллельном режиме (set_parallel, команда
+parallel on, флаг --parallel) таблица от PARALLEL_MIN_ROWS записей (порог
+задаётся вторым аргументом parallel on или флагом --parallel-min-rows)
+делится на порции по числу процессов, порции проверяются в ProcessPoolExecutor, и
+найденные позиции склеиваются по порядку порций — в том же порядке, что и
+при обычном просмотре.
+
+Процессам передаются не записи-словари, а только столбцы из условия (см.
+columns.py): массивы int и bool один раз копируются в разделяемую память
+(multiprocessing.shared_memory), и каждый процесс читает свою порцию прямо
+из неё; столбцы строк передаются порциями списков.
+
+multiprocessing и concurrent.futures импортируются только при первом
+параллельном просмотре: в обычном режиме они лишь замедляли бы запуск.
+"""
+
+import os
+import threading
+from contextlib import ExitStack
+from functools import lru_cache
+
+from src.primitive_db.columns import get_column
+from src.primitive_db.expressions import compile_column_scan, tree_columns
+
+# Таблицы меньше этого размера просматриваются в текущем процессе:
+# передача порций обходится дороже самой проверки.
+PARALLEL_MIN_ROWS = 1_000_000
+
+_workers = 0  # 0 — параллельный режим выключен
+_min_rows = PARALLEL_MIN_ROWS
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def set_parallel(workers, min_rows=None):
+    """Включает параллельный просмотр на workers процессах (None — по числу
+    ядер) или выключает его (0). Одного процесса для параллельного просмотра
+    мало: на одноядерной машине режим остаётся выключенным. min_rows — с
+    какого числа записей таблица просматривается параллельно (None — оставить
+    прежний порог)."""
+    global _workers, _min_rows
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 2:
+        workers = 0
+    if workers != _workers:
+        _drop_pool()
+    _workers = workers
+    if min_rows is not None:
+        _min_rows = min_rows
+
+
+def parallel_workers():
+    return _workers
+
+
+def parallel_min_rows():
+    return _min_rows
+
+
+def _drop_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _get_pool():
+    global _pool
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _pool_lock:
+        if _pool is None:
+            # spawn, а не fork: процесс может быть многопоточным (режим сервера)
+            _pool = ProcessPoolExecutor(
+                _workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _share(column, stack):
+    """Готовит столбец к передаче; возвращает part(start, stop) — описание
+    порции для рабочего процесса."""
+    if not isinstance(column, list):
+        from multiprocessing import shared_memory
+
+        # array.array: копируем в разделяемую память один раз на просмотр
+        nbytes = len(column) * column.itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        stack.callback(shm.unlink)
+        stack.callback(shm.close)
+        # представление массива сразу отпускаем, иначе в него нельзя добавлять
+        with memoryview(column) as view, view.cast("B") as data:
+            shm.buf[:nbytes] = data
+        return lambda start, stop: (
+            "shared", shm.name, column.typecode, column.itemsize, start, stop
+        )
+    return lambda start, stop: ("list", column[start:stop])
+
+
+def _open_part(part, stack):
+    if part[0] == "list":
+        return part[1]
+    from multiprocessing import shared_memory
+
+    _, name, typecode, itemsize, start, stop = part
+    shm = shared_memory.SharedMemory(name)
+    stack.callback(shm.close)
+    # представления памяти нужно отпустить до shm.close (стек — в обратном порядке)
+    raw = shm.buf[start * itemsize : stop * itemsize]
+    stack.callback(raw.release)
+    values = raw.cast(typecode)
+    stack.callback(values.release)
+    return values
+
+
+@lru_cache(maxsize=64)
+def _column_scan(tree):
+    return compile_column_scan(tree)
+
+
+def _scan_chunk(tree, parts, offset):
+    """Выполняется в рабочем процессе: позиции подходящих записей порции."""
+    scan = _column_scan(tree)
+    with ExitStack() as stack:
+        columns = [_open_part(part, stack) for part in parts]
+        return [offset + pos for pos in scan(columns)]
+
+
+def parallel_positions(table_data, predicate):
+    """Позиции записей, подходящих под predicate, по порядку.
+
+    Возвращает None, если параллельный режим выключен, таблица меньше
+    порога (см. set_parallel) или для столбцов условия нет колоночного представления.
+    """
+    size = len(table_data)
+    if _workers < 2 or size < _min_rows:
+        return None
+    tree = predicate.tree
+    columns = [get_column(table_data, name) for name in tree_columns(tree)]
+    if any(column is None for column in columns):
+        return None
+
+    from concurrent.futures.process import BrokenProcessPool
+
+    chunk = -(-size // _workers)
+    with ExitStack() as stack:
+        shared = [_share(column, stack) for column in columns]
+        pool = _get_pool()
+        try:
+            futures = [
+                pool.submit(
+                    _scan_chunk,
+                    tree,
+                    [part(start, min(start + chunk, size)) for part in shared],
+                    start,
+                )
+                for start in range(0, size, chunk)
+            ]
+            positions = []
+            for future in futures:
+                positions.extend(future.result())
+        except BrokenProcessPool:
+            # рабочий процесс упал — пул пересоздастся при следующем просмотре
+            _drop_pool()
+            return None
+    return positions
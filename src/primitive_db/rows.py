@@ -0,0 +1,69 @@
+"""Компактное представление записей: кортеж значений по порядку столбцов.
+
+Запись таблицы — кортеж значений в порядке столбцов metadata[table]
+(ID всегда первый), без повторения имён столбцов в каждой записи. Имена
+столбцов хранятся один раз у таблицы: table_data.names — их порядок,
+table_data.layout — {столбец: позиция в кортеже}.
+
+На диске JSON-снимок хранится так же: {"columns": [...], "sequence": N,
+"rows": [[...], ...]}. Файлы старых форматов (список словарей или
+{"sequence": N, "rows": [{...}, ...]}) читаются как раньше и переводятся
+в кортежи при загрузке; команда migrate переписывает их в новом формате.
+"""
+
+# позиция ID в записи: create_table всегда ставит его первым
+ID_POS = 0
+
+# значения int в двоичном формате таблиц — 64-битные (см. binary_table.py),
+# поэтому больших по модулю чисел таблица не принимает
+INT_MIN = -(2**63)
+INT_MAX = 2**63 - 1
+
+
+def int_in_range(value):
+    return INT_MIN <= value <= INT_MAX
+
+
+def row_layout(names):
+    return {name: pos for pos, name in enumerate(names)}
+
+
+def names_from_dict(row):
+    """Порядок столбцов записи-словаря старого формата (ID — первым)."""
+    names = list(row)
+    if "ID" in names:
+        names.remove("ID")
+    return ["ID"] + names
+
+
+def dict_to_row(row, names):
+    return tuple(row.get(name) for name in names)
+
+
+def row_to_dict(row, names):
+    return dict(zip(names, row))
+
+
+def replace_values(row, layout, values):
+    """Новый кортеж записи с заменёнными значениями {столбец: значение}."""
+    row = list(row)
+    for name, value in values.items():
+        row[layout[name]] = value
+    return tuple(row)
+
+
+def set_names(table_data, names):
+    """Задаёт порядок столбцов таблицы; записи, сохранённые с другим
+    порядком, переставляются."""
+    names = list(names)
+    old_names = getattr(table_data, "names", None)
+    if old_names and old_names != names and len(table_data):
+        old_layout = row_layout(old_names)
+        plan = [old_layout.get(name) for name in names]
+        table_data[:] = [
+            tuple(None if pos is None else row[pos] for pos in plan)
+            for row in table_data
+        ]
+    table_data.names = names
+    table_data.layout = row_layout(names)
+    return table_data
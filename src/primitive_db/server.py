@@ -0,0 +1,263 @@
+"""Режим сервера: одна база в памяти для многих клиентов (database serve).
+
+Сервер на asyncio принимает соединения по TCP или через Unix-сокет и
+выполняет тот же язык команд, что и интерактивный режим (engine.execute).
+Таблицы загружаются один раз и живут в памяти процесса сервера.
+
+Протокол построчный: клиент отправляет по команде на строку и может не
+дожидаться ответов (конвейер) — команды одного соединения выполняются по
+порядку, ответы приходят в том же порядке. Ответ — строка с длиной текста
+в байтах (UTF-8), затем сам текст, который команда вывела бы на экран.
+Команда exit закрывает соединение.
+
+Команды выполняются в пуле потоков. Чтение (select, info и т.п.) разных
+клиентов идёт параллельно, изменения одной таблицы выполняются по одному,
+изменения разных таблиц не мешают друг другу; select с join держит
+блокировки чтения обеих таблиц. Команды, меняющие схему или
+файлы целиком (create_table, drop_table, create_index, vacuum, convert...),
+выполняются в одиночку. Изменения сбрасываются на диск раз в
+FLUSH_INTERVAL секунд и при остановке сервера; транзакции (begin/rollback)
+в режиме сервера недоступны.
+
+С --durability batch|strict изменения пишет фоновый поток пачками
+(см. writer.py). В режиме strict ответ на изменяющую команду отправляется
+после fsync, но блокировка таблицы отпускается раньше: изменения
+нескольких клиентов ложатся на диск одной пачкой с одним fsync.
+"""
+
+import asyncio
+import io
+import shlex
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, suppress
+
+from src.primitive_db.decorators import set_confirmations
+from src.primitive_db.engine import META_FILE, execute, write_tables
+from src.primitive_db.table_manager import FLUSH_INTERVAL, TableManager
+
+SERVER_WORKERS = 8
+
+# команды, которые только читают таблицу (join — две), и те, что меняют её записи;
+# остальные (схема, vacuum, convert, commit...) выполняются в одиночку
+READ_COMMANDS = {"select", "info"}
+WRITE_COMMANDS = {"insert", "update", "delete", "import"}
+# команды, которые не трогают таблицы вовсе
+GLOBAL_READ_COMMANDS = {"list_tables", "help", "stats", "cache_stats", "timing"}
+
+
+class ReadWriteLock:
+    """Блокировка «много читателей или один писатель».
+
+    Ждущий писатель не пропускает новых читателей вперёд себя.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class _ThreadOutput(io.TextIOBase):
+    """Подменяет sys.stdout: в потоке, выполняющем команду, вывод собирается
+    в буфер ответа, в остальных идёт на настоящий stdout."""
+
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer or self._default).write(text)
+
+    def flush(self):
+        self._default.flush()
+
+    @contextmanager
+    def capture(self):
+        self._local.buffer = io.StringIO()
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = None
+
+
+def command_tables(args):
+    """Таблицы, с которыми работает команда (пустой список, если их нет)."""
+    command = args[0]
+    if command == "select" and "from" in args[:-1]:
+        i = args.index("from") + 1
+        tables = [args[i]]
+        if len(args) > i + 2 and args[i + 1].lower() == "join":
+            tables.append(args[i + 2])
+        return tables
+    if command in ("insert", "delete") and len(args) > 2:
+        return [args[2]]
+    if command in ("info", "update", "import") and len(args) > 1:
+        return [args[1]]
+    return []
+
+
+class DatabaseServer:
+
+    def __init__(
+        self, meta_file=META_FILE, workers=SERVER_WORKERS, durability="none"
+    ):
+        # в режиме none на диск пишет только периодический сброс
+        # (см. flush_periodically)
+        self.tables = TableManager(
+            meta_file, flush_interval=float("inf"), flush_dirty_rows=float("inf")
+        )
+        self.metadata = self.tables.load_metadata()
+        self.tables.set_durability(durability)
+        self._schema_lock = ReadWriteLock()
+        self._table_locks = {}
+        self._table_locks_guard = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._output = None
+
+    def _table_lock(self, table_name):
+        with self._table_locks_guard:
+            lock = self._table_locks.get(table_name)
+            if lock is None:
+                lock = self._table_locks[table_name] = ReadWriteLock()
+            return lock
+
+    @contextmanager
+    def _command_locks(self, user_input):
+        try:
+            args = shlex.split(user_input)
+        except ValueError:
+            # execute сам сообщит об ошибке разбора
+            args = []
+        command = args[0] if args else None
+        table_names = command_tables(args) if args else []
+
+        if command in READ_COMMANDS | WRITE_COMMANDS and table_names:
+            with self._schema_lock.read(), ExitStack() as stack:
+                # join читает две таблицы: блокировки берутся по порядку имён,
+                # чтобы встречные команды не ждали друг друга по кругу
+                for table_name in sorted(set(table_names)):
+                    table_lock = self._table_lock(table_name)
+                    if command in READ_COMMANDS:
+                        stack.enter_context(table_lock.read())
+                    else:
+                        stack.enter_context(table_lock.write())
+                yield
+        elif command is None or command in GLOBAL_READ_COMMANDS:
+            with self._schema_lock.read():
+                yield
+        else:
+            with self._schema_lock.write():
+                yield
+
+    def run_command(self, user_input):
+        """Выполняет команду в текущем потоке; возвращает (вывод, продолжать ли)."""
+        if user_input.split()[:1] in (["begin"], ["rollback"]):
+            return "Ошибка: транзакции в режиме сервера недоступны.\n", True
+        with self._output.capture() as buffer:
+            with self.tables.deferred_waits(), self._command_locks(user_input):
+                keep_going = execute(self.tables, self.metadata, user_input)
+        return buffer.getvalue(), keep_going
+
+    def flush(self):
+        with self._schema_lock.write():
+            self.tables.refresh_metadata(self.metadata)
+            write_tables(self.tables.flush)
+
+    async def flush_periodically(self, interval=FLUSH_INTERVAL):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(self._executor, self.flush)
+
+    async def handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                user_input = line.decode("utf-8", errors="replace").strip()
+                if not user_input:
+                    continue
+                text, keep_going = await loop.run_in_executor(
+                    self._executor, self.run_command, user_input
+                )
+                payload = text.encode("utf-8")
+                writer.write(f"{len(payload)}\n".encode() + payload)
+                await writer.drain()
+                if not keep_going:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=None, unix_path=None):
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+
+        self._output = _ThreadOutput(sys.stdout)
+        sys.stdout, real_stdout = self._output, sys.stdout
+        set_confirmations(False)
+        # по SIGTERM сервер останавливается так же, как по Ctrl+C:
+        # с последним сбросом изменений на диск
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(signal.SIGTERM, stop.set)
+        flusher = asyncio.create_task(self.flush_periodically())
+        try:
+            print(f"Сервер слушает {unix_path or f'{host}:{port}'}.")
+            async with server:
+                await stop.wait()
+        finally:
+            flusher.cancel()
+            sys.stdout = real_stdout
+            self.flush()
+            write_tables(self.tables.close)
+            self._executor.shutdown()
+
+
+def serve(port=None, host="127.0.0.1", unix_path=None, durability="none"):
+    try:
+        asyncio.run(
+            DatabaseServer(durability=durability).serve(host, port, unix_path)
+        )
+    except KeyboardInterrupt:
+        print("Сервер остановлен.")
@@ -0,0 +1,597 @@
+"""Пул таблиц, загруженных в память.
+
+Таблица читается с диска один раз и дальше живёт в памяти между командами
+(вместе с построенными индексами и колонками). Изменения не пишутся на диск
+сразу: записи журнала копятся у «грязной» таблицы и сбрасываются в
+data/<table>.log при выходе, по команде commit/flush, по истечении
+интервала или когда накопилось достаточно изменённых записей.
+
+Удалённые записи остаются в памяти с пометкой (см. tombstones.py); если их
+доля становится слишком большой, при сбросе таблица сжимается и вместо
+журнала пишется новый снимок.
+
+Если суммарный объём таблиц в памяти превышает лимит, чистые таблицы
+выгружаются в порядке давности использования (LRU) — кроме последней
+таблицы каждого потока, которую его команда может сейчас менять.
+
+С одними файлами могут работать несколько процессов (см. locks.py).
+Таблица в пуле, у которой нет несохранённых изменений, перечитывается,
+если её файлы изменил кто-то другой. Если же другой процесс изменил
+таблицу, пока у нас копились свои изменения, при сбросе они дописываются
+поверх его версии: под исключительной блокировкой таблица перечитывается,
+вставленные нами записи с уже занятыми ID получают новые ID (об этом
+сообщает WriteConflictError, см. ниже), update и delete применяются по ID
+к свежей копии, а копия в пуле перечитывается при следующем обращении.
+Метаданные при записи объединяются с версией на диске: из нашей копии
+берутся только таблицы, которые изменили мы.
+
+Между begin() и commit() изменения (включая метаданные и удаление таблиц)
+на диск не пишутся вовсе; rollback() отбрасывает их и заставляет перечитать
+таблицы с диска.
+
+Режим записи (durability, см. set_durability):
+- none — как описано выше: изменения копятся и сбрасываются без fsync;
+- batch — изменения каждой команды сразу передаются фоновому писателю
+  (см. writer.py), который пишет их пачками с fsync; команда не ждёт записи;
+- strict — то же, но команда возвращается только после fsync своей пачки.
+В режимах batch и strict писатель только дописывает журналы; сворачивание
+журнала в снимок и сжатие таблицы выполняются при следующем tick()/flush()
+в потоке команд. Метаданные (create_table, create_index...) пишутся сразу,
+с fsync. sync() в любом режиме записывает всё накопленное и делает fsync
+файлов таблиц.
+
+Ошибки записи (в том числе в потоке писателя и WriteConflictError) не
+печатаются, а запоминаются и поднимаются как StorageError следующим
+flush(), commit(), sync() или close(); take_error() забирает ошибку без
+исключения.
+"""
+
+import copy
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from src.primitive_db.columns import attach_columns
+from src.primitive_db.core import invalidate_table_cache, vacuum
+from src.primitive_db.errors import StorageError, WriteConflictError
+from src.primitive_db.indexes import attach_indexes
+from src.primitive_db.tombstones import needs_vacuum
+from src.primitive_db.utils import (
+    TableData,
+    append_table_log,
+    delete_table_data,
+    file_stamp,
+    has_pending_log,
+    is_binary_table,
+    load_metadata,
+    load_table_data,
+    metadata_lock,
+    open_mapped_table,
+    rebase_log_records,
+    save_metadata,
+    save_table_data,
+    set_fsync,
+    sync_file,
+    sync_table_files,
+    table_lock,
+    table_stamp,
+)
+from src.primitive_db.writer import BATCH_WINDOW, BackgroundWriter
+
+DURABILITY_LEVELS = ("none", "batch", "strict")
+FLUSH_INTERVAL = 5.0
+FLUSH_DIRTY_ROWS = 1000
+MAX_POOL_BYTES = 512 * 1024 * 1024
+
+
+def merge_metadata(base, ours, theirs):
+    """Объединяет метаданные: ours — наша копия, base — какой она была
+    прочитана, theirs — текущая версия на диске. Таблицы, которые мы не
+    трогали, берутся с диска."""
+    merged = dict(theirs)
+    for table_name in set(base) | set(ours):
+        if ours.get(table_name) == base.get(table_name):
+            continue
+        if table_name in ours:
+            merged[table_name] = ours[table_name]
+        else:
+            merged.pop(table_name, None)
+    return merged
+
+
+def estimate_table_bytes(table_data):
+    if not table_data:
+        return sys.getsizeof(table_data)
+    row = table_data[0]
+    row_bytes = sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+    return sys.getsizeof(table_data) + len(table_data) * row_bytes
+
+
+def _column_types(columns):
+    """Столбцы таблицы из метаданных без описания индексов."""
+    if columns is None:
+        return None
+    return [(col["name"], col["type"]) for col in columns]
+
+
+class TableManager:
+
+    def __init__(
+        self,
+        meta_file,
+        flush_interval=FLUSH_INTERVAL,
+        flush_dirty_rows=FLUSH_DIRTY_ROWS,
+        max_bytes=MAX_POOL_BYTES,
+    ):
+        self.meta_file = meta_file
+        self.flush_interval = flush_interval
+        self.flush_dirty_rows = flush_dirty_rows
+        self.max_bytes = max_bytes
+        self.in_transaction = False
+        self._tables = OrderedDict()
+        self._sizes = {}
+        self._pending = {}
+        self._dropped = set()
+        self._metadata = None
+        self._dirty_rows = 0
+        self._last_flush = time.monotonic()
+        self._meta_base = {}
+        self._meta_stamp = None
+        # пул используется и из потоков сервера (см. server.py)
+        self._lock = threading.RLock()
+        self.durability = "none"
+        self._writer = None
+        # таблицы, журнал которых писатель предлагает свернуть в снимок
+        self._compact_due = set()
+        self._local = threading.local()
+        # таблица, к которой последней обращался каждый поток: между get()
+        # и record() команда меняет её в памяти, выгружать её нельзя
+        self._in_use = weakref.WeakKeyDictionary()
+        # первая ошибка записи, о которой ещё не сообщили (см. take_error);
+        # её может оставить и поток писателя
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def set_durability(self, level):
+        """Переключает режим записи: none, batch или strict (см. выше)."""
+        if level not in DURABILITY_LEVELS:
+            raise ValueError(f"Некорректное значение: {level}.")
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if level != "none":
+            # в strict команды ждут записи — лишнее ожидание пачки ни к чему
+            window = 0 if level == "strict" else BATCH_WINDOW
+            self._writer = BackgroundWriter(self._write_batch, window)
+        set_fsync(level != "none")
+        self.durability = level
+
+    def close(self):
+        """Записывает все изменения и останавливает фонового писателя."""
+        try:
+            self.commit()
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            set_fsync(False)
+        self._raise_error()
+
+    def _writing(self):
+        return self._writer is not None and self._writer.busy()
+
+    def _wait_writer(self, ticket=None):
+        self._report(self._writer.wait(ticket))
+
+    def _report(self, error):
+        """Запоминает ошибку записи; её поднимут flush, commit или close."""
+        if error is None:
+            return
+        if not isinstance(error, StorageError):
+            storage_error = StorageError(
+                f"Не удалось записать изменения на диск: {error}"
+            )
+            storage_error.__cause__ = error
+            error = storage_error
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+
+    def take_error(self):
+        """Ошибка записи, случившаяся с прошлого вызова (один раз), или None."""
+        with self._error_lock:
+            error, self._error = self._error, None
+        return error
+
+    def _raise_error(self):
+        error = self.take_error()
+        if error is not None:
+            raise error
+
+    @contextmanager
+    def deferred_waits(self):
+        """В режиме strict откладывает ожидание записи изменений до конца
+        блока. Сервер так отпускает блокировку таблицы до fsync, и изменения
+        следующих команд той же таблицы попадают в ту же пачку."""
+        self._local.tickets = []
+        try:
+            yield
+        finally:
+            tickets, self._local.tickets = self._local.tickets, None
+            if tickets and self._writer is not None:
+                self._wait_writer(max(tickets))
+
+    def load_metadata(self):
+        with metadata_lock(self.meta_file):
+            metadata = load_metadata(self.meta_file)
+            self._meta_stamp = file_stamp(self.meta_file)
+        self._meta_base = copy.deepcopy(metadata)
+        return metadata
+
+    def refresh_metadata(self, metadata):
+        """Перечитывает метаданные на месте, если их изменил другой процесс.
+
+        Таблицы, описание которых поменялось, выгружаются из пула. Их
+        несохранённые изменения сначала записываются на диск, если столбцы
+        таблицы остались прежними (другой процесс, например, создал индекс);
+        если таблицу удалили или пересоздали, изменения отбрасываются.
+        """
+        if self.in_transaction or self._metadata is not None:
+            return
+        if file_stamp(self.meta_file) == self._meta_stamp:
+            return
+        fresh = self.load_metadata()
+        with self._lock:
+            for table_name in list(self._tables):
+                ours, theirs = metadata.get(table_name), fresh.get(table_name)
+                if theirs == ours:
+                    continue
+                records = self._pending.pop(table_name, None)
+                if records and _column_types(theirs) == _column_types(ours):
+                    self._write_table(table_name, records)
+                self._forget(table_name)
+        metadata.clear()
+        metadata.update(fresh)
+
+    def _forget(self, table_name):
+        self._tables.pop(table_name, None)
+        self._sizes.pop(table_name, None)
+        self._pending.pop(table_name, None)
+        invalidate_table_cache(table_name)
+
+    def get(self, metadata, table_name):
+        """Таблица из пула; при первом обращении читается с диска.
+
+        Таблица без несохранённых изменений перечитывается, если её файлы
+        изменились с момента чтения (их записал другой процесс).
+        """
+        with self._lock:
+            return self._get(metadata, table_name)
+
+    def _get(self, metadata, table_name):
+        self._in_use[threading.current_thread()] = table_name
+        table_data = self._tables.get(table_name)
+        if table_data is not None:
+            if (
+                table_name in self._pending
+                or table_name in self._dropped
+                or self._writing()
+                or table_stamp(table_name) == table_data.stamp
+            ):
+                self._tables.move_to_end(table_name)
+                return table_data
+            self._forget(table_name)
+
+        if table_name not in metadata:
+            # таблицы нет в метаданных: копию без схемы в пул не кладём,
+            # иначе она осталась бы там и после create_table
+            return load_table_data(table_name)
+        names = [c["name"] for c in metadata[table_name]]
+        if table_name in self._dropped:
+            # таблицу удалили и создали заново внутри транзакции:
+            # старые файлы ещё на диске, но читать их нельзя
+            table_data = TableData(name=table_name, names=names)
+        else:
+            table_data = load_table_data(table_name, names)
+        attach_columns(metadata, table_name, table_data)
+        attach_indexes(metadata, table_name, table_data)
+        self._tables[table_name] = table_data
+        self._sizes[table_name] = estimate_table_bytes(table_data)
+        self._evict()
+        return table_data
+
+    def refresh_schema(self, metadata, table_name):
+        """Перечитывает описание индексов после create_index/drop_index."""
+        table_data = self._tables.get(table_name)
+        if table_data is not None:
+            attach_indexes(metadata, table_name, table_data)
+
+    def record(self, table_name, records, rows):
+        """Запоминает изменения таблицы (см. utils.append_table_log).
+
+        rows — сколько записей затронуто, для порога сброса на диск.
+        В режиме strict возвращается после записи изменений на диск.
+        """
+        with self._lock:
+            ticket = self._record(table_name, records, rows)
+        if ticket is None or self.durability != "strict":
+            return
+        tickets = getattr(self._local, "tickets", None)
+        if tickets is not None:
+            tickets.append(ticket)
+        else:
+            # ждём без блокировки пула: соседние команды попадут в ту же пачку
+            self._wait_writer(ticket)
+
+    def _record(self, table_name, records, rows):
+        self._pending.setdefault(table_name, []).extend(records)
+        self._dirty_rows += rows
+        self._sizes[table_name] = estimate_table_bytes(self._tables[table_name])
+
+        if self._writer is not None:
+            if not self.in_transaction:
+                return self._hand_off()
+        elif self._dirty_rows >= self.flush_dirty_rows and not self.in_transaction:
+            self._write_pending()
+        else:
+            self.tick()
+        return None
+
+    def _hand_off(self):
+        """Передаёт накопленные изменения фоновому писателю."""
+        pending, self._pending = self._pending, {}
+        self._dirty_rows = 0
+        batch = {
+            table_name: (self._tables[table_name], records)
+            for table_name, records in pending.items()
+        }
+        return self._writer.submit(batch)
+
+    def _write_batch(self, batch):
+        """Пишет пачку изменений (вызывается в потоке писателя)."""
+        for table_name, (table_data, records) in batch.items():
+            with table_lock(table_name, exclusive=True):
+                if table_stamp(table_name) != table_data.stamp:
+                    self._rebase(table_name, table_data, records)
+                    # таблица перечитается с диска при следующем обращении
+                    table_data.stamp = None
+                    continue
+                log_full = append_table_log(table_name, records)
+                table_data.stamp = table_stamp(table_name)
+            if log_full or needs_vacuum(table_data):
+                self._compact_due.add(table_name)
+
+    def save_metadata(self, metadata):
+        if self.in_transaction:
+            self._metadata = metadata
+        else:
+            self._write_metadata(metadata)
+
+    def _write_metadata(self, metadata):
+        with metadata_lock(self.meta_file, exclusive=True):
+            theirs = load_metadata(self.meta_file)
+            merged = merge_metadata(self._meta_base, metadata, theirs)
+            save_metadata(self.meta_file, merged)
+            self._meta_stamp = file_stamp(self.meta_file)
+        metadata.clear()
+        metadata.update(merged)
+        self._meta_base = copy.deepcopy(merged)
+
+    def tick(self):
+        """Сбрасывает изменения на диск, если с прошлого сброса прошёл интервал."""
+        if self._writer is not None:
+            self._report(self._writer.take_error())
+            if self._compact_due and not self.in_transaction:
+                self._write_pending()
+            return
+        if not self._pending or self.in_transaction:
+            return
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self._write_pending()
+        else:
+            self._evict()
+
+    def flush(self):
+        """Записывает накопленные изменения. Ошибки записи, случившиеся с
+        прошлого flush (в том числе в фоновом писателе), поднимаются здесь
+        как StorageError."""
+        self._write_pending()
+        self._raise_error()
+
+    def _write_pending(self):
+        if self._writer is None:
+            with self._lock:
+                self._flush()
+            return
+        with self._lock:
+            if self._metadata is not None:
+                self._write_metadata(self._metadata)
+                self._metadata = None
+            self._delete_dropped()
+            if self._pending:
+                self._hand_off()
+        # ждём без блокировки пула: писатель её не берёт, но команды
+        # других потоков сервера не должны стоять за нашим ожиданием
+        self._wait_writer()
+        with self._lock:
+            self._compact_logs()
+            self._last_flush = time.monotonic()
+            self._evict()
+
+    def _compact_logs(self):
+        """Сворачивает журналы, которые вырастили фоновые записи."""
+        while self._compact_due:
+            table_name = self._compact_due.pop()
+            table_data = self._tables.get(table_name)
+            if table_data is None or table_data.stamp is None:
+                continue
+            with table_lock(table_name, exclusive=True):
+                if table_stamp(table_name) != table_data.stamp:
+                    continue
+                if needs_vacuum(table_data):
+                    vacuum(table_data)
+                save_table_data(table_name, table_data)
+
+    def sync(self):
+        """Записывает все изменения и делает fsync файлов таблиц пула и
+        метаданных — в любом режиме записи."""
+        self.flush()
+        with self._lock:
+            for table_name in self._tables:
+                sync_table_files(table_name)
+            sync_file(self.meta_file)
+
+    def _delete_dropped(self):
+        for table_name in self._dropped:
+            delete_table_data(table_name)
+            table_data = self._tables.get(table_name)
+            if table_data is not None:
+                # таблицу создали заново: её копия соответствует пустым файлам
+                table_data.stamp = table_stamp(table_name)
+        self._dropped.clear()
+
+    def _flush(self):
+        if self._metadata is not None:
+            self._write_metadata(self._metadata)
+            self._metadata = None
+        self._delete_dropped()
+        pending, self._pending = self._pending, {}
+        for table_name, records in pending.items():
+            self._write_table(table_name, records)
+        self._dirty_rows = 0
+        self._last_flush = time.monotonic()
+        self._evict()
+
+    def _write_table(self, table_name, records):
+        table_data = self._tables[table_name]
+        with table_lock(table_name, exclusive=True):
+            if table_stamp(table_name) != table_data.stamp:
+                self._rebase(table_name, table_data, records)
+                self._forget(table_name)
+                return
+            if needs_vacuum(table_data):
+                # удалённых записей накопилось много: вместо журнала
+                # пишем сжатый снимок, он включает и эти изменения
+                vacuum(table_data)
+                save_table_data(table_name, table_data)
+            else:
+                append_table_log(table_name, records, table_data)
+
+    def _rebase(self, table_name, table_data, records):
+        """Дописывает records поверх версии таблицы, которую изменил другой
+        процесс; вызывается под исключительной блокировкой таблицы."""
+        fresh = load_table_data(table_name, table_data.names)
+        records, renumbered = rebase_log_records(records, fresh)
+        append_table_log(table_name, records)
+        if renumbered:
+            # выданные раньше ID стали неверными — вызывающий должен узнать
+            self._report(WriteConflictError(table_name, renumbered))
+
+    def begin(self):
+        # всё, что было до транзакции, фиксируем, чтобы rollback его не потерял
+        self.flush()
+        self.in_transaction = True
+
+    def commit(self):
+        try:
+            self._write_pending()
+        finally:
+            self.in_transaction = False
+        self._raise_error()
+
+    def rollback(self):
+        """Отбрасывает изменения транзакции; возвращает имена затронутых таблиц."""
+        affected = set(self._tables) | self._dropped
+        self._tables.clear()
+        self._sizes.clear()
+        self._pending.clear()
+        self._dropped.clear()
+        self._metadata = None
+        self._dirty_rows = 0
+        self.in_transaction = False
+        return affected
+
+    def compact(self, metadata, table_name):
+        # снимок включает все накопленные изменения — журнал не нужен
+        self._write_pending()
+        with table_lock(table_name, exclusive=True):
+            table_data = self.get(metadata, table_name)
+            save_table_data(table_name, table_data)
+        return table_data
+
+    def vacuum(self, metadata, table_name):
+        """Убирает удалённые записи из памяти и с диска.
+
+        Возвращает (table_data, число освобождённых записей).
+        """
+        self._write_pending()
+        with table_lock(table_name, exclusive=True):
+            table_data = self.get(metadata, table_name)
+            reclaimed = vacuum(table_data)
+            save_table_data(table_name, table_data)
+        self._sizes[table_name] = estimate_table_bytes(table_data)
+        return table_data, reclaimed
+
+    def convert(self, metadata, table_name, binary):
+        """Переписывает снимок таблицы в двоичном формате или в JSON."""
+        self._write_pending()
+        with table_lock(table_name, exclusive=True):
+            table_data = self.get(metadata, table_name)
+            save_table_data(table_name, table_data, binary)
+        return table_data
+
+    def peek(self, table_name, writable=False):
+        """Открывает двоичный файл таблицы через mmap, не загружая её в пул.
+
+        Возможно, только если таблица не загружена, у неё нет несохранённых
+        изменений и журнала — иначе файл не отражает её текущее состояние.
+        Изменять файл на месте внутри транзакции нельзя: rollback это не отменит.
+        Возвращает MappedTable или None.
+        """
+        if (
+            table_name in self._tables
+            or table_name in self._dropped
+            or (writable and self.in_transaction)
+            or not is_binary_table(table_name)
+            or has_pending_log(table_name)
+        ):
+            return None
+        return open_mapped_table(table_name, writable)
+
+    def drop(self, table_name):
+        if self._writer is not None:
+            # писатель мог ещё не дописать журнал этой таблицы
+            self._wait_writer()
+        self._tables.pop(table_name, None)
+        self._sizes.pop(table_name, None)
+        self._pending.pop(table_name, None)
+        if self.in_transaction:
+            self._dropped.add(table_name)
+        else:
+            delete_table_data(table_name)
+
+    def stats(self):
+        return {
+            "tables": len(self._tables),
+            "dirty": len(self._pending),
+            "bytes": sum(self._sizes.values()),
+        }
+
+    def _evict(self):
+        if self._writing():
+            # таблицу, которую сейчас пишут, перечитывать с диска рано
+            return
+        total = sum(self._sizes.values())
+        # таблицы, с которыми сейчас работают потоки, не выгружаем
+        in_use = set(self._in_use.values())
+        for table_name in list(self._tables):
+            if total <= self.max_bytes:
+                break
+            if table_name in self._pending or table_name in in_use:
+                continue
+            del self._tables[table_name]
+            total -= self._sizes.pop(table_name)
@@ -0,0 +1,105 @@
+"""Удаление записей пометкой (tombstone) и сжатие таблицы.
+
+delete не сдвигает записи и не перестраивает таблицу: позиции удалённых
+записей отмечаются в карте table_data.dead (по байту на запись), а
+просмотры, индексы и info такие записи пропускают. Занятое ими место
+освобождает compact_rows — по команде vacuum или автоматически, когда
+доля удалённых записей превышает VACUUM_DEAD_RATIO.
+
+Карта короче таблицы, если после последнего удаления добавлялись записи:
+всё, что за её концом, — живые записи.
+"""
+
+from itertools import chain, compress, repeat
+from operator import not_
+
+# Автоматическое сжатие: удалённых записей больше этой доли таблицы
+# и не меньше VACUUM_MIN_DEAD штук.
+VACUUM_DEAD_RATIO = 0.3
+VACUUM_MIN_DEAD = 1000
+
+
+def dead_count(table_data):
+    return getattr(table_data, "dead_count", 0)
+
+
+def live_count(table_data):
+    return len(table_data) - dead_count(table_data)
+
+
+def mark_dead(table_data, positions):
+    dead = table_data.dead
+    if len(dead) < len(table_data):
+        dead.extend(bytes(len(table_data) - len(dead)))
+    for pos in positions:
+        dead[pos] = 1
+    table_data.dead_count += len(positions)
+
+
+def is_live(table_data, pos):
+    dead = getattr(table_data, "dead", b"")
+    return pos >= len(dead) or not dead[pos]
+
+
+def live_positions(table_data, positions):
+    """Оставляет из positions только позиции живых записей."""
+    if not dead_count(table_data):
+        return positions
+    dead = table_data.dead
+    size = len(dead)
+    return [pos for pos in positions if pos >= size or not dead[pos]]
+
+
+def _live_mask(table_data):
+    return chain(map(not_, table_data.dead), repeat(True))
+
+
+def live_rows(table_data):
+    """Итератор по живым записям таблицы."""
+    if not dead_count(table_data):
+        return iter(table_data)
+    return compress(table_data, _live_mask(table_data))
+
+
+def live_items(table_data):
+    """Итератор пар (позиция, запись) по живым записям."""
+    if not dead_count(table_data):
+        return enumerate(table_data)
+    return compress(enumerate(table_data), _live_mask(table_data))
+
+
+def needs_vacuum(table_data):
+    count = dead_count(table_data)
+    return count >= VACUUM_MIN_DEAD and count > len(table_data) * VACUUM_DEAD_RATIO
+
+
+def remove_positions(table_data, positions):
+    """Удаляет записи по возрастающим позициям, сдвигая оставшиеся на месте.
+
+    Записи до первой удалённой не трогаются, остальные переносятся блоками
+    между удалёнными позициями, без копии всей таблицы.
+    """
+    write = positions[0]
+    stops = positions[1:] + [len(table_data)]
+    for pos, stop in zip(positions, stops):
+        count = stop - pos - 1
+        if count:
+            table_data[write:write + count] = table_data[pos + 1:stop]
+            write += count
+    del table_data[write:]
+
+
+def compact_rows(table_data):
+    """Физически убирает удалённые записи; возвращает их число.
+
+    Позиции записей после этого меняются — индексы и колонки таблицы
+    нужно построить заново.
+    """
+    count = dead_count(table_data)
+    if not count:
+        return 0
+    dead = table_data.dead
+    remove_positions(table_data, [pos for pos in range(len(dead)) if dead[pos]])
+    table_data.dead = bytearray()
+    table_data.dead_count = 0
+    return count
@@ -1,30 +1,444 @@
 import json
+import os
+from itertools import pairwise
 from pathlib import Path
 
+from src.primitive_db.binary_table import MappedTable, write_table
+from src.primitive_db.decorators import log_time
+from src.primitive_db.locks import file_lock
+from src.primitive_db.metrics import increment
+from src.primitive_db.rows import (
+    ID_POS,
+    dict_to_row,
+    names_from_dict,
+    replace_values,
+    set_names,
+)
+from src.primitive_db.tombstones import dead_count, live_rows, mark_dead
+
 DATA_DIR = Path("data")
 
-def load_metadata(filepath):
+# Журнал изменений таблицы: при превышении этого размера (в байтах)
+# журнал сворачивается в новый снимок data/<table>.json.
+LOG_SNAPSHOT_BYTES = 1024 * 1024
+
+# fsync после записи файлов (см. TableManager.set_durability)
+_fsync = False
+
+class TableData(list):
+    """Строки таблицы вместе со счётчиком последнего выданного ID.
+
+    Счётчик хранится в заголовке снимка и только растёт, поэтому ID
+    удалённых записей повторно не выдаются.
+    """
+
+    def __init__(self, rows=(), sequence=0, name=None, names=None):
+        super().__init__(rows)
+        self.name = name
+        self.sequence = sequence
+        # порядок столбцов в записях-кортежах (см. rows.py); None — пока
+        # неизвестен (снимка нет), его задаст attach_columns по метаданным
+        self.names = None
+        self.layout = {}
+        if names is not None:
+            set_names(self, names)
+        # индексы по столбцам, см. indexes.py; ID индексируется всегда
+        self.index_columns = {"ID": "hash"}
+        self.indexes = {}
+        # колоночное представление для просмотров, см. columns.py
+        self.schema = {}
+        self.columns = {}
+        # карта удалённых записей, см. tombstones.py
+        self.dead = bytearray()
+        self.dead_count = 0
+        # состояние файлов таблицы, с которым совпадает эта копия (table_stamp)
+        self.stamp = None
+        # ID идут по возрастанию позиций записей: на это опираются min/max(ID)
+        # без просмотра (см. aggregates.py); новые ID всегда больше прежних
+        self.ids_sorted = True
+
+def _max_id(rows):
+    max_id = 0
+    for row in rows:
+        row_id = row[ID_POS]
+        if isinstance(row_id, int) and row_id > max_id:
+            max_id = row_id
+    return max_id
+
+def _ids_ascending(rows):
+    return all(a[ID_POS] < b[ID_POS] for a, b in pairwise(rows))
+
+def _count_read(path):
+    increment("bytes_read", Path(path).stat().st_size)
+
+def _count_written(path):
+    increment("bytes_written", Path(path).stat().st_size)
+
+def file_stamp(path):
+    """Отпечаток файла (время изменения, размер, inode) или None, если его нет.
+
+    Файлы пишутся через временный файл и переименование, так что любая
+    запись меняет inode или размер и время — по отпечатку видно, что файл
+    изменил другой процесс.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def set_fsync(enabled):
+    global _fsync
+    _fsync = enabled
+
+def sync_file(path):
+    """fsync уже записанного файла (или каталога), если он есть."""
     try:
-        with open(filepath) as f:
-            return json.load(f)
+        fd = os.open(path, os.O_RDONLY)
     except FileNotFoundError:
-        return {}
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # каталоги не везде можно синхронизировать (например, в Windows)
+        pass
+    finally:
+        os.close(fd)
+    increment("fsyncs")
+
+def _write_atomic(path, write):
+    """Пишет файл через временный файл и os.replace: читатели видят либо
+    старое, либо новое содержимое целиком."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        write(f)
+        if _fsync:
+            f.flush()
+            os.fsync(f.fileno())
+            increment("fsyncs")
+    os.replace(tmp_path, path)
+    if _fsync:
+        # переименование переживает сбой, только если записан и каталог
+        sync_file(Path(path).parent)
+
+def metadata_lock(filepath, exclusive=False):
+    return file_lock(f"{filepath}.lock", exclusive)
+
+def load_metadata(filepath):
+    with metadata_lock(filepath):
+        try:
+            with open(filepath) as f:
+                _count_read(filepath)
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
 
 def save_metadata(filepath, data):
-    with open(filepath, "w") as f:
-        json.dump(data, f)
+    with metadata_lock(filepath, exclusive=True):
+        _write_atomic(filepath, lambda f: json.dump(data, f))
+        _count_written(filepath)
+
+def _snapshot_path(table_name):
+    return DATA_DIR / f"{table_name}.json"
+
+def _log_path(table_name):
+    return DATA_DIR / f"{table_name}.log"
+
+def _binary_path(table_name):
+    return DATA_DIR / f"{table_name}.tbl"
+
+def table_lock(table_name, exclusive=False):
+    return file_lock(DATA_DIR / f"{table_name}.lock", exclusive)
+
+def table_stamp(table_name):
+    """Отпечаток всех файлов таблицы: снимков и журнала."""
+    return (
+        file_stamp(_snapshot_path(table_name)),
+        file_stamp(_binary_path(table_name)),
+        file_stamp(_log_path(table_name)),
+    )
+
+def is_binary_table(table_name):
+    return _binary_path(table_name).exists()
+
+def sync_table_files(table_name):
+    for path in (
+        _snapshot_path(table_name),
+        _binary_path(table_name),
+        _log_path(table_name),
+    ):
+        sync_file(path)
+
+def has_pending_log(table_name):
+    return _log_path(table_name).exists()
+
+def open_mapped_table(table_name, writable=False):
+    """Открывает двоичный файл таблицы через mmap; блокировка таблицы
+    (исключительная, если файл меняется на месте) держится до close()."""
+    return MappedTable(
+        _binary_path(table_name), writable, table_lock(table_name, writable)
+    )
+
+def _table_columns(data):
+    """Столбцы таблицы для двоичного формата: типы из схемы, а без неё — по
+    значениям первой записи."""
+    schema = getattr(data, "schema", None) or {}
+    types = {bool: "bool", int: "int"}
+    columns = []
+    for pos, name in enumerate(data.names):
+        typ = schema.get(name)
+        if typ is None:
+            typ = types.get(type(data[0][pos]), "str") if data else "int"
+        columns.append({"name": name, "type": typ})
+    return columns
+
+def _legacy_rows(rows, names):
+    """Записи-словари старого формата -> (имена столбцов, кортежи)."""
+    if names is None and rows:
+        names = names_from_dict(rows[0])
+    return names, [dict_to_row(row, names) for row in rows]
+
+def _replay_log(table_name, data):
+    filepath = _log_path(table_name)
+    try:
+        f = filepath.open("r")
+    except FileNotFoundError:
+        return data
+
+    _count_read(filepath)
+    # удалённые по журналу записи не вырезаются из списка, а помечаются
+    # (см. tombstones.py) — их уберёт vacuum
+    positions = {row[ID_POS]: pos for pos, row in enumerate(data)}
+    deleted = []
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # недописанная последняя строка (например, после сбоя)
+                break
+            op = record["op"]
+            if op == "i" or op == "b":
+                # "b" — пакетная вставка (insert с несколькими values, import)
+                rows = [record["row"]] if op == "i" else record["rows"]
+                for row in rows:
+                    if isinstance(row, dict):
+                        # журналы старого формата хранят записи словарями
+                        if data.names is None:
+                            set_names(data, names_from_dict(row))
+                        row = dict_to_row(row, data.names)
+                    else:
+                        row = tuple(row)
+                    positions[row[ID_POS]] = len(data)
+                    data.append(row)
+                    if row[ID_POS] > data.sequence:
+                        data.sequence = row[ID_POS]
+            elif op == "u":
+                new_id = record["set"].get("ID")
+                for row_id in record["ids"]:
+                    pos = positions.get(row_id)
+                    if pos is not None:
+                        data[pos] = replace_values(
+                            data[pos], data.layout, record["set"]
+                        )
+                        if new_id is not None:
+                            # журналы, записанные до запрета update ID
+                            positions[new_id] = positions.pop(row_id)
+                            data.ids_sorted = False
+                            if new_id > data.sequence:
+                                data.sequence = new_id
+            elif op == "d":
+                for row_id in record["ids"]:
+                    pos = positions.pop(row_id, None)
+                    if pos is not None:
+                        deleted.append(pos)
+
+    if deleted:
+        mark_dead(data, deleted)
+    return data
+
+@log_time
+def load_table_data(table_name, names=None):
+    """Читает таблицу: снимок и журнал. names — порядок столбцов из
+    метаданных; он нужен, если снимка ещё нет и журнал хранит записи
+    кортежами (см. rows.py)."""
+    with table_lock(table_name):
+        data = _read_table_files(table_name, names)
+        data.stamp = table_stamp(table_name)
+    return data
+
+def _read_table_files(table_name, names):
+    if is_binary_table(table_name):
+        with MappedTable(_binary_path(table_name)) as table:
+            data = TableData(table, table.sequence, table_name, table.names)
+            data.ids_sorted = table.ids_sorted
+        _count_read(_binary_path(table_name))
+        return _replay_log(table_name, data)
 
-def load_table_data(table_name):
-    filepath = DATA_DIR / f"{table_name}.json"
     try:
-        with filepath.open("r") as f:
-            return json.load(f)
+        with _snapshot_path(table_name).open("r") as f:
+            raw = json.load(f)
+        _count_read(_snapshot_path(table_name))
     except FileNotFoundError:
-        return []
+        raw = {"columns": names, "sequence": 0, "rows": []}
+
+    if isinstance(raw, list):
+        # файл самого старого формата: список записей-словарей без заголовка
+        names, rows = _legacy_rows(raw, names)
+        data = TableData(rows, _max_id(rows), table_name, names)
+    elif "columns" not in raw:
+        # {"sequence": N, "rows": [{...}, ...]} — записи-словари
+        names, rows = _legacy_rows(raw["rows"], names)
+        data = TableData(rows, raw["sequence"], table_name, names)
+    else:
+        rows = map(tuple, raw["rows"])
+        data = TableData(rows, raw["sequence"], table_name, raw["columns"])
+    data.ids_sorted = _ids_ascending(data)
+    return _replay_log(table_name, data)
+
+@log_time
+def save_table_data(table_name, data, binary=None):
+    """Пишет снимок таблицы. binary — формат снимка: True — двоичный
+    (data/<table>.tbl, см. binary_table.py), False — JSON, None — тот же,
+    что сейчас на диске."""
+    DATA_DIR.mkdir(exist_ok=True)
 
-def save_table_data(table_name, data):
+    with table_lock(table_name, exclusive=True):
+        _write_snapshot(table_name, data, binary)
+        if isinstance(data, TableData):
+            data.stamp = table_stamp(table_name)
+
+def _write_snapshot(table_name, data, binary):
+    sequence = getattr(data, "sequence", None)
+    if sequence is None:
+        sequence = _max_id(data)
+    if binary is None:
+        binary = is_binary_table(table_name)
+    # удалённые записи в снимок не попадают
+    rows = list(live_rows(data)) if dead_count(data) else data
+
+    if binary:
+        write_table(
+            _binary_path(table_name), _table_columns(data), rows, sequence, _fsync
+        )
+        if _fsync:
+            increment("fsyncs")
+            sync_file(DATA_DIR)
+        _count_written(_binary_path(table_name))
+        _snapshot_path(table_name).unlink(missing_ok=True)
+    else:
+        filepath = _snapshot_path(table_name)
+        snapshot = {"columns": data.names, "sequence": sequence, "rows": rows}
+        _write_atomic(filepath, lambda f: json.dump(snapshot, f))
+        _count_written(filepath)
+        _binary_path(table_name).unlink(missing_ok=True)
+    # снимок содержит всё состояние — журнал больше не нужен
+    _log_path(table_name).unlink(missing_ok=True)
+
+def append_table_log(table_name, records, data=None):
+    """Дописывает изменения в журнал таблицы вместо перезаписи всего файла.
+
+    records — список записей вида {"op": "i", "row": [...]},
+    {"op": "b", "rows": [[...], ...]} (записи по порядку столбцов),
+    {"op": "u", "ids": [...], "set": {...}} или {"op": "d", "ids": [...]}.
+    data — актуальное состояние таблицы, из которого пишется снимок,
+    когда журнал становится слишком большим. Если data не передана,
+    снимок не пишется, а возвращается True — журнал пора свернуть.
+    """
     DATA_DIR.mkdir(exist_ok=True)
 
-    filepath = DATA_DIR / f"{table_name}.json"
-    with filepath.open("w") as f:
-        json.dump(data, f)
+    filepath = _log_path(table_name)
+    with table_lock(table_name, exclusive=True):
+        written = 0
+        with filepath.open("a") as f:
+            for record in records:
+                line = json.dumps(record, separators=(",", ":"))
+                written += f.write(line) + f.write("\n")
+            if _fsync:
+                f.flush()
+                os.fsync(f.fileno())
+                increment("fsyncs")
+        increment("bytes_written", written)
+
+        log_full = filepath.stat().st_size > LOG_SNAPSHOT_BYTES
+        if data is None:
+            return log_full
+        if log_full:
+            save_table_data(table_name, data)
+        elif isinstance(data, TableData):
+            data.stamp = table_stamp(table_name)
+        return False
+
+def rebase_log_records(records, data):
+    """Переносит записи журнала на свежую копию таблицы data, которую
+    успел изменить другой процесс.
+
+    Вставленные записи, чьи ID уже заняты (не больше data.sequence),
+    получают следующие свободные ID, а update и delete из тех же records
+    переадресуются на новые ID. Возвращает (записи, {старый ID: новый}).
+    """
+    renumbered = {}
+    next_id = data.sequence
+    rebased = []
+    for record in records:
+        op = record["op"]
+        if op == "i" or op == "b":
+            rows = []
+            for row in [record["row"]] if op == "i" else record["rows"]:
+                row_id = row[ID_POS]
+                next_id = max(row_id, next_id + 1)
+                if next_id != row_id:
+                    renumbered[row_id] = next_id
+                    row = replace_values(row, data.layout, {"ID": next_id})
+                rows.append(row)
+            if op == "i":
+                record = {"op": "i", "row": rows[0]}
+            else:
+                record = {"op": "b", "rows": rows}
+        elif renumbered:
+            record = {**record, "ids": [renumbered.get(i, i) for i in record["ids"]]}
+        rebased.append(record)
+    return rebased, renumbered
+
+def needs_migration(table_name):
+    """Хранятся ли записи таблицы на диске в старом формате — словарями
+    в JSON-снимке или в журнале (см. rows.py)."""
+    try:
+        with _snapshot_path(table_name).open("r") as f:
+            if f.read(len('{"columns"')) != '{"columns"':
+                return True
+    except FileNotFoundError:
+        pass
+    try:
+        with _log_path(table_name).open("r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                rows = record.get("rows") or [record.get("row")]
+                if isinstance(rows[0], dict):
+                    return True
+    except FileNotFoundError:
+        pass
+    return False
+
+def table_file_size(table_name):
+    """Суммарный размер файлов таблицы на диске (снимок и журнал) в байтах."""
+    size = 0
+    for path in (
+        _snapshot_path(table_name),
+        _binary_path(table_name),
+        _log_path(table_name),
+    ):
+        try:
+            size += path.stat().st_size
+        except FileNotFoundError:
+            pass
+    return size
+
+def delete_table_data(table_name):
+    with table_lock(table_name, exclusive=True):
+        _snapshot_path(table_name).unlink(missing_ok=True)
+        _binary_path(table_name).unlink(missing_ok=True)
+        _log_path(table_name).unlink(missing_ok=True)
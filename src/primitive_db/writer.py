@@ -0,0 +1,107 @@
+"""Фоновая запись изменений на диск пачками (group commit).
+
+В режимах durability batch и strict (см. TableManager.set_durability)
+команды не пишут файлы сами: их записи журнала передаются потоку-писателю,
+и команда сразу возвращается. Писатель забирает всё, что накопилось с
+прошлой записи, — изменения многих команд — и пишет одной пачкой: по
+одному дописыванию журнала и одному fsync на таблицу. Пока идёт запись,
+новые изменения копятся для следующей пачки, так что под нагрузкой пачки
+сами становятся крупнее, а число fsync не растёт вместе с числом команд.
+
+В режиме batch писатель перед записью ещё BATCH_WINDOW секунд ждёт, пока
+подтянутся соседние изменения; при сбое теряется не больше этого окна.
+В режиме strict окна нет, а команда ждёт, пока её пачка не окажется на
+диске.
+"""
+
+import threading
+import time
+
+BATCH_WINDOW = 0.05
+
+
+class BackgroundWriter:
+    """Поток, который пишет переданные пачки функцией write.
+
+    Пачка — {таблица: (table_data, записи журнала)}; пачки, накопившиеся
+    к началу записи, объединяются в одну.
+    """
+
+    def __init__(self, write, window=BATCH_WINDOW):
+        self._write = write
+        self._window = window
+        self._cond = threading.Condition()
+        self._queue = []
+        self._submitted = 0
+        self._written = 0
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, batch):
+        """Передаёт пачку писателю; возвращает её номер для wait()."""
+        with self._cond:
+            self._queue.append(batch)
+            self._submitted += 1
+            self._cond.notify_all()
+            return self._submitted
+
+    def wait(self, ticket=None):
+        """Ждёт, пока пачка ticket (по умолчанию — все переданные) не будет
+        записана. Возвращает ошибку записи, если она была (см. take_error)."""
+        with self._cond:
+            if ticket is None:
+                ticket = self._submitted
+            while self._written < ticket:
+                self._cond.wait()
+        return self.take_error()
+
+    def take_error(self):
+        """Последняя ошибка записи (один раз) или None."""
+        with self._cond:
+            error, self._error = self._error, None
+        return error
+
+    def busy(self):
+        with self._cond:
+            return self._written < self._submitted
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+            if self._window:
+                time.sleep(self._window)
+            with self._cond:
+                batches, self._queue = self._queue, []
+                ticket = self._submitted
+            try:
+                self._write(_merge(batches))
+            except Exception as e:
+                # записи пачки потеряны; об ошибке сообщит поток команд
+                with self._cond:
+                    self._error = e
+            with self._cond:
+                self._written = ticket
+                self._cond.notify_all()
+
+
+def _merge(batches):
+    merged = {}
+    for batch in batches:
+        for table_name, (table_data, records) in batch.items():
+            if table_name in merged:
+                merged[table_name][1].extend(records)
+            else:
+                merged[table_name] = (table_data, list(records))
+    return merged
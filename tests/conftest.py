@@ -0,0 +1,24 @@
+import pytest
+
+from src.primitive_db.engine import run
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Каждый тест работает с базой в своём временном каталоге: файлы
+    таблиц (data/) и db_meta.json ищутся относительно текущего каталога."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def cli(capsys):
+    """Выполняет команды интерактивного языка в пакетном режиме и
+    возвращает их вывод."""
+
+    def execute(*commands, durability="none"):
+        capsys.readouterr()
+        run(list(commands), durability)
+        return capsys.readouterr().out
+
+    return execute
@@ -0,0 +1,73 @@
+import struct
+
+import pytest
+
+from src.primitive_db.api import Database
+from src.primitive_db.errors import ValidationError
+from src.primitive_db.utils import open_mapped_table
+
+TOO_BIG = 2**64
+
+
+@pytest.fixture
+def binary_table(cli):
+    cli("create_table b y:int", "insert into b values (99)", "convert b binary")
+
+
+def rows(table):
+    with Database() as db:
+        return db.execute(f"select from {table}")
+
+
+def test_update_in_place(binary_table, cli):
+    out = cli("update b set y = 7 where ID = 1")
+    assert "успешно обновлена" in out
+    assert rows("b") == [(1, 7)]
+
+
+def test_update_out_of_int64_range_keeps_value(binary_table, cli):
+    out = cli(f"update b set y = {TOO_BIG} where ID = 1")
+    assert "Некорректное значение" in out
+    assert rows("b") == [(1, 99)]
+
+
+def test_insert_out_of_int64_range_is_rejected(binary_table, cli):
+    out = cli(f"insert into b values ({TOO_BIG})", "compact b")
+    assert "Некорректное значение" in out
+    assert "свёрнут в снимок" in out
+    assert rows("b") == [(1, 99)]
+
+
+def test_api_rejects_out_of_int64_range(binary_table):
+    with Database() as db:
+        with pytest.raises(ValidationError):
+            db.execute("insert into b values (?)", TOO_BIG)
+        with pytest.raises(ValidationError):
+            db.execute("update b set y = ? where ID = 1", -TOO_BIG)
+        assert db.execute("select from b") == [(1, 99)]
+
+
+def test_import_out_of_int64_range_is_rejected(binary_table, cli, workdir):
+    (workdir / "rows.jsonl").write_text(f'{{"y": {TOO_BIG}}}\n')
+    out = cli("import b rows.jsonl")
+    assert "Некорректное значение" in out
+    assert rows("b") == [(1, 99)]
+
+
+def test_set_value_never_writes_partial_field(binary_table):
+    with open_mapped_table("b", writable=True) as table:
+        with pytest.raises(struct.error):
+            table.set_value(0, "y", TOO_BIG)
+        assert table.value(0, "y") == 99
+
+
+def test_compact_and_vacuum_after_changes(binary_table, cli):
+    cli(
+        "insert into b values (1)",
+        "insert into b values (2)",
+        "delete from b where y = 1",
+        "update b set y = 5 where ID = 3",
+        "compact b",
+        "vacuum b",
+    )
+    assert rows("b") == [(1, 99), (3, 5)]
@@ -0,0 +1,70 @@
+import pytest
+
+from src.primitive_db import engine, parallel
+from src.primitive_db.api import Database
+from src.primitive_db.main import parse_args
+
+
+def rows(table):
+    with Database() as db:
+        return db.execute(f"select from {table}")
+
+
+def test_run_writes_changes_when_a_command_fails(cli, monkeypatch):
+    execute = engine.execute
+
+    def failing_execute(tables, metadata, user_input):
+        if user_input == "boom":
+            raise RuntimeError(user_input)
+        return execute(tables, metadata, user_input)
+
+    monkeypatch.setattr(engine, "execute", failing_execute)
+    with pytest.raises(RuntimeError):
+        cli("create_table a n:int", "insert into a values (5)", "boom")
+    assert rows("a") == [(1, 5)]
+
+
+def test_create_table_after_failed_insert(cli):
+    out = cli(
+        'insert into t values ("a", 1)',
+        "create_table t name:str n:int",
+        'insert into t values ("a", 1)',
+        "select from t where n = 1",
+        "create_index t n",
+        "select count(*) from t group by n",
+    )
+    assert 'Таблица "t" не существует' in out
+    assert "не найден" not in out
+    assert rows("t") == [(1, "a", 1)]
+
+
+@pytest.fixture
+def parallel_off():
+    yield
+    parallel.set_parallel(0)
+
+
+@pytest.mark.parametrize(
+    "command", ["parallel on 1", "parallel on 0", "parallel on 2 0"]
+)
+def test_parallel_on_rejects_too_few_workers(cli, parallel_off, command):
+    out = cli(command)
+    assert "Некорректное значение" in out
+    assert "включён" not in out
+    assert parallel.parallel_workers() == 0
+
+
+def test_parallel_on_and_off(cli, parallel_off, monkeypatch):
+    out = cli("parallel on 2 5")
+    assert "процессов: 2, таблицы от 5 записей" in out
+    assert cli("parallel off") == "Параллельный просмотр выключен.\n"
+
+    monkeypatch.setattr(parallel.os, "cpu_count", lambda: 1)
+    assert "недоступен" in cli("parallel on")
+    assert parallel.parallel_workers() == 0
+
+
+def test_parallel_flag_rejects_one_worker(capsys):
+    with pytest.raises(SystemExit):
+        parse_args(["--parallel", "1"])
+    assert "не меньше 2 процессов" in capsys.readouterr().err
@@ -0,0 +1,50 @@
+from src.primitive_db.api import Database
+
+
+def test_bulk_insert_updates_built_indexes(cli, workdir):
+    (workdir / "rows.csv").write_text(
+        "n,s\n" + "".join(f"{(i * 7) % 100},{i % 3}\n" for i in range(300))
+    )
+    out = cli(
+        "create_table t n:int s:str",
+        "create_index t n sorted",
+        "create_index t s",
+        'insert into t values (50, "x"), (150, "y")',
+        # индексы уже построены — import дополняет их
+        "select from t where n >= 0",
+        'select from t where s = "x"',
+        "import t rows.csv",
+        'insert into t values (-1, "x"), (500, "2")',
+    )
+    assert "Ошибка" not in out
+
+    with Database() as db:
+        table = db.execute("select from t")
+        assert len(table) == 304
+        expected = [row for row in table if 40 <= row[1] < 60]
+        assert db.execute("select from t where n >= 40 and n < 60") == expected
+        assert db.execute("select from t where s = ?", "2") == [
+            row for row in table if row[2] == "2"
+        ]
+        assert db.execute("select from t where n = ?", -1) == [(303, -1, "x")]
+
+
+def test_update_moves_positions_between_hash_buckets():
+    with Database() as db:
+        db.create_table("t", [("f", "bool"), ("n", "int")])
+        db.create_index("t", "f")
+        for n in range(10):
+            db.execute("insert into t values (?, ?)", n % 2 == 0, n)
+        assert len(db.execute("select from t where f = ?", True)) == 5
+
+        db.execute("update t set f = ? where n < ?", True, 4)
+        assert db.execute("select count(*) from t group by f") == [
+            (False, 3),
+            (True, 7),
+        ]
+        assert [row[2] for row in db.execute("select from t where f = ?", True)] == [
+            0, 1, 2, 3, 4, 6, 8,
+        ]
+        db.execute("update t set f = ? where f = ?", False, True)
+        assert db.execute("select from t where f = ?", True) == []
+        assert len(db.execute("select from t where f = ?", False)) == 10
@@ -0,0 +1,53 @@
+import pytest
+
+from src.primitive_db import metrics
+from src.primitive_db.api import Database
+
+
+@pytest.fixture
+def db():
+    with Database() as db:
+        db.create_table("t", [("n", "int"), ("s", "str")])
+        for n in range(10):
+            db.execute("insert into t values (?, ?)", n, str(n % 2))
+        metrics.reset()
+        yield db
+
+
+def counters():
+    return metrics.snapshot()["counters"]
+
+
+def test_aggregate_scan_is_counted(db):
+    assert db.execute("select count(*) from t where n != 3 or s = ?", "x") == [(9,)]
+    stats = counters()
+    assert stats["full_scans"] == 1
+    assert stats["rows_scanned"] == 10
+    assert stats["rows_matched"] == 9
+
+
+def test_index_lookup_in_aggregate_is_counted(db):
+    db.create_index("t", "s")
+    metrics.reset()
+    db.execute("select sum(n) from t where s = ?", "0")
+    stats = counters()
+    assert stats["index_lookups"] == 1
+    assert stats["rows_scanned"] == 5
+    assert stats["rows_matched"] == 5
+
+
+def test_limited_select_counts_only_scanned_rows(db):
+    assert len(db.execute("select from t where n != 0 or s = ? limit 2", "x")) == 2
+    stats = counters()
+    assert stats["full_scans"] == 1
+    assert stats["rows_scanned"] == 3
+    assert stats["rows_matched"] == 2
+
+
+def test_join_scans_are_counted(db):
+    db.create_table("u", [("s", "str")])
+    db.execute("insert into u values (?)", "1")
+    metrics.reset()
+    assert len(db.execute("select from t join u on t.s = u.s")) == 5
+    stats = counters()
+    assert stats["rows_scanned"] == 11
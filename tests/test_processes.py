@@ -0,0 +1,63 @@
+"""Несколько процессов с одними файлами: каждый объект Database — отдельный
+пул таблиц со своими метаданными, как у отдельного процесса."""
+
+import pytest
+
+from src.primitive_db.api import Database
+from src.primitive_db.errors import WriteConflictError
+
+
+def count(table):
+    with Database() as db:
+        return db.execute(f"select count(*) from {table}")[0][0]
+
+
+def test_metadata_refresh_keeps_pending_writes():
+    first = Database()
+    first.create_table("t", [("n", "int")])
+    first.sync()
+    for n in range(10):
+        first.execute("insert into t values (?)", n)
+
+    with Database() as second:
+        second.create_index("t", "n")
+
+    assert len(first.execute("select from t where n >= 0")) == 10
+    first.close()
+    assert count("t") == 10
+
+
+def test_metadata_refresh_drops_writes_to_a_dropped_table():
+    first = Database()
+    first.create_table("t", [("n", "int")])
+    first.sync()
+    first.execute("insert into t values (?)", 1)
+
+    with Database() as second:
+        second.drop_table("t")
+
+    assert first.list_tables() == []
+    first.close()
+    with Database() as db:
+        assert db.list_tables() == []
+
+
+def test_conflicting_inserts_are_kept_and_renumbering_is_raised():
+    first = Database()
+    first.create_table("t", [("n", "int")])
+    first.sync()
+    second = Database()
+    assert first.execute("insert into t values (?)", 1) == 1
+    assert second.execute("insert into t values (?)", 2) == 1
+    second.execute("update t set n = ? where ID = ?", 20, 1)
+    first.commit()
+
+    with pytest.raises(WriteConflictError) as raised:
+        second.commit()
+    assert raised.value.renumbered == {1: 2}
+    second.close()
+    first.close()
+
+    with Database() as db:
+        assert db.execute("select from t") == [(1, 1), (2, 20)]
+        assert db.execute("insert into t values (?)", 3) == 3
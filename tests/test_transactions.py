@@ -0,0 +1,113 @@
+import pytest
+
+from src.primitive_db import table_manager
+from src.primitive_db.api import Database
+from src.primitive_db.errors import StorageError, ValidationError
+
+DURABILITY = ["none", "batch", "strict"]
+
+
+def rows(table):
+    with Database() as db:
+        return db.execute(f"select from {table}")
+
+
+@pytest.fixture
+def table():
+    with Database() as db:
+        db.create_table("t", [("n", "int")])
+    return "t"
+
+
+@pytest.mark.parametrize("durability", DURABILITY)
+def test_commit_writes_changes(table, durability):
+    with Database(durability=durability) as db:
+        db.begin()
+        db.execute("insert into t values (?)", 1)
+        db.execute("update t set n = ? where ID = ?", 2, 1)
+        db.commit()
+        assert rows(table) == [(1, 2)]
+
+
+@pytest.mark.parametrize("durability", DURABILITY)
+def test_rollback_discards_changes(table, durability):
+    with Database(durability=durability) as db:
+        db.execute("insert into t values (?)", 1)
+        db.begin()
+        db.execute("insert into t values (?)", 2)
+        db.execute("delete from t where ID = ?", 1)
+        db.rollback()
+        assert db.execute("select from t") == [(1, 1)]
+    assert rows(table) == [(1, 1)]
+
+
+@pytest.mark.parametrize("durability", DURABILITY)
+def test_close_writes_deferred_changes(table, durability):
+    db = Database(durability=durability)
+    for n in range(5):
+        db.execute("insert into t values (?)", n)
+    db.close()
+    assert len(rows(table)) == 5
+
+
+def test_close_rolls_back_unfinished_transaction(table):
+    db = Database()
+    db.begin()
+    db.execute("insert into t values (?)", 1)
+    db.close()
+    assert rows(table) == []
+
+
+def test_sync_inside_transaction_is_rejected(table):
+    with Database() as db:
+        db.begin()
+        with pytest.raises(ValidationError):
+            db.sync()
+        db.rollback()
+
+
+def test_cli_transaction(table, cli):
+    out = cli(
+        "begin",
+        "insert into t values (1)",
+        "migrate",
+        "rollback",
+        "begin",
+        "insert into t values (2)",
+        "commit",
+    )
+    assert "migrate нельзя выполнить внутри транзакции" in out
+    assert "Изменения транзакции отменены." in out
+    assert rows(table) == [(1, 2)]
+
+
+@pytest.fixture
+def failing_log(monkeypatch):
+    def append_table_log(*args, **kwargs):
+        raise OSError("диск переполнен")
+
+    monkeypatch.setattr(table_manager, "append_table_log", append_table_log)
+
+
+@pytest.mark.parametrize("durability", ["batch", "strict"])
+def test_writer_error_is_raised_on_commit(table, failing_log, durability):
+    db = Database(durability=durability)
+    db.execute("insert into t values (?)", 1)
+    with pytest.raises(StorageError, match="диск переполнен"):
+        db.commit()
+    # об ошибке сообщается один раз
+    db.commit()
+    db.close()
+
+
+def test_writer_error_is_raised_on_close(table, failing_log):
+    db = Database(durability="batch")
+    db.execute("insert into t values (?)", 1)
+    with pytest.raises(StorageError):
+        db.close()
+
+
+def test_cli_reports_writer_error(table, failing_log, cli):
+    out = cli("insert into t values (1)", "commit", durability="batch")
+    assert "Ошибка: Не удалось записать изменения на диск: диск переполнен" in out
+    assert "Изменения записаны на диск." not in out